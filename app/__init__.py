@@ -3,6 +3,7 @@ from flask import Flask
 
 # Extensions & Models (import early for init)
 from app.extensions import db, login_manager
+from app import sqlite_profile
 from app.models import User
 
 # Blueprints (import after app creation to avoid circular issues)
@@ -10,9 +11,23 @@ from app.modules.auth.routes import auth_bp
 from app.modules.dashboard.routes import dashboard_bp
 from app.modules.gym.routes import gym_bp
 from app.modules.tasks.routes import tasks_bp  # ← NEW: Tasks/Reminders module
+from app.modules.telegram.routes import telegram_bp
 
 
-def create_app():
+def start_singletons(app):
+    """Scheduler, task reminders + Telegram bot listener: exactly one per deployment."""
+    from app.scheduler import start_scheduler
+    from app import reminders
+    start_scheduler(app)
+    reminders.start(app)
+
+    if os.getenv('ENABLE_BOT') == 'true':
+        from app.telegram_bot import start_bot_listener
+        start_bot_listener(app)
+
+
+def create_app(background=True):
+    """background=False for maintenance scripts: no sampler, scheduler or bot threads."""
     app = Flask(__name__)
 
     # --- SECURE CONFIG FROM .ENV ---
@@ -32,6 +47,8 @@ def create_app():
 
     # Initialize Extensions
     db.init_app(app)
+    with app.app_context():
+        sqlite_profile.install(db.engine)  # WAL, busy timeout, cache pragmas
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
 
@@ -45,16 +62,15 @@ def create_app():
     app.register_blueprint(dashboard_bp)
     app.register_blueprint(gym_bp)         # Your gym tracker module
     app.register_blueprint(tasks_bp)       # ← NEW: Separate reminders/to-do module
+    app.register_blueprint(telegram_bp)    # Bot webhook (TELEGRAM_MODE=webhook)
 
-    # Start Bot Listener (only in prod or proper debug)
-    if os.getenv('ENABLE_BOT') == 'true':
-        if not app.debug or os.getenv('WERKZEUG_RUN_MAIN') == 'true':
-            from app.telegram_bot import start_bot_listener
-            start_bot_listener(app)
-
-    # Start Scheduler
-    from app.scheduler import start_scheduler
-    if not app.debug or os.getenv('WERKZEUG_RUN_MAIN') == 'true':
-        start_scheduler(app)
+    # Background jobs (only in prod or proper debug). The metrics sampler is
+    # per process; the scheduler and bot must run once across all workers,
+    # so only the elected leader starts them.
+    from app.metrics import start_sampler
+    from app import leader
+    if background and (not app.debug or os.getenv('WERKZEUG_RUN_MAIN') == 'true'):
+        start_sampler()
+        leader.run_when_elected(app, start_singletons)
 
     return app
\ No newline at end of file
@@ -0,0 +1,65 @@
+import hashlib
+import os
+from datetime import date
+
+from flask import make_response, request, session
+
+from app import state
+
+# Conditional GET helpers. ETags are derived from the user's data version
+# (one primary-key lookup) plus the date, so a matching If-None-Match lets a
+# route answer 304 before doing any of its real work.
+
+# Folders of the package that hold runtime data, not code
+NOT_CODE = {'__pycache__', 'uploads'}
+
+
+def _code_digest():
+    """Hash of the app package's code, templates and assets (same in every worker)."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in NOT_CODE)
+        for name in sorted(files):
+            path = os.path.join(folder, name)
+            digest.update(os.path.relpath(path, root).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+# Changes with every deploy that changes code, templates or assets, so they
+# aren't masked; never with a restart, or workers would disagree on ETags
+BUILD_ID = os.getenv('APP_BUILD') or _code_digest()
+
+
+def user_etag(user_id, *parts):
+    """Strong ETag for data that only changes with the user's version or the day."""
+    key = ':'.join(str(p) for p in (
+        BUILD_ID, user_id, state.get_version(user_id), date.today().isoformat(), *parts))
+    return hashlib.sha1(key.encode()).hexdigest()[:24]
+
+
+def is_fresh(etag):
+    """True if the client's If-None-Match already has this ETag."""
+    return request.if_none_match.contains(etag)
+
+
+def not_modified(etag, max_age=0):
+    return tag_response(make_response('', 304), etag, max_age)
+
+
+def tag_response(response, etag, max_age=0):
+    response.set_etag(etag)
+    if max_age:
+        # Reused without asking for a few seconds (may lag a change by that much)
+        response.headers['Cache-Control'] = f'private, max-age={max_age}'
+    else:
+        # Always revalidate, but let the browser reuse the body on 304
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def has_pending_flashes():
+    """Pages showing one-shot flash messages must not be served from cache."""
+    return bool(session.get('_flashes'))
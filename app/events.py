@@ -0,0 +1,91 @@
+import json
+import os
+import queue
+import threading
+
+# Per-user change feed behind the /api/events Server-Sent Events stream.
+# Writers call publish() AFTER their commit; every open dashboard tab of that
+# user holds one subscriber queue and wakes up only when something happened.
+# The newest data version each connected user has been told about is kept
+# too, so the version watcher (state.py) only reports writes made elsewhere.
+#
+# Each live stream pins one web thread for its whole lifetime, so a process
+# serves at most MAX_STREAMS of them (default: half of start.sh's 8 gunicorn
+# threads); past that, tabs are told to poll /api/stats instead.
+
+QUEUE_SIZE = 100
+MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', '4'))
+
+_subscribers = {}  # user_id -> set of queue.Queue
+_versions = {}     # user_id -> newest data version published (connected users only)
+_lock = threading.Lock()
+_streams = 0
+
+
+def open_stream():
+    """Reserves a live-stream slot in this process; False when all are taken."""
+    global _streams
+    with _lock:
+        if _streams >= MAX_STREAMS:
+            return False
+        _streams += 1
+        return True
+
+
+def close_stream():
+    global _streams
+    with _lock:
+        _streams -= 1
+
+
+def subscribe(user_id, version=0):
+    """Registers a new listener for a user, who has seen `version`, and returns its queue."""
+    q = queue.Queue(maxsize=QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(user_id, set()).add(q)
+        _versions[user_id] = max(_versions.get(user_id, 0), version)
+    return q
+
+
+def unsubscribe(user_id, q):
+    with _lock:
+        listeners = _subscribers.get(user_id)
+        if listeners:
+            listeners.discard(q)
+            if not listeners:
+                del _subscribers[user_id]
+                _versions.pop(user_id, None)
+
+
+def publish(user_id, event, data=None):
+    """Pushes an event ('tasks', 'history', ...) to every tab of one user."""
+    data = data or {}
+    with _lock:
+        listeners = list(_subscribers.get(user_id, ()))
+        if listeners and 'version' in data:
+            _versions[user_id] = max(_versions[user_id], data['version'])
+    for q in listeners:
+        try:
+            q.put_nowait((event, data))
+        except queue.Full:
+            # A stalled client already has plenty of "something changed" hints
+            pass
+
+
+def broadcast(event, data=None):
+    """Pushes an event to every connected user (e.g. system metrics)."""
+    with _lock:
+        user_ids = list(_subscribers)
+    for user_id in user_ids:
+        publish(user_id, event, data)
+
+
+def known_versions():
+    """{user_id: newest version published} for every connected user."""
+    with _lock:
+        return dict(_versions)
+
+
+def format_sse(event, data):
+    """Serializes one event in the text/event-stream wire format."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,108 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from PIL import Image, ImageDraw
+
+from app import habits, state
+from app.models import Task
+
+# Dot-grid habit image for the weekly briefing and /api/tasks/habits.png.
+# Completions come from the habit bitmaps (one range query per user), PNGs
+# are cached per (user, date range, data version) so any change to the
+# user's data makes a fresh one, and Pillow work runs on a small pool so
+# several users' images render in parallel.
+
+DEFAULT_DAYS = 14
+MAX_DAYS = 92  # Keeps the image a sane width
+CACHE_SIZE = 64
+RENDER_WORKERS = int(os.getenv('HABIT_RENDER_WORKERS', '4'))
+
+DOT_SIZE = 20
+GAP = 10
+ROW_HEIGHT = 40
+LABEL_WIDTH = 160
+
+_cache = OrderedDict()  # (user_id, start, end, version) -> PNG bytes, or None without habits
+_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix='habit-image')
+
+
+def draw_grid(rows, num_days):
+    """rows: [(name, color, bits)] with bit i = day i of the range -> PNG bytes."""
+    width = LABEL_WIDTH + (num_days * (DOT_SIZE + GAP))
+    height = 60 + (len(rows) * ROW_HEIGHT)
+
+    img = Image.new('RGB', (width, height), color='#1A1A1A')
+    draw = ImageDraw.Draw(img)
+    draw.text((10, 10), f"HABIT TRACKER ({num_days} Days)", fill='#888888')
+
+    for i, (name, color, bits) in enumerate(rows):
+        y_pos = 40 + (i * ROW_HEIGHT)
+        draw.text((10, y_pos), name[:15], fill='#FFFFFF')
+        active_color = color or '#2ecc71'
+        for d in range(num_days):
+            x_pos = LABEL_WIDTH + (d * (DOT_SIZE + GAP))
+            fill = active_color if bits >> d & 1 else '#222222'
+            draw.ellipse([x_pos, y_pos, x_pos + DOT_SIZE, y_pos + DOT_SIZE], fill=fill)
+
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def default_range(today=None):
+    end = today or date.today()
+    return end - timedelta(days=DEFAULT_DAYS - 1), end
+
+
+def _cached(key):
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return True, _cache[key]
+    return False, None
+
+
+def _store(key, png):
+    with _lock:
+        _cache[key] = png
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _load_rows(user_id, start, end):
+    habit_tasks = Task.query.filter_by(user_id=user_id, is_habit=True).order_by(Task.id).all()
+    bits = habits.load_range(user_id, [h.id for h in habit_tasks], start, end)
+    return [(h.content, h.color, bits[h.id]) for h in habit_tasks]
+
+
+def render_many(user_ids, start=None, end=None):
+    """{user_id: PNG bytes or None} for one date range; uncached ones render in parallel."""
+    if start is None or end is None:
+        start, end = default_range()
+    num_days = (end - start).days + 1
+
+    results, jobs = {}, {}
+    for user_id in user_ids:
+        key = (user_id, start, end, state.get_version(user_id))
+        hit, png = _cached(key)
+        if hit:
+            results[user_id] = png
+            continue
+        rows = _load_rows(user_id, start, end)  # DB work stays on the caller's thread
+        jobs[user_id] = (key, _pool.submit(draw_grid, rows, num_days) if rows else None)
+
+    for user_id, (key, future) in jobs.items():
+        png = future.result() if future else None
+        _store(key, png)
+        results[user_id] = png
+    return results
+
+
+def get_png(user_id, start=None, end=None):
+    return render_many([user_id], start, end)[user_id]
@@ -0,0 +1,317 @@
+from datetime import date, timedelta
+
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.extensions import db
+from app.models import HabitBitmap, HabitStats, TaskHistory
+
+# Compact habit history: one HabitBitmap row per task per year holds a
+# 366-bit set (bit N = day-of-year N, 0-based). The rows are maintained by
+# TaskHistory mapper events, so every ORM write path (web, bot, seed) keeps
+# them in sync inside its own transaction. Heatmaps of any range then read a
+# handful of small rows instead of scanning one TaskHistory row per day.
+#
+# The same hooks keep a HabitStats row per habit (streaks, this week/month,
+# totals). Appending the newest day is plain arithmetic; back-filled or
+# removed days re-derive the streaks from the task's few bitmap rows, so
+# no path ever reads TaskHistory.
+
+BITMAP_BYTES = 46  # 366 bits
+
+
+def _day_index(day):
+    return day.timetuple().tm_yday - 1
+
+
+def _set_bit(connection, task_id, user_id, day, done):
+    """Read-modify-write of one day bit (runs inside the flush transaction).
+
+    Returns False if the bit already had that value (nothing written).
+    """
+    bits = connection.execute(
+        select(HabitBitmap.bits).where(HabitBitmap.task_id == task_id,
+                                       HabitBitmap.year == day.year)).scalar()
+    value = int.from_bytes(bits, 'little') if bits else 0
+    mask = 1 << _day_index(day)
+    if bool(value & mask) == done:
+        return False
+    value = value | mask if done else value & ~mask
+    new_bits = value.to_bytes(BITMAP_BYTES, 'little')
+
+    stmt = sqlite_insert(HabitBitmap).values(
+        task_id=task_id, year=day.year, user_id=user_id, bits=new_bits)
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[HabitBitmap.task_id, HabitBitmap.year],
+        set_={'bits': new_bits}))
+    return True
+
+
+@event.listens_for(TaskHistory, 'after_insert')
+def _history_inserted(mapper, connection, target):
+    if _set_bit(connection, target.task_id, target.user_id, target.completed_date, True):
+        _update_stats(connection, target.task_id, target.user_id, target.completed_date, True)
+
+
+@event.listens_for(TaskHistory, 'after_delete')
+def _history_deleted(mapper, connection, target):
+    # Legacy data may hold duplicate rows for a day; keep the bit if one is left
+    remaining = connection.execute(
+        select(func.count(TaskHistory.id)).where(
+            TaskHistory.task_id == target.task_id,
+            TaskHistory.completed_date == target.completed_date)).scalar()
+    if not remaining and _set_bit(
+            connection, target.task_id, target.user_id, target.completed_date, False):
+        _update_stats(connection, target.task_id, target.user_id, target.completed_date, False)
+
+
+# --- ROLLUPS (HabitStats) ---
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def _periods(today):
+    """(name, first day, last day) of the week and month containing today."""
+    week = _week_start(today)
+    month = today.replace(day=1)
+    next_month = (month + timedelta(days=32)).replace(day=1)
+    return (('week', week, week + timedelta(days=6)),
+            ('month', month, next_month - timedelta(days=1)))
+
+
+def _join_years(rows):
+    """[(year, bits)] -> (origin date, one int over all years; bit i = origin + i days)."""
+    if not rows:
+        return None, 0
+    origin = date(min(year for year, _ in rows), 1, 1)
+    value = 0
+    for year, bits in rows:
+        value |= int.from_bytes(bits, 'little') << (date(year, 1, 1) - origin).days
+    return origin, value
+
+
+def _runs(value):
+    """Yields (first bit, length) of every run of set bits, lowest first."""
+    position = 0
+    while value:
+        zeros = (value & -value).bit_length() - 1
+        value >>= zeros
+        position += zeros
+        ones = (value ^ (value + 1)).bit_length() - 1
+        yield position, ones
+        value >>= ones
+        position += ones
+
+
+def _streaks(origin, value):
+    """(streak ending at the last completion, longest streak, last completion)."""
+    longest, last_run = 0, None
+    for last_run in _runs(value):
+        longest = max(longest, last_run[1])
+    if last_run is None:
+        return 0, 0, None
+    start, length = last_run
+    return length, longest, origin + timedelta(days=start + length - 1)
+
+
+def _count_between(origin, value, first, last):
+    """Set bits for the days first..last (inclusive)."""
+    if origin is None:
+        return 0
+    low = max((first - origin).days, 0)
+    high = (last - origin).days
+    if high < low:
+        return 0
+    return ((value >> low) & ((1 << (high - low + 1)) - 1)).bit_count()
+
+
+def _empty_stats(task_id, user_id):
+    return {'task_id': task_id, 'user_id': user_id, 'current_streak': 0, 'longest_streak': 0,
+            'last_completed': None, 'week_start': None, 'week_count': 0,
+            'month_start': None, 'month_count': 0, 'total': 0}
+
+
+def _update_stats(connection, task_id, user_id, day, done, today=None):
+    """Applies one day bit flip to the habit's HabitStats row."""
+    today = today or date.today()
+    row = connection.execute(
+        select(HabitStats.__table__).where(HabitStats.task_id == task_id)).mappings().first()
+    stats = dict(row) if row else _empty_stats(task_id, user_id)
+
+    last = stats['last_completed']
+    if done and (last is None or day > last):
+        # The usual case: a new latest completion extends or restarts the streak
+        extends = last is not None and day - last == timedelta(days=1)
+        stats['current_streak'] = stats['current_streak'] + 1 if extends else 1
+        stats['longest_streak'] = max(stats['longest_streak'], stats['current_streak'])
+        stats['last_completed'] = day
+    else:
+        # Back-filled or removed day: may join/split runs anywhere
+        rows = connection.execute(select(HabitBitmap.year, HabitBitmap.bits).where(
+            HabitBitmap.task_id == task_id)).all()
+        (stats['current_streak'], stats['longest_streak'],
+         stats['last_completed']) = _streaks(*_join_years(rows))
+
+    step = 1 if done else -1
+    stats['total'] = max(0, stats['total'] + step)
+    for name, first, last_day in _periods(today):
+        if stats[f'{name}_start'] != first:
+            # First change this period: nothing was counted for it yet
+            stats[f'{name}_start'], stats[f'{name}_count'] = first, 0
+        if first <= day <= last_day:
+            stats[f'{name}_count'] = max(0, stats[f'{name}_count'] + step)
+
+    values = {k: v for k, v in stats.items() if k != 'task_id'}
+    connection.execute(sqlite_insert(HabitStats).values(**stats).on_conflict_do_update(
+        index_elements=[HabitStats.task_id], set_=values))
+
+
+def load_stats(task_ids, today=None):
+    """{task_id: rollup dict} read from HabitStats (one PK lookup per habit)."""
+    today = today or date.today()
+    result = {task_id: {'streak': 0, 'longest': 0, 'week': 0, 'month': 0, 'month_rate': 0,
+                        'total': 0, 'last': None} for task_id in task_ids}
+    if not task_ids:
+        return result
+
+    (_, week, _), (_, month, _) = _periods(today)
+    for stats in HabitStats.query.filter(HabitStats.task_id.in_(task_ids)):
+        last = stats.last_completed
+        # A streak is alive until a whole day passes without a completion
+        alive = last is not None and (today - last).days <= 1
+        month_count = stats.month_count if stats.month_start == month else 0
+        result[stats.task_id] = {
+            'streak': stats.current_streak if alive else 0,
+            'longest': stats.longest_streak,
+            'week': stats.week_count if stats.week_start == week else 0,
+            'month': month_count,
+            'month_rate': round(100 * month_count / today.day),
+            'total': stats.total,
+            'last': last.isoformat() if last else None,
+        }
+    return result
+
+
+def load_range(user_id, task_ids, start, end):
+    """Returns {task_id: int} where bit i is set if the task was done on start + i days."""
+    result = {task_id: 0 for task_id in task_ids}
+    if not task_ids:
+        return result
+
+    rows = db.session.query(HabitBitmap.task_id, HabitBitmap.year, HabitBitmap.bits).filter(
+        HabitBitmap.user_id == user_id,
+        HabitBitmap.year >= start.year,
+        HabitBitmap.year <= end.year,
+        HabitBitmap.task_id.in_(task_ids)).all()
+
+    for task_id, year, bits in rows:
+        year_start = date(year, 1, 1)
+        # Clip the requested range to this year
+        first = max(start, year_start)
+        last = min(end, date(year, 12, 31))
+        length = (last - first).days + 1
+        segment = (int.from_bytes(bits, 'little') >> _day_index(first)) & ((1 << length) - 1)
+        result[task_id] |= segment << (first - start).days
+    return result
+
+
+def bit_indexes(value):
+    """Positions of the set bits of an int, ascending."""
+    indexes = []
+    while value:
+        low = value & -value
+        indexes.append(low.bit_length() - 1)
+        value ^= low
+    return indexes
+
+
+def rebuild_bitmaps(user_id=None):
+    """Recomputes HabitBitmap rows from TaskHistory (backfill / repair)."""
+    query = HabitBitmap.query
+    history = db.session.query(TaskHistory.task_id, TaskHistory.user_id,
+                               TaskHistory.completed_date)
+    if user_id is not None:
+        query = query.filter(HabitBitmap.user_id == user_id)
+        history = history.filter(TaskHistory.user_id == user_id)
+    query.delete(synchronize_session=False)
+
+    years = {}
+    for task_id, owner_id, completed_date in history.yield_per(1000):
+        key = (task_id, completed_date.year)
+        owner, value = years.get(key, (owner_id, 0))
+        years[key] = (owner, value | (1 << _day_index(completed_date)))
+
+    db.session.bulk_insert_mappings(HabitBitmap, [
+        {'task_id': task_id, 'year': year, 'user_id': owner,
+         'bits': value.to_bytes(BITMAP_BYTES, 'little')}
+        for (task_id, year), (owner, value) in years.items()])
+    db.session.commit()
+    return len(years)
+
+
+def rebuild_stats(user_id=None, today=None):
+    """Recomputes HabitStats rows from the bitmaps (backfill / repair)."""
+    today = today or date.today()
+    query = HabitStats.query
+    bitmaps = db.session.query(HabitBitmap.task_id, HabitBitmap.user_id, HabitBitmap.year,
+                               HabitBitmap.bits)
+    if user_id is not None:
+        query = query.filter(HabitStats.user_id == user_id)
+        bitmaps = bitmaps.filter(HabitBitmap.user_id == user_id)
+    query.delete(synchronize_session=False)
+
+    by_task = {}
+    for task_id, owner_id, year, bits in bitmaps:
+        by_task.setdefault((task_id, owner_id), []).append((year, bits))
+
+    rows = []
+    for (task_id, owner_id), years in by_task.items():
+        origin, value = _join_years(years)
+        if not value:
+            continue
+        stats = _empty_stats(task_id, owner_id)
+        stats['current_streak'], stats['longest_streak'], stats['last_completed'] = _streaks(
+            origin, value)
+        stats['total'] = value.bit_count()
+        for name, first, last_day in _periods(today):
+            stats[f'{name}_start'] = first
+            stats[f'{name}_count'] = _count_between(origin, value, first, last_day)
+        rows.append(stats)
+
+    db.session.bulk_insert_mappings(HabitStats, rows)
+    db.session.commit()
+    return len(rows)
+
+
+def backfill_bitmaps():
+    """Builds the bitmaps and rollups once on databases that predate them."""
+    has_bitmaps = db.session.query(HabitBitmap.task_id).first() is not None
+    has_history = db.session.query(TaskHistory.id).first() is not None
+    if has_history and not has_bitmaps:
+        count = rebuild_bitmaps()
+        print(f"🧮 Habit bitmaps backfilled: {count} task-years.")
+    has_stats = db.session.query(HabitStats.task_id).first() is not None
+    if has_history and not has_stats:
+        count = rebuild_stats()
+        print(f"🔥 Habit stats backfilled: {count} habits.")
+
+
+def parse_range(args, today=None, max_days=3660):
+    """Reads ?days=N or ?start=YYYY-MM-DD&end=YYYY-MM-DD -> (start, end) or None."""
+    today = today or date.today()
+    try:
+        if args.get('start'):
+            start = date.fromisoformat(args['start'])
+            end = date.fromisoformat(args['end']) if args.get('end') else today
+        else:
+            days = int(args.get('days', 30))
+            if days < 1:
+                return None
+            start, end = today - timedelta(days=days - 1), today
+    except ValueError:
+        return None
+    if end < start or (end - start).days >= max_days:
+        return None
+    return start, end
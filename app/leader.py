@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows dev box: single process, always the leader
+    fcntl = None
+
+# Leader election between gunicorn workers (and any other process started
+# from the same instance folder). Whoever holds an exclusive flock on
+# instance/leader.lock runs the singletons: scheduler and Telegram bot.
+# The OS drops the lock when the holder exits or crashes, and the other
+# processes keep retrying in the background, so one of them takes over
+# within LEADER_RETRY_SECONDS.
+
+RETRY_SECONDS = int(os.getenv('LEADER_RETRY_SECONDS', '10'))
+
+_lock = threading.Lock()
+_lock_file = None  # Kept open for the life of the process: closing it releases the lock
+_started = False
+
+
+def _try_acquire(path):
+    global _lock_file
+    if fcntl is None:
+        return True
+    lock_file = open(path, 'a+')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(f"{os.getpid()}\n")
+    lock_file.flush()
+    _lock_file = lock_file
+    return True
+
+
+def is_leader():
+    return fcntl is None or _lock_file is not None
+
+
+def run_when_elected(app, on_elected):
+    """Calls on_elected(app) once this process becomes the leader (maybe never).
+
+    Tries right away; if another process holds the lock, a daemon thread
+    keeps trying so a follower takes over when the leader dies.
+    """
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    path = os.path.join(app.instance_path, 'leader.lock')
+    if _try_acquire(path):
+        print(f"👑 Leader (pid {os.getpid()}): starting scheduler and bot.")
+        on_elected(app)
+        return
+
+    def wait_for_leadership():
+        while True:
+            time.sleep(RETRY_SECONDS)
+            if _try_acquire(path):
+                print(f"👑 Leader lost; pid {os.getpid()} takes over scheduler and bot.")
+                on_elected(app)
+                return
+
+    print(f"👥 Follower (pid {os.getpid()}): another process runs scheduler and bot.")
+    threading.Thread(target=wait_for_leadership, name='leader-election', daemon=True).start()
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from collections import deque
+
+import psutil
+
+from app import events
+
+# One sampler thread per process records system metrics into a fixed-size
+# ring buffer. /api/stats and /api/stats/history only read from it, so the
+# per-request cost no longer depends on psutil (and cpu_percent is measured
+# over a real, constant interval instead of "since whoever asked last").
+
+SAMPLE_INTERVAL = int(os.getenv('METRICS_INTERVAL', '5'))
+HISTORY_SECONDS = 24 * 3600
+FIELDS = ('cpu', 'ram', 'disk', 'load', 'rss')
+
+_samples = deque(maxlen=HISTORY_SECONDS // SAMPLE_INTERVAL)
+_lock = threading.Lock()
+_started = False
+_process = psutil.Process()
+
+
+def take_sample():
+    """Returns (timestamp, cpu %, ram %, disk %, 1-min load, process RSS in MB)."""
+    return (
+        int(time.time()),
+        psutil.cpu_percent(interval=None),
+        psutil.virtual_memory().percent,
+        psutil.disk_usage('/').percent,
+        round(psutil.getloadavg()[0], 2),
+        round(_process.memory_info().rss / (1024 * 1024), 1),
+    )
+
+
+def _run():
+    psutil.cpu_percent(interval=None)  # Prime the counter; first value is 0.0
+    previous = None
+    while True:
+        time.sleep(SAMPLE_INTERVAL)
+        try:
+            sample = take_sample()
+        except Exception as e:
+            print(f"❌ Metrics Sampler Error: {e}")
+            continue
+        with _lock:
+            _samples.append(sample)
+        # Dashboards only hear about it when the visible numbers moved
+        if previous is None or sample[1:4] != previous[1:4]:
+            events.broadcast('system', _as_dict(sample))
+        previous = sample
+
+
+def start_sampler():
+    """Starts the sampler thread once per process."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    thread = threading.Thread(target=_run, name='metrics-sampler', daemon=True)
+    thread.start()
+
+
+def _as_dict(sample):
+    data = dict(zip(FIELDS, sample[1:]))
+    data['ts'] = sample[0]
+    return data
+
+
+def latest():
+    """Most recent sample as a dict (sampled inline until the buffer has one)."""
+    with _lock:
+        sample = _samples[-1] if _samples else None
+    return _as_dict(sample or take_sample())
+
+
+def history(window_seconds, max_points=360):
+    """Columnar time series for the last window: {'t': [...], 'cpu': [...], ...}.
+
+    Long windows are averaged down to at most max_points buckets so the
+    sparkline payload stays small regardless of the window.
+    """
+    cutoff = time.time() - window_seconds
+    with _lock:
+        rows = [s for s in _samples if s[0] >= cutoff]
+
+    step = max(1, -(-len(rows) // max_points))  # ceil division
+    if step > 1:
+        rows = [
+            (chunk[-1][0],) + tuple(
+                round(sum(col) / len(chunk), 2) for col in zip(*(r[1:] for r in chunk)))
+            for chunk in (rows[i:i + step] for i in range(0, len(rows), step))
+        ]
+
+    columns = list(zip(*rows)) if rows else [()] * (len(FIELDS) + 1)
+    data = {'interval': SAMPLE_INTERVAL * step, 't': list(columns[0])}
+    for name, values in zip(FIELDS, columns[1:]):
+        data[name] = list(values)
+    return data
@@ -31,11 +31,22 @@ class Task(db.Model):
 
     # Visuals
     color = db.Column(db.String(20), default='#3b5bdb')
-    recurrence = db.Column(db.String(20), default='none')
+    recurrence = db.Column(db.String(255), default='none')  # 'none', preset or RRULE (app/recurrence.py)
+    snooze_until = db.Column(db.DateTime, nullable=True)  # Reminder pushed back from the bot
     is_habit = db.Column(db.Boolean, default=False)
 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    __table_args__ = (
+        # Dashboard list / briefings: per-user open tasks by due date
+        db.Index('ix_task_user_complete_due', 'user_id', 'complete', 'due_date'),
+        db.Index('ix_task_due_date', 'due_date'),
+        db.Index('ix_task_last_completed', 'last_completed'),
+        db.Index('ix_task_recurrence', 'recurrence'),
+        # /api/tasks/search filters
+        db.Index('ix_task_user_category', 'user_id', 'category', 'priority'),
+    )
+
 
 class TaskHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -43,3 +54,56 @@ class TaskHistory(db.Model):
     completed_date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(20), default='completed')
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    __table_args__ = (
+        # One row per task and day, even with writers in several processes
+        db.Index('uq_task_history_task_date', 'task_id', 'completed_date', unique=True),
+    )
+
+
+class DataVersion(db.Model):
+    """Monotonic per-user change counter, bumped inside every write transaction."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class HabitBitmap(db.Model):
+    """One bit per day of a year for a task (bit 0 = Jan 1), mirrors TaskHistory."""
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    bits = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (db.Index('ix_habit_bitmap_user_year', 'user_id', 'year'),)
+
+
+class HabitStats(db.Model):
+    """Per-habit rollups, kept current by the TaskHistory hooks in app/habits.py."""
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)  # Run ending at last_completed
+    longest_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_completed = db.Column(db.Date, nullable=True)
+    # Completions in the week/month these dates start (stale periods read as 0)
+    week_start = db.Column(db.Date, nullable=True)
+    week_count = db.Column(db.Integer, nullable=False, default=0)
+    month_start = db.Column(db.Date, nullable=True)
+    month_count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+
+class NotificationSettings(db.Model):
+    """Where a user's Telegram briefings go, and which ones they want."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    chat_id = db.Column(db.String(64), nullable=True)
+    morning_briefing = db.Column(db.Boolean, nullable=False, default=True)
+    daily_summary = db.Column(db.Boolean, nullable=False, default=True)
+    weekly_briefing = db.Column(db.Boolean, nullable=False, default=True)
+    task_reminders = db.Column(db.Boolean, nullable=False, default=True)
+    # Pending '/start <code>' from the settings page (sha256 of the code) and its expiry
+    link_code_hash = db.Column(db.String(64), nullable=True)
+    link_code_expires = db.Column(db.DateTime, nullable=True)
+
+    # Bot callbacks look up the user(s) behind a chat; /start looks up the code
+    __table_args__ = (db.Index('ix_notification_settings_chat', 'chat_id'),
+                      db.Index('ix_notification_settings_link_code', 'link_code_hash'))
@@ -1,17 +1,46 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app, Response, make_response
 from flask_login import login_required, current_user
-from datetime import datetime, date
-import psutil
+from datetime import datetime, date, timedelta
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 
+from app import caching, events, metrics, outbox, reminders, state
 from app.extensions import db
-from app.models import Task, TaskHistory  # Still needed for dashboard task query + basic counts
+from app.models import Task, TaskHistory, NotificationSettings
+from app.modules.tasks import queries
+from app.telegram_bot import CHAT_ID, LINK_CODE_MINUTES, issue_link_code
 from app.scheduler import check_daily_notifications, check_daily_summary, check_weekly_briefing, reset_daily_tasks
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# SSE tuning: an idle stream sends a keep-alive comment this often, and each
+# stream is recycled periodically (EventSource reconnects on its own). An open
+# stream holds a gunicorn thread, so only events.MAX_STREAMS run per process;
+# the rest get a 204, which stops EventSource, and the page polls /api/stats.
+# Writes from other processes arrive through state's version watcher.
+EVENTS_IDLE_SECONDS = int(os.getenv('EVENTS_IDLE_SECONDS', '15'))
+EVENTS_STREAM_LIFETIME = int(os.getenv('EVENTS_STREAM_LIFETIME', '300'))
+EVENTS_RETRY_MS = 5000
+
+BRIEFINGS = ('morning_briefing', 'daily_summary', 'weekly_briefing', 'task_reminders')
+
 # --- ROUTES ---
 
 
+def dev_required(view):
+    """The dev panel's role check for its JSON endpoints (403 instead of a redirect)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_user.role != 'dev':
+            return jsonify({'success': False, 'error': 'Developer clearance required.'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
 @dashboard_bp.route('/')
 def index():
     if not current_user.is_authenticated:
@@ -22,27 +51,60 @@ def index():
 @dashboard_bp.route('/dashboard')
 @login_required
 def dashboard_view():
-    all_tasks = Task.query.filter_by(user_id=current_user.id).order_by(
-        Task.complete, Task.due_date).all()
-    visible_tasks = []
-    today_start = datetime.combine(date.today(), datetime.min.time())
-
-    for t in all_tasks:
-        if not t.complete:
-            visible_tasks.append(t)
-        elif t.recurrence != 'none':
-            visible_tasks.append(t)
-        else:
-            if t.last_completed and t.last_completed >= today_start:
-                visible_tasks.append(t)
+    etag = None
+    if not caching.has_pending_flashes():
+        etag = caching.user_etag(current_user.id, 'dashboard')
+        if caching.is_fresh(etag):
+            return caching.not_modified(etag)
 
-    return render_template('main/dashboard.html', tasks=visible_tasks, now=datetime.now())
+    # Visibility rule runs in SQL: incomplete, recurring, or completed today
+    visible_tasks = queries.visible_tasks(current_user.id)
 
+    html = render_template('main/dashboard.html', tasks=visible_tasks, now=datetime.now())
+    if etag is None:
+        return html
+    return caching.tag_response(make_response(html), etag)
 
-@dashboard_bp.route('/settings')
+
+def _notification_prefs():
+    return db.session.get(NotificationSettings, current_user.id) or NotificationSettings(
+        user_id=current_user.id, morning_briefing=True, daily_summary=True, weekly_briefing=True,
+        task_reminders=True)
+
+
+@dashboard_bp.route('/settings', methods=['GET', 'POST'])
 @login_required
 def settings():
-    return render_template('main/settings.html')
+    prefs = _notification_prefs()
+
+    if request.method == 'POST':
+        # The chat itself is only set by the bot (/start <code>); here it can only be dropped
+        if 'unlink' in request.form:
+            prefs.chat_id = None
+        for briefing in BRIEFINGS:
+            setattr(prefs, briefing, briefing in request.form)
+        db.session.add(prefs)
+        state.touch(current_user.id)  # Lets the reminder thread pick up the new chat
+        db.session.commit()
+        flash("Telegram chat unlinked." if 'unlink' in request.form else "Notification settings saved.")
+        return redirect(url_for('dashboard.settings'))
+
+    # The global TELEGRAM_CHAT_ID still serves user 1 until they link their own
+    fallback_chat = CHAT_ID if current_user.id == 1 and not prefs.chat_id else None
+    return render_template('main/settings.html', prefs=prefs, fallback_chat=fallback_chat)
+
+
+@dashboard_bp.route('/settings/telegram/link', methods=['POST'])
+@login_required
+def telegram_link():
+    """One-time code the user sends to the bot from the chat they want linked."""
+    prefs = _notification_prefs()
+    code = issue_link_code(prefs)
+    db.session.add(prefs)
+    db.session.commit()
+    flash(f"Send the bot /start {code} from the chat you want to link "
+          f"(within {LINK_CODE_MINUTES} minutes).")
+    return redirect(url_for('dashboard.settings'))
 
 
 @dashboard_bp.route('/dev')
@@ -60,49 +122,151 @@ def dev_panel():
 @dashboard_bp.route('/api/stats')
 @login_required
 def get_stats():
-    cpu = psutil.cpu_percent(interval=None)
-    ram = psutil.virtual_memory().percent
-    disk = psutil.disk_usage('/').percent
-    task_count = Task.query.filter_by(user_id=current_user.id).count()
-    history_count = TaskHistory.query.filter_by(
-        user_id=current_user.id).count()
-    version = task_count + history_count
-    return jsonify({'cpu': cpu, 'ram': ram, 'disk': disk, 'data_version': version})
+    sample = metrics.latest()
+    # Fresh until the next sample lands or the user's data changes
+    etag = caching.user_etag(current_user.id, 'stats', sample['ts'])
+    if caching.is_fresh(etag):
+        return caching.not_modified(etag)
+
+    version = state.get_version(current_user.id)
+    return caching.tag_response(jsonify({
+        'cpu': sample['cpu'], 'ram': sample['ram'], 'disk': sample['disk'],
+        'load': sample['load'], 'rss': sample['rss'], 'data_version': version}), etag)
+
+
+WINDOW_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def _parse_window(value):
+    """'90s', '15m', '1h', '1d' or plain seconds -> seconds (None if invalid)."""
+    value = (value or '').strip().lower()
+    try:
+        if value and value[-1] in WINDOW_UNITS:
+            seconds = int(value[:-1]) * WINDOW_UNITS[value[-1]]
+        else:
+            seconds = int(value)
+    except ValueError:
+        return None
+    return seconds if seconds > 0 else None
+
+
+@dashboard_bp.route('/api/stats/history')
+@login_required
+def get_stats_history():
+    window = _parse_window(request.args.get('window', '1h'))
+    if window is None:
+        return jsonify({'error': 'Invalid window (use e.g. 15m, 1h, 24h)'}), 400
+    window = min(window, metrics.HISTORY_SECONDS)
+    return jsonify(metrics.history(window))
+
+
+@dashboard_bp.route('/api/telegram/outbox')
+@login_required
+@dev_required
+def get_outbox_stats():
+    """Outbound Telegram queue of this process: depth, counters, latency, pending reminders.
+
+    Covers every user's messages, so it is for the dev panel only.
+    """
+    return jsonify(dict(outbox.stats(), reminders=reminders.pending()))
+
+
+# --- API: LIVE CHANGE STREAM (replaces /api/stats polling) ---
+
+
+@dashboard_bp.route('/api/events')
+@login_required
+def event_stream():
+    """Server-Sent Events: 'tasks', 'history' and 'system' pushes for this user."""
+    if not events.open_stream():
+        return '', 204  # Every stream slot is taken: the client falls back to polling
+    user_id = current_user.id
+    version = state.get_version(user_id)  # Read now: the generator runs after the request ends
+    state.start_watcher(current_app._get_current_object())
+
+    def generate():
+        q = events.subscribe(user_id, version)
+        try:
+            yield f"retry: {EVENTS_RETRY_MS}\n\n"
+            yield events.format_sse('system', metrics.latest())
+
+            deadline = time.monotonic() + EVENTS_STREAM_LIFETIME
+            while time.monotonic() < deadline:
+                try:
+                    event, data = q.get(timeout=EVENTS_IDLE_SECONDS)
+                    yield events.format_sse(event, data)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            events.unsubscribe(user_id, q)
+
+    resp = Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # The server closes every response, even one whose generator never started
+    resp.call_on_close(events.close_stream)
+    return resp
 
 
 # --- DEV PANEL TRIGGERS (kept here as they are dev tools for scheduler) ---
+# The real jobs message every user with a chat and render habit images, so
+# only developers may start them, and the request only queues them: one
+# background thread runs the jobs, each at most once in the queue.
+
+_dev_jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dev-job')
+_queued_jobs = set()
+_jobs_lock = threading.Lock()
+
+
+def _queue_job(job, message):
+    with _jobs_lock:
+        if job in _queued_jobs:
+            return jsonify({'success': False, 'error': f'{job.__name__} is already queued.'}), 409
+        _queued_jobs.add(job)
+    _dev_jobs.submit(_run_job, job, current_app._get_current_object())
+    return jsonify({'success': True, 'message': message}), 202
+
+
+def _run_job(job, app):
+    try:
+        job(app)  # Each job opens its own app context
+    except Exception as e:
+        print(f"❌ Dev Job Error ({job.__name__}): {e}")
+    finally:
+        with _jobs_lock:
+            _queued_jobs.discard(job)
 
 
 @dashboard_bp.route('/api/trigger/daily', methods=['POST'])
 @login_required
+@dev_required
 def dev_trigger_daily():
-    check_daily_notifications(current_app)
-    return jsonify({'success': True, 'message': 'Morning alert triggered!'})
+    return _queue_job(check_daily_notifications, 'Morning alert queued!')
 
 
 @dashboard_bp.route('/api/test/alert', methods=['POST'])
 @login_required
+@dev_required
 def dev_test_alert():
-    check_daily_notifications(current_app)
-    return jsonify({'success': True, 'message': 'Urgent alert simulation sent!'})
+    return _queue_job(check_daily_notifications, 'Urgent alert simulation queued!')
 
 
 @dashboard_bp.route('/api/trigger/summary', methods=['POST'])
 @login_required
+@dev_required
 def dev_trigger_summary():
-    check_daily_summary(current_app)
-    return jsonify({'success': True, 'message': 'Night summary triggered!'})
+    return _queue_job(check_daily_summary, 'Night summary queued!')
 
 
 @dashboard_bp.route('/api/trigger/weekly', methods=['POST'])
 @login_required
+@dev_required
 def dev_trigger_weekly():
-    check_weekly_briefing(current_app)
-    return jsonify({'success': True, 'message': 'Weekly briefing triggered!'})
+    return _queue_job(check_weekly_briefing, 'Weekly briefing queued!')
 
 
 @dashboard_bp.route('/api/test/seed', methods=['POST'])
 @login_required
+@dev_required
 def dev_seed_data():
     import random
     tasks = Task.query.filter_by(user_id=current_user.id, is_habit=True).all()
@@ -123,12 +287,13 @@ def dev_seed_data():
                                     user_id=current_user.id)
                     db.session.add(h)
                     added_count += 1
+    state.touch(current_user.id, 'history', {'seeded': added_count})
     db.session.commit()
     return jsonify({'success': True, 'message': f'Seeded {added_count} history entries.'})
 
 
 @dashboard_bp.route('/api/test/midnight', methods=['POST'])
 @login_required
+@dev_required
 def dev_trigger_midnight():
-    reset_daily_tasks(current_app)
-    return jsonify({'success': True, 'message': 'Midnight cleanup ran. Daily tasks reset.'})
\ No newline at end of file
+    return _queue_job(reset_daily_tasks, 'Midnight cleanup queued. Daily tasks will reset.')
\ No newline at end of file
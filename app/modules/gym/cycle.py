@@ -0,0 +1,38 @@
+from app.extensions import db
+from app.modules.gym.models import GymProgram, GymRoutine
+
+# A program is a 7-day cycle: one GymRoutine per order_index 1..7. Every
+# path that creates a program fills the week here, so the pages can simply
+# read it; fill_missing_days() repairs older programs at deploy time
+# (migrate_server.py, fix_programs.py).
+
+DAYS = 7
+REST_DAY = 'Rest Day'
+
+
+def fill_week(program, user_id, taken=()):
+    """Adds a Rest Day routine for every day 1..7 not in `taken`; returns how many."""
+    missing = [i for i in range(1, DAYS + 1) if i not in set(taken)]
+    for i in missing:
+        db.session.add(GymRoutine(user_id=user_id, program_id=program.id,
+                                  name=REST_DAY, order_index=i))
+    return len(missing)
+
+
+def fill_missing_days():
+    """Gives every program its 7 days and commits; returns how many were added."""
+    days = {}
+    for program_id, order_index in db.session.query(GymRoutine.program_id, GymRoutine.order_index):
+        days.setdefault(program_id, set()).add(order_index)
+
+    added = sum(fill_week(program, program.user_id, days.get(program.id, ()))
+                for program in GymProgram.query.all())
+    if added:
+        db.session.commit()
+    return added
+
+
+def current_routine(routines, day):
+    """The routine for `day` of the cycle, else the first one (days past the week, gaps)."""
+    by_day = {routine.order_index: routine for routine in routines}
+    return by_day.get(day) or (routines[0] if routines else None)
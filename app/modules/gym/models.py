@@ -9,7 +9,10 @@ class GymProgram(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     routines = db.relationship(
-        'GymRoutine', backref='program', lazy=True, cascade="all, delete-orphan")
+        'GymRoutine', backref='program', lazy=True, cascade="all, delete-orphan",
+        order_by='GymRoutine.order_index')
+
+    __table_args__ = (db.Index('ix_gym_program_user_active', 'user_id', 'is_active'),)
 
 
 class GymExerciseLibrary(db.Model):
@@ -40,6 +43,8 @@ class GymRoutine(db.Model):
     exercises = db.relationship(
         'GymExercise', backref='routine', lazy=True, cascade="all, delete-orphan")
 
+    __table_args__ = (db.Index('ix_gym_routine_program_order', 'program_id', 'order_index'),)
+
 
 class GymExercise(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -57,6 +62,8 @@ class GymExercise(db.Model):
     target_reps = db.Column(db.String(20))
     logs = db.relationship('GymLog', backref='exercise', lazy=True)
 
+    __table_args__ = (db.Index('ix_gym_exercise_routine', 'routine_id'),)
+
 
 class GymLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -67,3 +74,5 @@ class GymLog(db.Model):
     weight_used = db.Column(db.Float)
     reps_done = db.Column(db.Integer)
     is_personal_record = db.Column(db.Boolean, default=False)
+
+    __table_args__ = (db.Index('ix_gym_log_exercise_date', 'exercise_id', 'date'),)
@@ -2,63 +2,59 @@ from datetime import datetime
 import os
 from flask import current_app
 from werkzeug.utils import secure_filename
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import Blueprint, abort, render_template, request, flash, redirect, url_for, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy.orm import selectinload
+from app import caching, state
 from app.extensions import db
+from app.modules.gym import cycle, search
 from app.modules.gym.models import GymRoutine, GymExercise, GymProgram, GymExerciseLibrary
 
 gym_bp = Blueprint('gym', __name__, url_prefix='/gym')
 
+SEARCH_MAX_AGE = 30  # Seconds the browser may reuse an autocomplete answer
+
+# --- QUERIES (shared with check_queries.py, which plans these very calls) ---
+
+
+def active_program(user_id):
+    """The active program, its days and their exercises in three queries."""
+    return GymProgram.query.filter_by(user_id=user_id, is_active=True).options(
+        selectinload(GymProgram.routines).selectinload(GymRoutine.exercises)).first()
+
+
+def load_routine(routine_id):
+    """A day with its exercises and their library media in one more query (None if missing)."""
+    return db.session.get(GymRoutine, routine_id, options=[
+        selectinload(GymRoutine.exercises).joinedload(GymExercise.library_item)])
+
+
+def routine_at(program_id, order_index):
+    return GymRoutine.query.filter_by(program_id=program_id, order_index=order_index).first()
+
+
+def library_item_named(user_id, name):
+    return GymExerciseLibrary.query.filter_by(user_id=user_id, name_en=name).first()
+
 # --- DASHBOARD ---
 
 
 @gym_bp.route('/')
 @login_required
 def index():
-    active_program = GymProgram.query.filter_by(
-        user_id=current_user.id, is_active=True).first()
-
-    # Auto-create default program if none exists
-    if not active_program:
-        # Create program AND the 7 default days
-        active_program = GymProgram(
-            user_id=current_user.id, name="My First Program", is_active=True)
-        db.session.add(active_program)
-        db.session.flush()
+    # Read-only. Programs get their 7 days when they are created (see cycle.fill_week)
+    program = active_program(current_user.id)
 
-        for i in range(1, 8):
-            day = GymRoutine(
-                user_id=current_user.id, program_id=active_program.id, name="Rest Day", order_index=i)
-            db.session.add(day)
-        db.session.commit()
+    routines = program.routines if program else []
 
-    routines = GymRoutine.query.filter_by(
-        program_id=active_program.id).order_by(GymRoutine.order_index).all()
+    # Next Up Logic (a missing day falls back to the first one; nothing is saved)
+    current_day = current_user.current_gym_day or 1
+    next_routine = cycle.current_routine(routines, current_day)
+    if next_routine:
+        current_day = next_routine.order_index
 
-    # Ensure we strictly have 7 days (Self-Healing if data is weird)
-    if len(routines) < 7:
-        current_count = len(routines)
-        for i in range(current_count + 1, 8):
-            new_day = GymRoutine(
-                user_id=current_user.id, program_id=active_program.id, name="Rest Day", order_index=i)
-            db.session.add(new_day)
-        db.session.commit()
-        routines = GymRoutine.query.filter_by(
-            program_id=active_program.id).order_by(GymRoutine.order_index).all()
-
-    # Next Up Logic
-    current_day_idx = current_user.current_gym_day or 1
-    next_routine = GymRoutine.query.filter_by(
-        program_id=active_program.id, order_index=current_day_idx).first()
-
-    # If current day is missing (e.g. index 8), reset to 1
-    if not next_routine:
-        current_user.current_gym_day = 1
-        db.session.commit()
-        next_routine = GymRoutine.query.filter_by(
-            program_id=active_program.id, order_index=1).first()
-
-    return render_template('gym/index.html', routines=routines, next_routine=next_routine, program=active_program)
+    return render_template('gym/index.html', routines=routines, next_routine=next_routine,
+                           program=program, current_day=current_day)
 
 # --- PROGRAM MANAGEMENT ---
 
@@ -85,12 +81,10 @@ def create_program():
         db.session.flush()
 
         # ⚡ AUTO-GENERATE 7 REST DAYS
-        for i in range(1, 8):
-            day = GymRoutine(
-                user_id=current_user.id, program_id=new_prog.id, name="Rest Day", order_index=i)
-            db.session.add(day)
+        cycle.fill_week(new_prog, current_user.id)
 
         current_user.current_gym_day = 1
+        state.touch(current_user.id, 'gym')
         db.session.commit()
         flash(f'Started 7-Day Cycle: {name}', 'success')
 
@@ -107,10 +101,12 @@ def duplicate_program(program_id):
     db.session.flush()
 
     # Duplicate existing days exactly as they are
+    copied = []
     for r in source.routines:
         # Don't duplicate beyond 7 just in case old data was bad
-        if r.order_index > 7:
+        if r.order_index > cycle.DAYS:
             continue
+        copied.append(r.order_index)
 
         new_routine = GymRoutine(user_id=current_user.id, program_id=new_prog.id,
                                  name=r.name, order_index=r.order_index, notes=r.notes)
@@ -121,6 +117,9 @@ def duplicate_program(program_id):
             new_ex = GymExercise(routine_id=new_routine.id, name=ex.name, name_es_display=ex.name_es_display,
                                  target_sets=ex.target_sets, target_reps=ex.target_reps, library_id=ex.library_id)
             db.session.add(new_ex)
+    cycle.fill_week(new_prog, current_user.id, copied)  # Gaps in old data
+
+    state.touch(current_user.id, 'gym')
 
     db.session.commit()
     flash('Program copied successfully!', 'success')
@@ -135,6 +134,7 @@ def activate_program(program_id):
     prog = GymProgram.query.get_or_404(program_id)
     prog.is_active = True
     current_user.current_gym_day = 1
+    state.touch(current_user.id, 'gym')
     db.session.commit()
     return redirect(url_for('gym.index'))
 
@@ -148,6 +148,7 @@ def update_routine_name(routine_id):
     new_name = request.form.get('name')
     if new_name:
         routine.name = new_name
+        state.touch(current_user.id, 'gym')
         db.session.commit()
         flash('Day updated', 'success')
     return redirect(url_for('gym.index'))
@@ -167,13 +168,13 @@ def swap_routine(routine_id, direction):
     if target_idx < 1 or target_idx > 7:
         return redirect(url_for('gym.index'))
 
-    target_r = GymRoutine.query.filter_by(
-        program_id=program_id, order_index=target_idx).first()
+    target_r = routine_at(program_id, target_idx)
 
     if target_r:
         # Swap indices
         current_r.order_index = target_idx
         target_r.order_index = current_idx
+        state.touch(current_user.id, 'gym')
         db.session.commit()
 
     return redirect(url_for('gym.index'))
@@ -183,11 +184,14 @@ def swap_routine(routine_id, direction):
 @login_required
 def skip_day():
     current = current_user.current_gym_day or 1
+    if current > cycle.DAYS:  # Shown as day 1 (see index)
+        current = 1
     # Simple 1-7 loop
-    if current >= 7:
+    if current >= cycle.DAYS:
         current_user.current_gym_day = 1
     else:
         current_user.current_gym_day = current + 1
+    state.touch(current_user.id, 'gym')
     db.session.commit()
     return redirect(url_for('gym.index'))
 
@@ -197,23 +201,24 @@ def skip_day():
 @gym_bp.route('/routine/<int:routine_id>')
 @login_required
 def view_routine(routine_id):
-    routine = GymRoutine.query.get_or_404(routine_id)
+    routine = load_routine(routine_id) or abort(404)
     return render_template('gym/routine_detail.html', routine=routine)
 
 
 @gym_bp.route('/api/search_exercises')
 @login_required
 def search_exercises():
-    query = request.args.get('q', '').lower()
+    query = ' '.join(search.terms(request.args.get('q', '')))
     if not query:
         return jsonify([])
-    results = GymExerciseLibrary.query.filter((GymExerciseLibrary.user_id == current_user.id) & (
-        (GymExerciseLibrary.name_en.ilike(f'%{query}%')) | (GymExerciseLibrary.name_es.ilike(f'%{query}%')))).limit(5).all()
-    data = []
-    for ex in results:
-        data.append({'name_en': ex.name_en, 'name_es': ex.name_es,
-                    'default_sets': ex.default_sets, 'default_reps': ex.default_reps})
-    return jsonify(data)
+    limit = request.args.get('limit', search.DEFAULT_LIMIT, type=int)
+
+    # Each keystroke is its own URL: a repeated prefix comes from the browser cache
+    etag = caching.user_etag(current_user.id, 'exercise-search', query, limit)
+    if caching.is_fresh(etag):
+        return caching.not_modified(etag, SEARCH_MAX_AGE)
+    return caching.tag_response(
+        jsonify(search.search(current_user.id, query, limit)), etag, SEARCH_MAX_AGE)
 
 
 # [Inside app/modules/gym/routes.py]
@@ -241,8 +246,7 @@ def add_exercise(routine_id):
         # CASE 2: User checked "Save as Template" (Create new)
         elif save_to_lib == 'on':
             # Check if it already exists to avoid dupes
-            existing = GymExerciseLibrary.query.filter_by(
-                user_id=current_user.id, name_en=name_input).first()
+            existing = library_item_named(current_user.id, name_input)
             if existing:
                 selected_lib_id = existing.id
             else:
@@ -253,6 +257,7 @@ def add_exercise(routine_id):
                     default_reps=reps or "8-12"
                 )
                 db.session.add(new_lib_item)
+                state.touch(current_user.id, 'gym')
                 db.session.commit()
                 selected_lib_id = new_lib_item.id
 
@@ -266,6 +271,7 @@ def add_exercise(routine_id):
             target_reps=reps or "8-12"
         )
         db.session.add(new_exercise)
+        state.touch(current_user.id, 'gym')
         db.session.commit()
         flash(f'Added {name_input}', 'success')
 
@@ -279,8 +285,7 @@ def promote_exercise(exercise_id):
     ex = GymExercise.query.get_or_404(exercise_id)
 
     # Check if already exists in library
-    existing = GymExerciseLibrary.query.filter_by(
-        user_id=current_user.id, name_en=ex.name).first()
+    existing = library_item_named(current_user.id, ex.name)
 
     if existing:
         ex.library_id = existing.id
@@ -294,10 +299,13 @@ def promote_exercise(exercise_id):
             default_reps=ex.target_reps
         )
         db.session.add(new_lib)
+        state.touch(current_user.id, 'gym')
         db.session.commit()
         ex.library_id = new_lib.id
         flash(f'Saved "{ex.name}" as a new template!', 'success')
 
+    state.touch(current_user.id, 'gym')
+
     db.session.commit()
     return redirect(url_for('gym.view_routine', routine_id=ex.routine_id))
 
@@ -314,6 +322,7 @@ def delete_exercise(exercise_id):
     # 3. Verify ownership
     if exercise.routine.user_id == current_user.id:
         db.session.delete(exercise)
+        state.touch(current_user.id, 'gym')
         db.session.commit()
         flash('Exercise removed', 'success')
 
@@ -360,6 +369,8 @@ def update_library_item(ex_id):
             file.save(os.path.join(upload_folder, filename))
             item.image_filename = filename
 
+    state.touch(current_user.id, 'gym')
+
     db.session.commit()
     flash('Template updated!', 'success')
     return redirect(url_for('gym.library'))
@@ -394,6 +405,7 @@ def delete_library_item(ex_id):
 
     # 👇 STEP 3: DELETE THE TEMPLATE
     db.session.delete(item)
+    state.touch(current_user.id, 'gym')
     db.session.commit()
 
     flash('Template deleted. Past workouts converted to standalone exercises.', 'success')
@@ -0,0 +1,158 @@
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+
+from app import state
+from app.extensions import db
+from app.modules.gym.models import GymExerciseLibrary
+
+# Exercise autocomplete. Each user's library is folded (case and accents
+# dropped, so "press banca" finds "Press de Banca" and "Prés") into a sorted
+# word list held in memory per (user, data version): every library edit
+# touches the version, so the next keystroke rebuilds from one indexed query
+# and the others are a few bisects. Terms match word prefixes; when that
+# leaves the page short, words one edit away (typo, missing or swapped
+# letter) are tried too and ranked after the exact hits.
+
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 20
+MAX_TERMS = 6
+MIN_TYPO_LENGTH = 3  # Shorter terms are one edit away from almost everything
+CACHE_SIZE = 64      # Users
+
+EXACT, PREFIX, TYPO = 0, 1, 2
+WORD_RE = re.compile(r'[^\W_]+')
+
+_cache = OrderedDict()  # user_id -> (version, ExerciseIndex)
+_lock = threading.Lock()
+
+
+def fold(text):
+    """Lower case without accents: 'Prés' -> 'pres'."""
+    text = text or ''
+    if not text.isascii():
+        decomposed = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return text.casefold()
+
+
+def terms(text, limit=MAX_TERMS):
+    return WORD_RE.findall(fold(text))[:limit]
+
+
+def _one_edit(term, alphabet):
+    """Every string one substitution, insertion, deletion or swap away from term."""
+    variants = set()
+    for i in range(len(term)):
+        left, right = term[:i], term[i:]
+        variants.add(left + right[1:])
+        if len(right) > 1:
+            variants.add(left + right[1] + right[0] + right[2:])
+        for c in alphabet:
+            variants.add(left + c + right[1:])
+            variants.add(left + c + right)
+    variants.discard(term)
+    return variants
+
+
+class ExerciseIndex:
+    """One user's library: items plus a sorted word list for prefix lookups."""
+
+    def __init__(self, rows):
+        self.items = []
+        self.names = []  # Folded (name_en, name_es) per item, as space-joined terms
+        postings = {}
+        for ex_id, name_en, name_es, default_sets, default_reps in rows:
+            index = len(self.items)
+            self.items.append({'id': ex_id, 'name_en': name_en, 'name_es': name_es,
+                               'default_sets': default_sets, 'default_reps': default_reps})
+            words_en, words_es = terms(name_en, None), terms(name_es, None)
+            self.names.append((' '.join(words_en), ' '.join(words_es)))
+            for word in words_en + words_es:
+                postings.setdefault(word, set()).add(index)
+        self.words = sorted(postings)
+        self.postings = [postings[word] for word in self.words]
+        self.alphabet = sorted(set(''.join(self.words)))
+        self._typos = {}  # term -> {word positions}, reused across keystrokes
+
+    def _word_range(self, prefix):
+        """Positions of the words starting with prefix."""
+        start = pos = bisect_left(self.words, prefix)
+        while pos < len(self.words) and self.words[pos].startswith(prefix):
+            pos += 1
+        return range(start, pos)
+
+    def _prefix_matches(self, term):
+        """{item: EXACT or PREFIX} for words starting with term."""
+        matches = {}
+        for pos in self._word_range(term):
+            rank = EXACT if self.words[pos] == term else PREFIX
+            for index in self.postings[pos]:
+                matches[index] = min(rank, matches.get(index, rank))
+        return matches
+
+    def _typo_matches(self, term):
+        """{item: TYPO} for words whose start is one edit away from term."""
+        if len(term) < MIN_TYPO_LENGTH:
+            return {}
+        if term not in self._typos:
+            # A word starts with something one edit from term iff it starts with
+            # one of term's variants: a bisect each instead of a pass over all words
+            self._typos[term] = {pos for variant in _one_edit(term, self.alphabet)
+                                 for pos in self._word_range(variant)}
+        return {index: TYPO for pos in self._typos[term] for index in self.postings[pos]}
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Best `limit` items matching every term of the query, best first."""
+        query_terms = terms(query)
+        if not query_terms:
+            return []
+        per_term = [self._prefix_matches(term) for term in query_terms]
+        hits = set.intersection(*(set(m) for m in per_term))
+        if len(hits) < limit:
+            for term, matches in zip(query_terms, per_term):
+                for index, rank in self._typo_matches(term).items():
+                    matches.setdefault(index, rank)
+            hits = set.intersection(*(set(m) for m in per_term))
+
+        whole = ' '.join(query_terms)
+
+        def sort_key(index):
+            ranks = [matches[index] for matches in per_term]
+            name_en, name_es = self.names[index]
+            starts = name_en.startswith(whole) or name_es.startswith(whole)
+            return (ranks.count(TYPO), not starts, sum(ranks), len(name_en), name_en)
+
+        return [self.items[index] for index in heapq.nsmallest(limit, hits, key=sort_key)]
+
+
+def _build(user_id):
+    rows = db.session.query(
+        GymExerciseLibrary.id, GymExerciseLibrary.name_en, GymExerciseLibrary.name_es,
+        GymExerciseLibrary.default_sets, GymExerciseLibrary.default_reps).filter(
+        GymExerciseLibrary.user_id == user_id).all()
+    return ExerciseIndex(rows)
+
+
+def get_index(user_id):
+    """The user's index for their current data version, built on first use."""
+    version = state.get_version(user_id)
+    with _lock:
+        cached = _cache.get(user_id)
+        if cached and cached[0] == version:
+            _cache.move_to_end(user_id)
+            return cached[1]
+    index = _build(user_id)  # Outside the lock; a concurrent build just wins last
+    with _lock:
+        _cache[user_id] = (version, index)
+        _cache.move_to_end(user_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+
+def search(user_id, query, limit=DEFAULT_LIMIT):
+    return get_index(user_id).search(query, max(1, min(limit, MAX_LIMIT)))
@@ -0,0 +1,169 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import recurrence, state
+from app.extensions import db
+from app.models import Task, TaskHistory
+
+# Task mutations shared by the single-task routes and /api/tasks/batch.
+# None of these commit: the caller owns the transaction.
+
+
+class OpError(Exception):
+    """A mutation that can't be applied (bad input, missing or foreign task)."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def parse_datetime(value):
+    """'2026-02-08T08:00' or '2026-02-08T08:00:00' -> datetime (None if missing/invalid)."""
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise OpError('datetime must be a string like 2026-02-08T08:00')
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            # Fallback: add seconds if missing
+            return datetime.fromisoformat(value + ':00')
+        except ValueError:
+            return None
+
+
+def _checked(data, field, kind, name):
+    """data[field] if missing/None or of the given type; OpError (400) for anything else."""
+    value = data.get(field)
+    if value is not None and not isinstance(value, kind):
+        raise OpError(f'{field} must be {name}')
+    return value
+
+
+def _check_fields(data):
+    """JSON bodies are client input: wrong types become 400s, not errors at flush."""
+    if not isinstance(data, dict):
+        raise OpError('Expected a JSON object')
+    for field in ('content', 'priority', 'category', 'color', 'recurrence'):
+        _checked(data, field, str, 'a string')
+    _checked(data, 'is_habit', bool, 'true or false')
+
+
+def get_owned_task(task_id, user_id):
+    task = db.session.get(Task, task_id)
+    if not task or task in db.session.deleted:
+        raise OpError('Task not found', 404)
+    if task.user_id != user_id:
+        raise OpError('Unauthorized', 403)
+    return task
+
+
+def parse_recurrence(value):
+    try:
+        return recurrence.normalize(value)
+    except ValueError as e:
+        raise OpError(str(e))
+
+
+def create_task(user_id, data):
+    _check_fields(data)
+    if not data.get('content'):
+        raise OpError('content is required')
+    task = Task(
+        content=data['content'],
+        priority=data.get('priority', 'normal'),
+        category=data.get('category', 'general'),
+        color=data.get('color', '#3b5bdb'),
+        recurrence=parse_recurrence(data.get('recurrence')),
+        is_habit=bool(data.get('is_habit')),
+        due_date=parse_datetime(data.get('datetime')),
+        user_id=user_id
+    )
+    db.session.add(task)
+    db.session.flush()  # Assigns the id
+    state.touch(user_id, 'tasks', {'id': task.id})
+    return task
+
+
+def complete_task(task):
+    """Marks a task done. Habits and recurring tasks also get today's TaskHistory row,
+    which is what makes a recurring task done for its current period."""
+    task.complete = True
+    task.last_completed = datetime.now()
+    if task.is_habit or recurrence.is_recurring(task):
+        add_history(task, date.today())
+    state.touch(task.user_id, 'tasks', {'id': task.id})
+    return task
+
+
+def toggle_task(task):
+    if recurrence.is_recurring(task):
+        recurrence.annotate([task])  # complete = done for the current period
+    if not task.complete:
+        return complete_task(task)
+
+    task.complete = False
+    if recurrence.is_recurring(task) and recurrence.clear_period(task):
+        state.touch(task.user_id, 'history', {'id': task.id})
+    state.touch(task.user_id, 'tasks', {'id': task.id})
+    return task
+
+
+def edit_task(task, data):
+    """Updates the given fields; anything missing from data is left as is."""
+    _check_fields(data)
+    for field in ('content', 'priority', 'color', 'category', 'is_habit'):
+        if field in data:
+            setattr(task, field, data[field])
+    if 'recurrence' in data:
+        task.recurrence = parse_recurrence(data['recurrence'])
+    if not task.content:
+        raise OpError('content is required')
+
+    due_date = parse_datetime(data.get('datetime'))
+    if due_date:  # Invalid/missing – keep existing due_date
+        if due_date != task.due_date:
+            task.snooze_until = None  # A new due time replaces any snoozed reminder
+        task.due_date = due_date
+
+    state.touch(task.user_id, 'tasks', {'id': task.id})
+    return task
+
+
+def snooze_task(task, delay=timedelta(hours=1)):
+    """Pushes the task's next reminder back by delay (from now)."""
+    task.snooze_until = datetime.now() + delay
+    state.touch(task.user_id, 'tasks', {'id': task.id})
+    return task.snooze_until
+
+
+def delete_task(task):
+    task_id = task.id
+    db.session.delete(task)
+    state.touch(task.user_id, 'tasks', {'id': task_id})
+    return task_id
+
+
+def add_history(task, day):
+    """Records a completion for a day (date or 'YYYY-MM-DD'). False if already there."""
+    if isinstance(day, str):
+        try:
+            day = datetime.strptime(day, '%Y-%m-%d').date()
+        except ValueError:
+            raise OpError('date must be YYYY-MM-DD')
+    elif not isinstance(day, date):
+        raise OpError('date must be YYYY-MM-DD')
+    exists = TaskHistory.query.filter_by(task_id=task.id, completed_date=day).first()
+    if exists:
+        return False
+    try:
+        # Another process may record the same day in between: the unique index decides
+        with db.session.begin_nested():
+            db.session.add(TaskHistory(task_id=task.id, completed_date=day, user_id=task.user_id))
+    except IntegrityError:
+        return False
+    state.touch(task.user_id, 'history', {'id': task.id})
+    return True
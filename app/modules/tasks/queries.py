@@ -0,0 +1,144 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from app import recurrence
+from app.extensions import db
+from app.models import Task
+
+# Shared task queries for the dashboard page and the tasks API.
+
+# Dashboard / list order. id breaks ties so keyset pagination is stable.
+LIST_ORDER = (Task.complete, Task.due_date, Task.id)
+
+
+def visible_clause(today_start):
+    """Incomplete, recurring, or completed today (legacy NULL recurrence counts as recurring)."""
+    return db.or_(
+        Task.complete == False,
+        Task.recurrence.is_(None),
+        Task.recurrence != 'none',
+        Task.last_completed >= today_start,
+    )
+
+
+def archived_clause(today_start):
+    """One-off tasks completed before today: everything visible_clause hides."""
+    return db.and_(
+        Task.complete == True,
+        Task.recurrence == 'none',
+        db.or_(Task.last_completed.is_(None), Task.last_completed < today_start),
+    )
+
+
+def list_key(task):
+    """LIST_ORDER in Python, for lists re-sorted after recurrence.annotate()."""
+    return (bool(task.complete), task.due_date is not None, task.due_date or datetime.min, task.id)
+
+
+def visible_tasks(user_id, today=None):
+    today = today or date.today()
+    today_start = datetime.combine(today, datetime.min.time())
+    tasks = Task.query.filter(Task.user_id == user_id, visible_clause(today_start)).all()
+    # Recurring tasks show their current occurrence, so the order is only known afterwards
+    return sorted(recurrence.annotate(tasks, today), key=list_key)
+
+
+def category_progress(user_id, today=None):
+    """{category: (tasks, done)} for the progress rings.
+
+    One-off tasks are counted in one GROUP BY on the stored flag; recurring
+    tasks keep complete=True once done, so they are judged by their current
+    period instead (recurrence.annotate: one history query).
+    """
+    category = db.func.coalesce(Task.category, 'general')
+    rows = db.session.query(
+        category, db.func.count(Task.id), db.func.sum(db.case((Task.complete == True, 1), else_=0)),
+    ).filter(Task.user_id == user_id, recurrence.one_off_clause()).group_by(category).all()
+    totals = {cat: [total, done or 0] for cat, total, done in rows}
+
+    recurring = Task.query.filter(Task.user_id == user_id, recurrence.recurring_clause()).all()
+    for task in recurrence.annotate(recurring, today):
+        counts = totals.setdefault(task.category or 'general', [0, 0])
+        counts[0] += 1
+        counts[1] += bool(task.complete)
+    return {cat: tuple(counts) for cat, counts in totals.items()}
+
+
+# --- KEYSET PAGINATION over (complete, due_date, id) ---
+
+
+def encode_cursor(task):
+    key = [int(bool(task.complete)), task.due_date.isoformat() if task.due_date else None, task.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns (complete, due_date, id); raises ValueError on a malformed cursor."""
+    try:
+        complete, due, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return bool(complete), datetime.fromisoformat(due) if due else None, int(task_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f"bad cursor: {e}")
+
+
+def after_cursor(complete, due_date, task_id):
+    """Rows strictly after the key in LIST_ORDER (SQLite sorts NULL due dates first)."""
+    if due_date is None:
+        same_complete = db.or_(Task.due_date.isnot(None),
+                               db.and_(Task.due_date.is_(None), Task.id > task_id))
+    else:
+        same_complete = db.or_(Task.due_date > due_date,
+                               db.and_(Task.due_date == due_date, Task.id > task_id))
+    # Booleans only support equality in SQLAlchemy: "complete > False" is "complete == True"
+    later_group = db.false() if complete else Task.complete == True
+    return db.or_(later_group, db.and_(Task.complete == complete, same_complete))
+
+
+def list_page(user_id, clause, cursor=None, limit=50):
+    """One page of tasks in LIST_ORDER -> (tasks, next_cursor or None).
+
+    Pages are keyed on the stored columns; recurring tasks are annotated with
+    their current occurrence afterwards, so they sort by their series anchor.
+    """
+    query = Task.query.filter(Task.user_id == user_id, clause)
+    if cursor:
+        query = query.filter(after_cursor(*decode_cursor(cursor)))
+    rows = query.order_by(*LIST_ORDER).limit(limit + 1).all()
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(rows) > limit else None
+    return recurrence.annotate(page), next_cursor
+
+
+# --- SERIALIZATION ---
+
+
+def due_label(task, today=None):
+    """'3d overdue' / 'Today' / 'Tomorrow' / '5d left' ('' without a due date)."""
+    if not task.due_date:
+        return ""
+    days_left = (task.due_date.date() - (today or date.today())).days
+    if days_left < 0:
+        return f"{abs(days_left)}d overdue"
+    if days_left == 0:
+        return "Today"
+    if days_left == 1:
+        return "Tomorrow"
+    return f"{days_left}d left"
+
+
+def task_to_dict(task, today=None):
+    return {
+        'id': task.id,
+        'content': task.content,
+        'priority': task.priority,
+        'category': task.category or 'general',
+        'color': task.color,
+        'recurrence': task.recurrence,
+        'is_habit': bool(task.is_habit),
+        'complete': bool(task.complete),
+        'due_date': task.due_date.isoformat() if task.due_date else None,
+        'last_completed': task.last_completed.isoformat() if task.last_completed else None,
+        'due_label': due_label(task, today),
+    }
@@ -1,10 +1,12 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_login import login_required, current_user
 from datetime import date, timedelta, datetime  # ← Added full datetime import
 import calendar
 
+from app import caching, habit_image, habits, recurrence
 from app.extensions import db
-from app.models import Task, TaskHistory
+from app.models import Task
+from app.modules.tasks import ops, queries, search
 
 # New Blueprint for the separate Tasks/Reminders app
 tasks_bp = Blueprint('tasks', __name__, url_prefix='/api/tasks')  # Prefix keeps URLs the same (/api/tasks/*)
@@ -15,30 +17,10 @@ tasks_bp = Blueprint('tasks', __name__, url_prefix='/api/tasks')  # Prefix keeps
 @tasks_bp.route('/add', methods=['POST'])
 @login_required
 def add_task():
-    data = request.json
-    due_datetime = None
-    if data.get('datetime'):
-        try:
-            # JS sends format like '2026-02-08T08:00' or '2026-02-08T08:00:00'
-            due_datetime = datetime.fromisoformat(data['datetime'])
-        except ValueError:
-            try:
-                # Fallback: add seconds if missing
-                due_datetime = datetime.fromisoformat(data['datetime'] + ':00')
-            except ValueError:
-                pass  # Invalid format – ignore
-
-    new_task = Task(
-        content=data['content'],
-        priority=data.get('priority', 'normal'),
-        category=data.get('category', 'general'),
-        color=data.get('color', '#3b5bdb'),
-        recurrence=data.get('recurrence', 'none'),
-        is_habit=data.get('is_habit', False),
-        due_date=due_datetime,
-        user_id=current_user.id  # ← Fixed: Use user_id (matches model column)
-    )
-    db.session.add(new_task)
+    try:
+        new_task = ops.create_task(current_user.id, request.json)
+    except ops.OpError as e:
+        return jsonify({'success': False, 'error': e.message}), e.status
     db.session.commit()
     return jsonify({'success': True, 'id': new_task.id})
 
@@ -50,32 +32,11 @@ def toggle_task(id):
     if task.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
 
-    task.complete = not task.complete
-    new_date_label = ""
-
-    if task.complete:
-        task.last_completed = datetime.now()
-        if task.is_habit:
-            today = date.today()
-            exists = TaskHistory.query.filter_by(
-                task_id=task.id, completed_date=today).first()
-            if not exists:
-                history = TaskHistory(
-                    task_id=task.id, completed_date=today, user_id=current_user.id)
-                db.session.add(history)
-
+    ops.toggle_task(task)
     db.session.commit()
 
-    if task.due_date:
-        days_left = (task.due_date.date() - date.today()).days
-        if days_left < 0:
-            new_date_label = f"{abs(days_left)}d overdue"
-        elif days_left == 0:
-            new_date_label = "Today"
-        elif days_left == 1:
-            new_date_label = "Tomorrow"
-        else:
-            new_date_label = f"{days_left}d left"
+    recurrence.annotate([task])  # The commit expired the current-occurrence values
+    new_date_label = queries.due_label(task)
 
     return jsonify({'success': True, 'new_state': task.complete, 'priority': task.priority, 'new_date_label': new_date_label})
 
@@ -86,7 +47,7 @@ def delete_task(id):
     task = Task.query.get_or_404(id)
     if task.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
-    db.session.delete(task)
+    ops.delete_task(task)
     db.session.commit()
     return jsonify({'success': True})
 
@@ -97,24 +58,11 @@ def edit_task(id):
     task = Task.query.get_or_404(id)
     if task.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
-    data = request.json
-
-    task.content = data['content']
-    task.priority = data['priority']
-    task.color = data['color']
-    task.recurrence = data['recurrence']
-    task.category = data['category']
-    task.is_habit = data['is_habit']
-
-    if data.get('datetime'):
-        try:
-            task.due_date = datetime.fromisoformat(data['datetime'])
-        except ValueError:
-            try:
-                task.due_date = datetime.fromisoformat(data['datetime'] + ':00')
-            except ValueError:
-                pass  # Invalid – keep existing due_date
-
+    try:
+        ops.edit_task(task, request.json)
+    except ops.OpError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': e.message}), e.status
     db.session.commit()
     return jsonify({'success': True})
 
@@ -125,76 +73,255 @@ def add_history(id):
     task = Task.query.get_or_404(id)
     if task.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
-    data = request.json
-    date_str = data.get('date')
+    date_str = request.json.get('date')
     if date_str:
         try:
-            history_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            exists = TaskHistory.query.filter_by(
-                task_id=task.id, completed_date=history_date).first()
-            if not exists:
-                new_history = TaskHistory(
-                    task_id=task.id, completed_date=history_date, user_id=current_user.id)
-                db.session.add(new_history)
+            if ops.add_history(task, date_str):
                 db.session.commit()
                 return jsonify({'success': True})
-        except ValueError:
+        except ops.OpError:
             pass
     return jsonify({'success': False})
 
 
+# --- BATCH: many mutations, one transaction ---
+
+BATCH_MAX_OPS = 500
+
+
+def _resolve_id(value, results):
+    """Task ids may reference an earlier create in the batch as "$<index>"."""
+    if isinstance(value, str) and value.startswith('$'):
+        try:
+            return results[int(value[1:])]['id']
+        except (ValueError, IndexError, KeyError):
+            raise ops.OpError(f'Bad reference {value}')
+    if not isinstance(value, int):
+        raise ops.OpError('id must be an integer or "$<index>"')
+    return value
+
+
+def _apply_op(op, results):
+    action = op.get('op')
+    if action == 'create':
+        task = ops.create_task(current_user.id, op)
+        return {'ok': True, 'id': task.id}
+
+    task = ops.get_owned_task(_resolve_id(op.get('id'), results), current_user.id)
+    if action == 'toggle':
+        ops.toggle_task(task)
+        return {'ok': True, 'id': task.id, 'new_state': task.complete,
+                'new_date_label': queries.due_label(task)}
+    if action == 'edit':
+        ops.edit_task(task, op)
+        return {'ok': True, 'id': task.id}
+    if action == 'delete':
+        return {'ok': True, 'id': ops.delete_task(task)}
+    if action == 'history_add':
+        return {'ok': True, 'id': task.id, 'added': ops.add_history(task, op.get('date', ''))}
+    raise ops.OpError(f'Unknown op {action!r}')
+
+
+@tasks_bp.route('/batch', methods=['POST'])
+@login_required
+def batch_tasks():
+    """Applies an ordered list of ops atomically: all of them commit, or none.
+
+    Body: {"ops": [{"op": "create", "content": ...}, {"op": "toggle", "id": "$0"}, ...]}
+    Ops: create, toggle, edit, delete, history_add.
+    """
+    payload = request.get_json(silent=True) or {}
+    operations = payload.get('ops') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'success': False, 'error': 'Expected {"ops": [...]}'}), 400
+    if len(operations) > BATCH_MAX_OPS:
+        return jsonify({'success': False, 'error': f'At most {BATCH_MAX_OPS} ops per batch'}), 400
+
+    results = []
+    for index, op in enumerate(operations):
+        try:
+            if not isinstance(op, dict):
+                raise ops.OpError('Each op must be an object')
+            results.append(_apply_op(op, results))
+        except ops.OpError as e:
+            db.session.rollback()
+            results.append({'ok': False, 'error': e.message})
+            return jsonify({'success': False, 'failed_index': index, 'results': results}), e.status
+
+    db.session.commit()  # One commit (one fsync) for the whole batch
+    return jsonify({'success': True, 'results': results})
+
+
+@tasks_bp.route('/list')
+@login_required
+def list_tasks():
+    """Keyset-paginated task list: ?scope=visible|archive&cursor=...&limit=50"""
+    today_start = datetime.combine(date.today(), datetime.min.time())
+    scope = request.args.get('scope', 'visible')
+    if scope == 'visible':
+        clause = queries.visible_clause(today_start)
+    elif scope == 'archive':
+        clause = queries.archived_clause(today_start)
+    else:
+        return jsonify({'error': 'Unknown scope'}), 400
+
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    try:
+        page, next_cursor = queries.list_page(
+            current_user.id, clause, request.args.get('cursor'), limit)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    today = today_start.date()
+    return jsonify({'tasks': [queries.task_to_dict(t, today) for t in page],
+                    'next_cursor': next_cursor})
+
+
+@tasks_bp.route('/search')
+@login_required
+def search_tasks():
+    """Ranked full-text search with filters, keyset-paginated.
+
+    ?q=words &category= &priority= &habit=true|false &status=open|done
+    &due_from=YYYY-MM-DD &due_to=YYYY-MM-DD &cursor=... &limit=50
+    """
+    etag = caching.user_etag(current_user.id, 'search', request.query_string.decode())
+    if caching.is_fresh(etag):
+        return caching.not_modified(etag)
+
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    try:
+        tasks, next_cursor = search.search(current_user.id, request.args, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    today = date.today()
+    return caching.tag_response(jsonify({
+        'tasks': [queries.task_to_dict(t, today) for t in tasks],
+        'next_cursor': next_cursor}), etag)
+
+
 # Task-specific stats (heatmap/radial)
+CHART_CATEGORIES = ['general', 'work', 'personal', 'dev', 'health']
+
+
 @tasks_bp.route('/charts')
 @login_required
 def stats_charts():
-    # 1. Radial
-    categories = ['general', 'work', 'personal', 'dev', 'health']
+    # Most refreshes are no-ops: answer them before any aggregation runs
+    etag = caching.user_etag(current_user.id, 'charts')
+    if caching.is_fresh(etag):
+        return caching.not_modified(etag)
+
+    # 1. Radial: every category the user has (recurring tasks by their current period)
+    today = date.today()
+    totals = queries.category_progress(current_user.id, today)
+
+    # Fixed five first (stable ring colors), then any custom categories
+    categories = CHART_CATEGORIES + sorted(c for c in totals if c not in CHART_CATEGORIES)
     radial_values = []
-    radial_labels = [c.capitalize() for c in categories]
     for cat in categories:
-        cat_tasks = Task.query.filter_by(
-            user_id=current_user.id, category=cat).all()
-        total = len(cat_tasks)
-        if total == 0:
-            radial_values.append(None)
-        else:
-            completed = len([t for t in cat_tasks if t.complete])
-            percent = int((completed / total) * 100)
-            radial_values.append(percent)
+        total, done = totals.get(cat, (0, 0))
+        radial_values.append(int((done / total) * 100) if total else None)
+    radial_labels = [c.capitalize() for c in categories]
 
-    # 2. Heatmap (Current Month)
-    habits = Task.query.filter_by(user_id=current_user.id, is_habit=True).all()
-    heatmap_data = []
-    today = date.today()
+    # 2. Heatmap (Current Month): the month's slice of every habit's bitmap
     first_day = today.replace(day=1)
-    last_day_num = calendar.monthrange(today.year, today.month)[1]
-    last_day = today.replace(day=last_day_num)
-    days_in_month = (last_day - first_day).days + 1
-
-    for habit in habits:
-        habit_obj = {'id': habit.id, 'name': habit.content,
-                     'color': habit.color, 'data': []}
-        history = TaskHistory.query.filter(
-            TaskHistory.task_id == habit.id,
-            TaskHistory.completed_date >= first_day,
-            TaskHistory.completed_date <= last_day).all()
-        completed_dates = {h.completed_date.strftime('%Y-%m-%d') for h in history}
-        for i in range(days_in_month):
-            d = first_day + timedelta(days=i)
-            d_str = d.strftime('%Y-%m-%d')
-            is_done = d_str in completed_dates
-            is_future = d > today
-            habit_obj['data'].append({
-                'x': i,
-                'y': 100 if is_done else 0,
-                'real_date': d_str,
-                'fillColor': habit.color,
-                'is_future': is_future
-            })
-        heatmap_data.append(habit_obj)
-
-    return jsonify({
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    last_day = today.replace(day=days_in_month)
+
+    habit_tasks = Task.query.filter_by(user_id=current_user.id, is_habit=True).all()
+    habit_ids = [h.id for h in habit_tasks]
+    bitmaps = habits.load_range(current_user.id, habit_ids, first_day, last_day)
+
+    # Streaks / week / month rollups: one PK lookup per habit, whatever the history length
+    stats = habits.load_stats(habit_ids, today)
+
+    # Compact payload: per-habit day indexes instead of one object per day
+    heatmap_data = [{'id': h.id, 'name': h.content, 'color': h.color,
+                     'done': habits.bit_indexes(bitmaps[h.id]), 'stats': stats[h.id]}
+                    for h in habit_tasks]
+
+    return caching.tag_response(jsonify({
         'radial': radial_values,
         'radial_labels': radial_labels,
+        'month': {'start': first_day.isoformat(), 'days': days_in_month,
+                  'today': (today - first_day).days},
         'heatmap': heatmap_data
-    })
\ No newline at end of file
+    }), etag)
+
+
+CALENDAR_MAX_DAYS = 92
+
+
+@tasks_bp.route('/calendar')
+@login_required
+def task_calendar():
+    """Task occurrences per day (?days=30 from today, or ?start=&end=), recurring ones expanded."""
+    args = request.args
+    if not args.get('start'):
+        # Looks ahead, unlike the heatmaps' ?days=
+        today = date.today()
+        days = request.args.get('days', 30, type=int)
+        args = {'start': today.isoformat(), 'end': (today + timedelta(days=days - 1)).isoformat()}
+    date_range = habits.parse_range(args, max_days=CALENDAR_MAX_DAYS)
+    if date_range is None:
+        return jsonify({'error': 'Invalid range'}), 400
+    start, end = date_range
+    etag = caching.user_etag(current_user.id, 'calendar', start, end)
+    if caching.is_fresh(etag):
+        return caching.not_modified(etag)
+
+    days = recurrence.calendar(current_user.id, start, end)
+    return caching.tag_response(jsonify({'start': start.isoformat(), 'end': end.isoformat(),
+                                         'days': days}), etag)
+
+
+@tasks_bp.route('/heatmap')
+@login_required
+def habit_heatmap():
+    """Any-range habit heatmap (?days=30|90|365 or ?start=&end=) from the bitmaps."""
+    date_range = habits.parse_range(request.args)
+    if date_range is None:
+        return jsonify({'error': 'Invalid range'}), 400
+    start, end = date_range
+    etag = caching.user_etag(current_user.id, 'heatmap', start, end, request.args.get('format'))
+    if caching.is_fresh(etag):
+        return caching.not_modified(etag)
+
+    habit_tasks = Task.query.filter_by(user_id=current_user.id, is_habit=True).all()
+    bitmaps = habits.load_range(current_user.id, [h.id for h in habit_tasks], start, end)
+    as_bitmap = request.args.get('format') == 'bitmap'
+    num_days = (end - start).days + 1
+
+    data = []
+    for h in habit_tasks:
+        entry = {'id': h.id, 'name': h.content, 'color': h.color}
+        if as_bitmap:
+            # Little-endian bit string, bit i = start + i days
+            entry['bits'] = bitmaps[h.id].to_bytes((num_days + 7) // 8, 'little').hex()
+        else:
+            entry['done'] = habits.bit_indexes(bitmaps[h.id])
+        data.append(entry)
+
+    return caching.tag_response(jsonify({'start': start.isoformat(), 'end': end.isoformat(),
+                                         'days': num_days, 'heatmap': data}), etag)
+
+
+@tasks_bp.route('/habits.png')
+@login_required
+def habit_image_png():
+    """The briefing's habit grid as a PNG (?days=14 default, up to 92, or ?start=&end=)."""
+    args = request.args if request.args else {'days': habit_image.DEFAULT_DAYS}
+    date_range = habits.parse_range(args, max_days=habit_image.MAX_DAYS)
+    if date_range is None:
+        return jsonify({'error': 'Invalid range'}), 400
+    start, end = date_range
+    etag = caching.user_etag(current_user.id, 'habit-image', start, end)
+    if caching.is_fresh(etag):
+        return caching.not_modified(etag)
+
+    png = habit_image.get_png(current_user.id, start, end)
+    if png is None:
+        return jsonify({'error': 'No habits yet'}), 404
+    return caching.tag_response(Response(png, mimetype='image/png'), etag)
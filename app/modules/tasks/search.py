@@ -0,0 +1,156 @@
+import base64
+import binascii
+import json
+import re
+from datetime import date, datetime, time
+
+from sqlalchemy import column, table
+
+from app import recurrence
+from app.extensions import db
+from app.models import Task
+from app.modules.tasks import queries
+
+# Server-side task search. Text goes through an FTS5 external-content table
+# (task_fts, rowid = task.id) that triggers keep in step with task.content,
+# so the text is stored once and no write path has to remember the index.
+# Filters are plain column predicates; without a text query they run as the
+# usual keyset-paginated list, with one they narrow the ranked matches.
+
+SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5("
+    "content, content='task', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_insert AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_delete AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_update AFTER UPDATE OF content ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO task_fts(rowid, content) VALUES (new.id, new.content); END",
+)
+TRIGGERS = ('task_fts_insert', 'task_fts_delete', 'task_fts_update')
+REBUILD = "INSERT INTO task_fts(task_fts) VALUES ('rebuild')"
+
+MAX_TERMS = 8
+WORD_RE = re.compile(r'\w+')
+
+task_fts = table('task_fts', column('rowid'), column('rank'), column('task_fts'))
+
+
+def ensure_fts():
+    """Creates the search index and its triggers if missing, filling a new index."""
+    with db.engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'task_fts'").first()
+        for statement in SCHEMA:
+            conn.exec_driver_sql(statement)
+        if not exists:
+            conn.exec_driver_sql(REBUILD)
+            print("🔎 Task search index built.")
+
+
+def match_query(text):
+    """User text -> FTS5 query: every word must match a word prefix ("buy mil" finds "Buy milk")."""
+    words = WORD_RE.findall(text)[:MAX_TERMS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+# --- FILTERS ---
+
+
+def _flag(value):
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'expected true/false, got {value!r}')
+
+
+def parse_filters(args):
+    """Query-string filters -> (SQL clauses, check for annotated recurring tasks).
+
+    Stored complete/due_date are only meaningful for one-off tasks, so those
+    clauses let recurring tasks through and check() judges them by their
+    current state and occurrences. Raises ValueError on bad values.
+    """
+    clauses = []
+    category, priority = args.get('category'), args.get('priority')
+    if category:
+        clauses.append(Task.category == category if category != 'general' else
+                       db.or_(Task.category == 'general', Task.category.is_(None)))
+    if priority:
+        clauses.append(Task.priority == priority)
+    if args.get('habit'):
+        clauses.append(Task.is_habit == _flag(args['habit']))
+
+    status = args.get('status')
+    if status not in (None, '', 'open', 'done'):
+        raise ValueError('status must be open or done')
+    complete = status == 'done' if status else None
+    if complete is not None:
+        clauses.append(db.or_(recurrence.recurring_clause(), Task.complete == complete))
+
+    due_from = date.fromisoformat(args['due_from']) if args.get('due_from') else None
+    due_to = date.fromisoformat(args['due_to']) if args.get('due_to') else None
+    start = datetime.combine(due_from or date.min, time.min)
+    end = datetime.combine(due_to or date.max, time.max)
+    if due_from or due_to:
+        clauses.append(db.or_(recurrence.recurring_clause(),
+                              db.and_(Task.due_date >= start, Task.due_date <= end)))
+
+    def check(task):
+        if not recurrence.is_recurring(task):
+            return True
+        if complete is not None and bool(task.complete) != complete:
+            return False
+        if due_from or due_to:
+            return bool(recurrence.periods_between(
+                task.recurrence, recurrence.anchor_of(task), start, end))
+        return True
+
+    return clauses, check
+
+
+# --- RANKED PAGES over (rank, id) ---
+
+
+def encode_cursor(rank, task_id):
+    return base64.urlsafe_b64encode(json.dumps([rank, task_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        rank, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(task_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f"bad cursor: {e}")
+
+
+def search(user_id, args, limit=50):
+    """One page of matching tasks -> (tasks, next_cursor or None).
+
+    With ?q= the page is ranked by bm25 (best first), otherwise it is the
+    dashboard order. Pages can come back short when recurring tasks fail
+    the filters; keep following next_cursor. Raises ValueError on bad input.
+    """
+    clauses, check = parse_filters(args)
+    cursor = args.get('cursor')
+    text = match_query(args.get('q', ''))
+
+    if not text:
+        clause = db.and_(*clauses) if clauses else db.true()  # and_() of nothing is deprecated
+        page, next_cursor = queries.list_page(user_id, clause, cursor, limit)
+        return [task for task in page if check(task)], next_cursor
+
+    query = db.session.query(Task, task_fts.c.rank).join(
+        task_fts, task_fts.c.rowid == Task.id).filter(
+        task_fts.c.task_fts.op('MATCH')(text), Task.user_id == user_id, *clauses)
+    if cursor:
+        rank, task_id = decode_cursor(cursor)
+        query = query.filter(db.or_(task_fts.c.rank > rank,
+                                    db.and_(task_fts.c.rank == rank, Task.id > task_id)))
+    rows = query.order_by(task_fts.c.rank, Task.id).limit(limit + 1).all()
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1][1], page[-1][0].id) if len(rows) > limit else None
+    tasks = recurrence.annotate([task for task, _ in page])
+    return [task for task in tasks if check(task)], next_cursor
@@ -0,0 +1,39 @@
+import hmac
+
+from flask import Blueprint, abort, request
+from telebot.types import Update
+
+from app import telegram_bot
+
+telegram_bp = Blueprint('telegram', __name__, url_prefix='/telegram')
+
+# Telegram caps updates at well under this; anything bigger isn't from Telegram
+MAX_UPDATE_BYTES = 1024 * 1024
+
+
+@telegram_bp.route('/webhook', methods=['POST'])
+def webhook():
+    """Bot updates pushed by Telegram (TELEGRAM_MODE=webhook).
+
+    Telegram echoes the secret given to setWebhook in a header, which is
+    the only thing that tells its requests apart from anyone else's.
+    """
+    if not telegram_bot.webhook_enabled():
+        abort(404)
+
+    secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(secret.encode(), telegram_bot.WEBHOOK_SECRET.encode()):
+        abort(403)
+    if (request.content_length or 0) > MAX_UPDATE_BYTES:
+        abort(413)
+
+    try:
+        update = Update.de_json(request.get_data(as_text=True))
+    except (ValueError, KeyError, TypeError):
+        update = None
+    if update is None:
+        abort(400)
+
+    # Same handlers as polling: handle_query answers the click and queues the work
+    telegram_bot.bot.process_new_updates([update])
+    return '', 200
@@ -0,0 +1,201 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+from telebot.apihelper import ApiHTTPException, ApiTelegramException
+
+# Outbound Telegram queue. Callers (request handlers, scheduler jobs) only
+# enqueue; one worker thread per process does the HTTP calls while keeping
+# under Telegram's limits (~30 msg/s per bot, ~1 msg/s per private chat,
+# 20 msg/min per group). 429s and 5xx/network errors are retried with
+# backoff without holding up other chats, and queued text messages to the
+# same chat are merged into one send.
+
+QUEUE_SIZE = int(os.getenv('TELEGRAM_OUTBOX_SIZE', '1000'))
+GLOBAL_INTERVAL = 1 / 30       # Seconds between any two sends
+PRIVATE_CHAT_INTERVAL = 1.0    # Positive chat ids
+GROUP_CHAT_INTERVAL = 3.0      # Negative chat ids (groups/channels)
+MAX_ATTEMPTS = 5
+MAX_BACKOFF = 60
+MAX_TEXT_LENGTH = 4096         # Telegram's limit, caps coalescing
+LATENCY_SAMPLES = 200
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_lock = threading.Lock()
+_started = False
+_stats = {'sent': 0, 'failed': 0, 'dropped': 0, 'retried': 0, 'coalesced': 0}
+_latencies = deque(maxlen=LATENCY_SAMPLES)  # (queued -> delivered ms, HTTP call ms)
+_pending_count = 0  # Taken off the queue by the worker but not finished yet
+
+
+class _Outgoing:
+    __slots__ = ('send', 'chat_id', 'kwargs', 'queued_at', 'attempts')
+
+    def __init__(self, send, chat_id, kwargs):
+        self.send = send
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.queued_at = time.monotonic()
+        self.attempts = 0
+
+    def can_merge(self, other):
+        """Plain text messages with the same formatting can go out as one."""
+        return (self.send == other.send
+                and set(self.kwargs) == {'text', 'parse_mode'} == set(other.kwargs)
+                and self.kwargs['parse_mode'] == other.kwargs['parse_mode']
+                and len(self.kwargs['text']) + len(other.kwargs['text']) + 2 <= MAX_TEXT_LENGTH)
+
+
+def enqueue(send, chat_id, **kwargs):
+    """Queues send(chat_id, **kwargs) (e.g. bot.send_message). False if it had to be dropped."""
+    if not chat_id:
+        print("⚠️ Telegram: no chat id, message not sent.")
+        return False
+    _start_worker()
+    try:
+        _queue.put_nowait(_Outgoing(send, chat_id, kwargs))
+        return True
+    except queue.Full:
+        with _lock:
+            _stats['dropped'] += 1
+        print(f"❌ Telegram outbox full ({QUEUE_SIZE}), message to {chat_id} dropped.")
+        return False
+
+
+def stats():
+    """Queue depth, counters and latency percentiles for the dev panel."""
+    with _lock:
+        data = dict(_stats)
+        samples = list(_latencies)
+        data['depth'] = _queue.qsize() + _pending_count
+    data['capacity'] = QUEUE_SIZE
+    for name, values in (('latency_ms', [s[0] for s in samples]),
+                         ('send_ms', [s[1] for s in samples])):
+        values.sort()
+        data[name] = {
+            'p50': round(values[len(values) // 2]) if values else None,
+            'p95': round(values[int(len(values) * 0.95)]) if values else None,
+            'max': round(values[-1]) if values else None,
+        }
+    return data
+
+
+def flush(timeout=5):
+    """Waits (up to timeout) for everything queued so far to be handled."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with _lock:
+            if not _queue.qsize() and not _pending_count:
+                return True
+        time.sleep(0.05)
+    return False
+
+
+def _start_worker():
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_run, name='telegram-outbox', daemon=True).start()
+    atexit.register(flush)
+
+
+def _chat_interval(chat_id):
+    return GROUP_CHAT_INTERVAL if str(chat_id).startswith('-') else PRIVATE_CHAT_INTERVAL
+
+
+def _retry_delay(error, attempts):
+    """Seconds to wait before retrying, or None if the error is permanent."""
+    if isinstance(error, ApiTelegramException):
+        if error.error_code == 429:
+            return error.result_json.get('parameters', {}).get('retry_after', 1)
+        status = error.error_code
+    elif isinstance(error, ApiHTTPException):
+        status = getattr(error.result, 'status_code', 500)
+    elif isinstance(error, requests.RequestException):
+        status = 503  # Network trouble: treat like a server error
+    else:
+        return None
+    if status == 429 or status >= 500:
+        return min(MAX_BACKOFF, 2 ** attempts)
+    return None
+
+
+def _run():
+    global _pending_count
+    pending = OrderedDict()  # chat_id -> deque of _Outgoing, in arrival order
+    ready_at = {}            # chat_id -> monotonic time it may be sent to again
+    next_send = 0.0          # Global pacing
+
+    while True:
+        now = time.monotonic()
+        # Sleep until a new message arrives or a waiting chat becomes sendable
+        if pending:
+            wait = max(0.0, min(ready_at.get(c, 0) for c in pending) - now)
+        else:
+            wait = None
+        try:
+            item = _queue.get(timeout=wait)
+            while True:
+                pending.setdefault(item.chat_id, deque()).append(item)
+                with _lock:
+                    _pending_count += 1
+                item = _queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        now = time.monotonic()
+        chat_id = next((c for c in pending if ready_at.get(c, 0) <= now), None)
+        if chat_id is None:
+            continue
+
+        messages = pending[chat_id]
+        item = messages.popleft()
+        merged = 1
+        while messages and item.can_merge(messages[0]):
+            other = messages.popleft()
+            item.kwargs['text'] += '\n\n' + other.kwargs['text']
+            merged += 1
+
+        time.sleep(max(0.0, next_send - now))
+        started = time.monotonic()
+        try:
+            item.send(item.chat_id, **item.kwargs)
+            error = None
+        except Exception as e:
+            error = e
+        finished = time.monotonic()
+        next_send = finished + GLOBAL_INTERVAL
+        ready_at[chat_id] = finished + _chat_interval(chat_id)
+
+        retry_in = None
+        if error is not None:
+            item.attempts += 1
+            retry_in = _retry_delay(error, item.attempts)
+            if retry_in is not None and item.attempts < MAX_ATTEMPTS:
+                # Stays first in line for its chat; other chats keep flowing
+                ready_at[chat_id] = finished + retry_in
+                messages.appendleft(item)
+            else:
+                retry_in = None
+                print(f"❌ Telegram Send Error ({item.chat_id}, attempt {item.attempts}): {error}")
+        if not messages:
+            del pending[chat_id]
+
+        with _lock:
+            if retry_in is not None:
+                _stats['retried'] += 1
+                _pending_count -= merged - 1
+                continue
+            _pending_count -= merged
+            _stats['coalesced'] += merged - 1
+            if error is None:
+                _stats['sent'] += 1
+                _latencies.append(((finished - item.queued_at) * 1000, (finished - started) * 1000))
+            else:
+                _stats['failed'] += 1
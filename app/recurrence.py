@@ -0,0 +1,253 @@
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+from dateutil.relativedelta import relativedelta
+from dateutil.rrule import rrulestr
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.extensions import db
+from app.models import Task, TaskHistory
+
+# Recurring tasks, worked out when they are read instead of being rewritten
+# every night. Task.recurrence is 'none', a preset ('daily', 'weekly',
+# 'monthly') or an RRULE ("FREQ=WEEKLY;BYDAY=MO,TH"); the stored due_date is
+# the series anchor (DTSTART). The current occurrence is the first one on or
+# after today, and its period runs from the day after the previous occurrence
+# up to it: a completion (a TaskHistory row) anywhere in that period means the
+# task is done for now. Periods are cached per (rule, anchor, day).
+
+PRESETS = {'daily': 'FREQ=DAILY', 'weekly': 'FREQ=WEEKLY', 'monthly': 'FREQ=MONTHLY'}
+MAX_LENGTH = 255  # Task.recurrence column size
+CACHE_SIZE = 1024
+FREQUENCIES = ('YEARLY', 'MONTHLY', 'WEEKLY', 'DAILY')  # Nothing finer: see _rule()
+MAX_COUNT = 1000
+# Rules are expanded from a start moved up to this long before the date asked
+# about, so "the occurrence before" lookups still find one for any rule that
+# fires at least every couple of years
+REBASE_MARGIN = timedelta(days=800)
+SPARSE_MARGIN = timedelta(days=3000)  # Second try before walking from the anchor (Feb 29 rules)
+
+
+def recurring_clause():
+    return db.and_(Task.recurrence.isnot(None), Task.recurrence != 'none')
+
+
+def one_off_clause():
+    return db.or_(Task.recurrence.is_(None), Task.recurrence == 'none')
+
+
+def is_recurring(task):
+    return bool(task.recurrence) and task.recurrence != 'none'
+
+
+def normalize(value):
+    """Storable form of a recurrence ('none', a preset or a bare RRULE); ValueError if invalid."""
+    value = (value or 'none').strip()
+    if value.lower() == 'none' or value.lower() in PRESETS:
+        return value.lower()
+    rule = value.upper()
+    if rule.startswith('RRULE:'):
+        rule = rule[len('RRULE:'):]
+    if len(rule) > MAX_LENGTH or '\n' in rule or 'DTSTART' in rule:
+        raise ValueError('recurrence must be a single RRULE without DTSTART')
+    parts = _parts(rule)
+    if parts.get('FREQ') not in FREQUENCIES:
+        raise ValueError('recurrence must repeat daily, weekly, monthly or yearly')
+    if ',' in parts.get('BYMINUTE', '') + parts.get('BYSECOND', ''):
+        raise ValueError('recurrence can repeat at most hourly within a day (BYHOUR)')
+    try:
+        count = int(parts.get('COUNT', 0))
+        _rule(rule, datetime(2000, 1, 1))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'invalid recurrence: {e}')
+    if count > MAX_COUNT:
+        raise ValueError(f'recurrence COUNT must be at most {MAX_COUNT}')
+    return rule
+
+
+def _parts(rule):
+    return dict(part.split('=', 1) for part in rule.upper().split(';') if '=' in part)
+
+
+def _rebase(rule, anchor, near):
+    """(rule, later start) with the same occurrences from there on, starting about
+    REBASE_MARGIN before near.
+
+    dateutil walks every occurrence from DTSTART, so a daily task anchored
+    years ago would cost thousands of steps per lookup. Moving the start by
+    whole periods leaves the series unchanged; the day (and month) that
+    monthly/yearly rules take from DTSTART is written into the rule first.
+    COUNT rules are counted from the anchor and stay put.
+    """
+    parts = _parts(rule)
+    if 'UNTIL' in parts:  # Nothing to look up past the end
+        until = parts['UNTIL']
+        near = min(near, date(int(until[:4]), int(until[4:6]), int(until[6:8])))
+    days = (near - anchor.date() - REBASE_MARGIN).days
+    if days <= 0 or 'COUNT' in parts:
+        return rule, anchor
+    interval = int(parts.get('INTERVAL', 1))
+    if parts['FREQ'] in ('DAILY', 'WEEKLY'):
+        step = interval * (7 if parts['FREQ'] == 'WEEKLY' else 1)
+        return rule, anchor + timedelta(days=days // step * step)
+
+    if not {'BYMONTHDAY', 'BYDAY', 'BYYEARDAY', 'BYWEEKNO'} & set(parts):
+        rule += f';BYMONTHDAY={anchor.day}'
+        if parts['FREQ'] == 'YEARLY' and 'BYMONTH' not in parts:
+            rule += f';BYMONTH={anchor.month}'
+    step = interval * (12 if parts['FREQ'] == 'YEARLY' else 1)
+    return rule, anchor + relativedelta(months=days // 31 // step * step)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _rule(recurrence, anchor, near=None):
+    """The dateutil rule, started close to `near` (a date) when given."""
+    rule, start = PRESETS.get(recurrence, recurrence), anchor
+    freq = _parts(rule).get('FREQ')
+    if freq not in FREQUENCIES:  # Saved before normalize() refused them: read as daily
+        rule = rule.replace(f'FREQ={freq}', 'FREQ=DAILY')
+    if near:
+        rule, start = _rebase(rule, anchor, near)
+    return rrulestr(rule, dtstart=start)
+
+
+def anchor_of(task):
+    """The series start: the stored due_date, else the creation time."""
+    saved = task.__dict__.get('_recurrence_anchor')
+    if saved and saved[1] == task.due_date:
+        return saved[0]  # due_date currently shows an annotated occurrence
+    anchor = task.due_date or task.created_date or datetime.combine(date.today(), time.min)
+    return anchor.replace(tzinfo=None)
+
+
+def rule_for(task, near=None):
+    """The task's dateutil rule, for looking up occurrences from `near` (default today) on."""
+    return _rule(task.recurrence, anchor_of(task), near or date.today())
+
+
+def _period_start(recurrence, anchor, rule, due):
+    """Day after the occurrence before `due`; date.min for the first one (open period)."""
+    previous = rule.before(due)
+    if previous is None:  # First occurrence, or a rule sparser than REBASE_MARGIN
+        previous = (_rule(recurrence, anchor, due.date() - SPARSE_MARGIN).before(due) or
+                    _rule(recurrence, anchor).before(due))
+    return previous.date() + timedelta(days=1) if previous is not None else date.min
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def current_period(recurrence, anchor, today):
+    """(first day, due datetime) of the occurrence on or after today (the last one once a
+    finite series has ended)."""
+    rule = _rule(recurrence, anchor, today)
+    due = rule.after(datetime.combine(today, time.min), inc=True) or rule.before(
+        datetime.combine(today, time.min))
+    if due is None:
+        return date.min, anchor
+    return _period_start(recurrence, anchor, rule, due), due
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def periods_between(recurrence, anchor, start, end):
+    """((first day, due datetime), ...) for every occurrence in start..end (datetimes)."""
+    rule = _rule(recurrence, anchor, start.date())
+    return tuple((_period_start(recurrence, anchor, rule, due), due)
+                 for due in rule.between(start, end, inc=True))
+
+
+def _history_floor(task, first):
+    """Earliest completion day worth loading for a period starting on `first`."""
+    if first != date.min:
+        return first
+    anchor = anchor_of(task)
+    created = task.created_date.replace(tzinfo=None) if task.created_date else anchor
+    return min(anchor, created).date()
+
+
+def _completed_days(tasks, first_day, last_day):
+    """{task_id: set of completion days between the two dates} in one query."""
+    days = {task.id: set() for task in tasks}
+    if not days:
+        return days
+    rows = db.session.query(TaskHistory.task_id, TaskHistory.completed_date).filter(
+        TaskHistory.task_id.in_(days.keys()),
+        TaskHistory.completed_date >= first_day,
+        TaskHistory.completed_date <= last_day).distinct()
+    for task_id, completed_date in rows:
+        days[task_id].add(completed_date)
+    return days
+
+
+def _done(task, days, first, last):
+    """Completed on some day first..last?"""
+    if any(first <= d <= last for d in days):
+        return True
+    # Completions from before TaskHistory was kept for every recurring task
+    completed = task.last_completed
+    return bool(task.complete and completed and first <= completed.date() <= last)
+
+
+def annotate(tasks, today=None):
+    """Shows recurring tasks as their current occurrence: due_date and complete are
+    replaced in memory (never flushed) and task.period_start is set. One query."""
+    today = today or date.today()
+    periods = {}
+    for task in tasks:
+        if is_recurring(task):
+            anchor = anchor_of(task)
+            periods[task.id] = (task, anchor, current_period(task.recurrence, anchor, today))
+    if not periods:
+        return tasks
+
+    # Once a finite series has ended its last occurrence stays current, so
+    # completions up to today count
+    days = _completed_days([p[0] for p in periods.values()],
+                           min(_history_floor(task, first)
+                               for task, _, (first, _) in periods.values()),
+                           max(today, *(due.date() for _, _, (_, due) in periods.values())))
+    for task, anchor, (first, due) in periods.values():
+        done = _done(task, days[task.id], first, max(today, due.date()))
+        task.__dict__['_recurrence_anchor'] = (anchor, due)
+        task.period_start = first
+        set_committed_value(task, 'due_date', due)
+        set_committed_value(task, 'complete', done)
+    return tasks
+
+
+def clear_period(task):
+    """Deletes the completions of the task's current period (annotate() first)."""
+    history = TaskHistory.query.filter(
+        TaskHistory.task_id == task.id,
+        TaskHistory.completed_date >= task.period_start).all()
+    for row in history:
+        db.session.delete(row)  # ORM deletes so the habit bitmap hooks run
+    return len(history)
+
+
+def calendar(user_id, start, end):
+    """{'YYYY-MM-DD': [entry, ...]} of every task occurrence between two dates."""
+    range_start = datetime.combine(start, time.min)
+    range_end = datetime.combine(end, time.max)
+
+    one_off = Task.query.filter(
+        Task.user_id == user_id, one_off_clause(),
+        Task.due_date >= range_start, Task.due_date <= range_end).all()
+    recurring = Task.query.filter(Task.user_id == user_id, recurring_clause()).all()
+
+    occurrences = [(task, task.due_date, bool(task.complete)) for task in one_off]
+    expanded = {task.id: periods_between(task.recurrence, anchor_of(task), range_start, range_end)
+                for task in recurring}
+    firsts = [_history_floor(task, first)
+              for task in recurring for first, _ in expanded[task.id]]
+    if firsts:
+        days = _completed_days(recurring, min(firsts), end)
+        for task in recurring:
+            for first, due in expanded[task.id]:
+                occurrences.append((task, due, _done(task, days[task.id], first, due.date())))
+
+    result = {}
+    for task, due, done in sorted(occurrences, key=lambda o: (o[1], o[0].id)):
+        result.setdefault(due.date().isoformat(), []).append({
+            'id': task.id, 'content': task.content, 'color': task.color,
+            'priority': task.priority, 'due_date': due.isoformat(), 'complete': done,
+            'recurring': is_recurring(task)})
+    return result
@@ -0,0 +1,260 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app import recurrence
+from app.extensions import db
+from app.models import DataVersion, Task, TaskHistory
+
+# Per-task Telegram reminders, run by the leader next to the scheduler. Every
+# upcoming alert time sits in a min-heap and the thread sleeps on a condition
+# until the earliest one (or a change) instead of polling the task table. The
+# heap is filled from indexed due-date queries at start; afterwards only what
+# changed is re-read: commits in this process report their tasks through the
+# session hooks below, and writes from other processes (web workers, webhook
+# callbacks) show up as a new sum of the per-user data versions, checked every
+# REMINDER_SYNC_SECONDS with one query on that small table.
+
+SYNC_SECONDS = int(os.getenv('REMINDER_SYNC_SECONDS', '15'))
+# Alerts that fell due this recently are still sent after a restart
+MISSED_GRACE = timedelta(minutes=int(os.getenv('REMINDER_GRACE_MINUTES', '10')))
+
+_cond = threading.Condition()
+_heap = []             # (fire_at, seq, task_id); entries replaced since are skipped
+_entries = {}          # task_id -> (fire_at, seq, user_id): the live schedule
+_last_fired = {}       # task_id -> fire_at of its last alert, so a reload doesn't repeat it
+_changed_tasks = set()  # Committed in this process, waiting to be re-read
+_seq = itertools.count()
+_started = False
+
+# Only touched by the reminder thread
+_chats = {}            # user_id -> chat_id of users who want reminders
+_versions = {}         # user_id -> data version at the last sync
+_version_sum = None
+
+
+def fire_time(task, not_before):
+    """When the task's next alert is due, at or after not_before (None if never).
+
+    Recurring tasks must be annotated (recurrence.annotate) first.
+    """
+    if task.complete and not recurrence.is_recurring(task):
+        return None
+    times = []
+    if task.snooze_until and not task.complete and task.snooze_until >= not_before:
+        times.append(task.snooze_until)
+    due = task.due_date
+    if due and recurrence.is_recurring(task):
+        rule = recurrence.rule_for(task)
+        if task.complete:  # Done for this period: the next occurrence
+            due = rule.after(due)
+        if due and due < not_before:
+            due = rule.after(not_before, inc=True)
+    elif due and due < not_before:
+        due = None
+    if due:
+        times.append(due)
+    return min(times) if times else None
+
+
+def pending():
+    """Number of scheduled alerts and the next one (for the dev panel)."""
+    with _cond:
+        upcoming = min(_entries.values(), default=None)
+        return {'pending': len(_entries), 'next': upcoming[0].isoformat() if upcoming else None}
+
+
+def start(app):
+    global _started
+    with _cond:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_run, args=(app,), name='task-reminders', daemon=True).start()
+    print("⏰ Task reminders started.")
+
+
+# --- SCHEDULE (heap) ---
+
+
+def _schedule(task_id, user_id, fire_at):
+    """Replaces the task's entry (None removes it). Caller holds _cond."""
+    if fire_at is None:
+        _entries.pop(task_id, None)
+        return
+    seq = next(_seq)
+    _entries[task_id] = (fire_at, seq, user_id)
+    heapq.heappush(_heap, (fire_at, seq, task_id))
+
+
+def _compact():
+    """Drops replaced entries once they outnumber the live ones. Caller holds _cond."""
+    global _heap
+    if len(_heap) > 2 * len(_entries) + 100:
+        _heap = [(fire_at, seq, task_id) for task_id, (fire_at, seq, _) in _entries.items()]
+        heapq.heapify(_heap)
+
+
+def _pop_due(now):
+    """Removes and returns [(task_id, fire_at)] due by now. Caller holds _cond."""
+    due = []
+    while _heap and _heap[0][0] <= now:
+        fire_at, seq, task_id = heapq.heappop(_heap)
+        entry = _entries.get(task_id)
+        if entry and entry[1] == seq:
+            del _entries[task_id]
+            due.append((task_id, fire_at))
+    return due
+
+
+def _not_before(task_id, now):
+    last = _last_fired.get(task_id)
+    floor = now - MISSED_GRACE
+    return max(floor, last + timedelta(microseconds=1)) if last else floor
+
+
+def _reschedule(tasks, now):
+    """Recomputes the alert time of each (annotated) task."""
+    times = {task.id: (task.user_id, fire_time(task, _not_before(task.id, now)))
+             for task in tasks if task.user_id in _chats}
+    with _cond:
+        for task_id, (user_id, fire_at) in times.items():
+            _schedule(task_id, user_id, fire_at)
+        _compact()
+
+
+# --- LOADING ---
+
+
+def _load_users(user_ids, now):
+    """Rebuilds the schedule of these users from indexed due-date queries."""
+    with _cond:
+        for task_id in [t for t, entry in _entries.items() if entry[2] in user_ids]:
+            del _entries[task_id]
+    wanted = [user_id for user_id in user_ids if user_id in _chats]
+    if not wanted:
+        return
+    _reschedule(recurrence.annotate(upcoming_tasks(wanted, now - MISSED_GRACE)), now)
+
+
+def upcoming_tasks(user_ids, since):
+    """Every task of these users that may still need an alert after `since`."""
+    one_off = Task.query.filter(
+        Task.user_id.in_(user_ids), Task.complete == False, Task.due_date >= since).all()
+    # Recurring tasks always have a next occurrence; snoozes can outlive the due date
+    others = Task.query.filter(Task.user_id.in_(user_ids), db.or_(
+        recurrence.recurring_clause(), Task.snooze_until >= since)).all()
+    return list({task.id: task for task in one_off + others}.values())
+
+
+def _load_tasks(task_ids, now):
+    """Re-reads tasks committed in this process (deleted ones drop out)."""
+    tasks = recurrence.annotate(Task.query.filter(Task.id.in_(task_ids)).all())
+    with _cond:
+        for task_id in task_ids - {task.id for task in tasks}:
+            _entries.pop(task_id, None)
+            _last_fired.pop(task_id, None)
+    _reschedule(tasks, now)
+
+
+def _sync(now):
+    """Reloads the users whose data version moved since the last check."""
+    global _versions, _version_sum, _chats
+    total = db.session.query(func.coalesce(func.sum(DataVersion.version), 0)).scalar()
+    if total == _version_sum:
+        return
+    versions = dict(db.session.query(DataVersion.user_id, DataVersion.version).all())
+    changed = {user_id for user_id, version in versions.items()
+               if _versions.get(user_id) != version}
+    from app.scheduler import briefing_recipients
+    chats = briefing_recipients('task_reminders')
+    if _version_sum is None:
+        changed |= set(chats)  # First run: everyone, whatever their version
+    changed |= set(chats) ^ set(_chats)
+    _chats, _versions, _version_sum = chats, versions, total
+    _load_users(changed, now)
+
+
+# --- SENDING ---
+
+
+def _fire(due, now):
+    from app.telegram_bot import send_task_alert
+    fire_at_by_id = dict(due)
+    tasks = recurrence.annotate(Task.query.filter(Task.id.in_(fire_at_by_id)).all())
+    for task in tasks:
+        fire_at = fire_at_by_id[task.id]
+        chat_id = _chats.get(task.user_id)
+        # Re-checked against the row: it may have changed in another process since
+        if chat_id and fire_time(task, fire_at) == fire_at:
+            send_task_alert(task, chat_id)
+            _last_fired[task.id] = fire_at
+    _reschedule(tasks, now)
+
+
+def _run(app):
+    next_sync = 0.0
+    while True:
+        with _cond:
+            while True:
+                now = datetime.now()
+                due = _pop_due(now)
+                if due or _changed_tasks or time.monotonic() >= next_sync:
+                    break
+                timeout = next_sync - time.monotonic()
+                if _heap:
+                    timeout = min(timeout, (_heap[0][0] - now).total_seconds())
+                _cond.wait(max(timeout, 0.01))
+            changed = set(_changed_tasks)
+            _changed_tasks.clear()
+
+        with app.app_context():
+            try:
+                now = datetime.now()
+                if time.monotonic() >= next_sync:
+                    next_sync = time.monotonic() + SYNC_SECONDS
+                    _sync(now)
+                if changed:
+                    _load_tasks(changed, now)
+                if due:
+                    _fire(due, now)
+            except Exception as e:
+                print(f"❌ Reminder Error: {e}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+
+# --- CHANGE HOOKS (this process) ---
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    if not _started:
+        return
+    task_ids = session.info.setdefault('reminder_tasks', set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Task):
+            task_ids.add(obj.id)
+        elif isinstance(obj, TaskHistory):  # Completions decide recurring tasks' state
+            task_ids.add(obj.task_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_changes(session):
+    task_ids = session.info.pop('reminder_tasks', None)
+    if task_ids:
+        with _cond:
+            _changed_tasks.update(task_ids)
+            _cond.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_changes(session):
+    session.info.pop('reminder_tasks', None)
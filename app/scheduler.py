@@ -1,172 +1,259 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from flask import current_app
 from datetime import datetime, timedelta, timezone, time
+from sqlalchemy import Integer, String, cast, func, literal, or_, update
 from app.extensions import db
-from .models import Task, TaskHistory, User
-from .telegram_bot import send_telegram_message, send_telegram_photo
-from PIL import Image, ImageDraw
-import io
+from . import state
+from .models import Task, User, NotificationSettings
+from .telegram_bot import CHAT_ID, send_telegram_message, send_telegram_photo
+from . import habit_image, habits, recurrence
 import atexit
+from collections import defaultdict
 
-# ... (Keep generate_habit_image as is) ...
+# --- DAILY / WEEKLY RESET (set-based maintenance) ---
+# Recurring tasks no longer need a nightly sweep: app/recurrence.py works out
+# the current occurrence and its done state on read. These rewrite the stored
+# rows for daily/weekly tasks, for tools that read the table directly
+# (manage_db.py reset-recurring).
 
 
-def generate_habit_image(user_id, app):
-    """Generates a dot-grid image of your habits."""
-    with app.app_context():
-        habits = Task.query.filter_by(user_id=user_id, is_habit=True).all()
-        if not habits:
-            return None
-
-        days_to_show = 14
-        dot_size = 20
-        gap = 10
-        row_height = 40
-        width = 160 + (days_to_show * (dot_size + gap))
-        height = 60 + (len(habits) * row_height)
+def _bulk_update(where, values):
+    """One UPDATE over the matching tasks; returns the owners of the changed rows."""
+    stmt = update(Task).where(*where).values(**values).returning(Task.user_id)
+    return [user_id for (user_id,) in db.session.execute(
+        stmt, execution_options={'synchronize_session': False})]
 
-        img = Image.new('RGB', (width, height), color='#1A1A1A')
-        draw = ImageDraw.Draw(img)
-        draw.text((10, 10), "HABIT TRACKER (14 Days)", fill='#888888')
 
-        today = datetime.now(timezone.utc).date()
+def reset_recurring_tasks(today=None):
+    """Unchecks recurring tasks and moves their due dates into the current period.
 
-        for i, habit in enumerate(habits):
-            y_pos = 40 + (i * row_height)
-            name = habit.content[:15]
-            draw.text((10, y_pos), name, fill='#FFFFFF')
-            active_color = habit.color if habit.color else '#2ecc71'
+    A handful of UPDATE statements, whatever the table size. Dates are
+    rewritten in SQL, keeping each due_date's time-of-day: the stored value
+    is 'YYYY-MM-DD HH:MM:SS.ffffff', so the new date + substr(due_date, 11).
+    Returns {'unchecked': n, 'moved': n, 'weekly': n}; nothing is committed.
+    """
+    today = today or datetime.now().date()
+    today_start = datetime.combine(today, time.min)
+    tomorrow_start = today_start + timedelta(days=1)
+    time_of_day = func.substr(Task.due_date, 11)
+    users = set()
 
-            for d in range(days_to_show):
-                check_date = today - timedelta(days=(days_to_show - 1 - d))
-                done = TaskHistory.query.filter_by(
-                    task_id=habit.id, completed_date=check_date).first()
-                x_pos = 160 + (d * (dot_size + gap))
-                fill = active_color if done else '#222222'
-                draw.ellipse([x_pos, y_pos, x_pos + dot_size,
-                             y_pos + dot_size], fill=fill, outline=None)
+    # Daily: unchecked every night, due today at the same time
+    unchecked = _bulk_update(
+        [Task.recurrence == 'daily', Task.complete == True], {'complete': False})
+    moved = _bulk_update(
+        [Task.recurrence == 'daily', Task.due_date.isnot(None),
+         or_(Task.due_date < today_start, Task.due_date >= tomorrow_start)],
+        {'due_date': literal(today.isoformat(), String) + time_of_day})
+    # No time to keep: start of today
+    moved += _bulk_update(
+        [Task.recurrence == 'daily', Task.due_date.is_(None)], {'due_date': today_start})
 
-        buf = io.BytesIO()
-        img.save(buf, format='PNG')
-        buf.seek(0)
-        return buf
+    # Weekly: once the due date has passed, jump forward by whole weeks to the
+    # first occurrence on/after today (same weekday and time), unchecked
+    days_late = func.julianday(today.isoformat()) - func.julianday(func.date(Task.due_date))
+    weeks = cast((days_late + 6) / 7, Integer)
+    next_date = func.date(Task.due_date, func.printf('+%d days', weeks * 7), type_=String)
+    weekly = _bulk_update(
+        [Task.recurrence == 'weekly', Task.due_date < today_start],
+        {'due_date': next_date + time_of_day, 'complete': False})
 
-# --- UPDATED: DAILY RESET LOGIC ---
+    users.update(unchecked, moved, weekly)
+    for user_id in users:
+        state.touch(user_id, 'tasks', {'reset': 'recurring'})
+    return {'unchecked': len(unchecked), 'moved': len(moved), 'weekly': len(weekly)}
 
 
 def reset_daily_tasks(app):
-    """Runs at 00:01 AM: Unchecks daily tasks AND moves their due date to Today."""
+    """Unchecks daily tasks AND moves their due date to Today (weekly too). Not scheduled."""
     with app.app_context():
-        print("⏰ Scheduler: Checking for daily tasks to reset...")
-        # Find all daily tasks (whether done or not, we ensure they are ready for the new day)
-        daily_tasks = Task.query.filter_by(recurrence='daily').all()
-        count = 0
-        today = datetime.now().date()
-
-        for task in daily_tasks:
-            # 1. Uncheck it
-            if task.complete:
-                task.complete = False
-                count += 1
-
-            # 2. IMPORTANT: Update Due Date to TODAY so it shows up in "Today" lists/Bot
-            # We preserve the original time if it exists, otherwise default to 00:00
-            if task.due_date:
-                original_time = task.due_date.time()
-                task.due_date = datetime.combine(today, original_time)
-            else:
-                task.due_date = datetime.combine(today, time.min)
-
-        if count > 0:
-            db.session.commit()
-            print(f"✅ Scheduler: Reset {count} daily tasks and updated dates.")
-        else:
-            print("💤 Scheduler: Daily tasks dates updated, no unchecking needed.")
+        started = datetime.now()
+        counts = reset_recurring_tasks()
+        db.session.commit()
+        print(f"✅ Scheduler: Reset {counts['unchecked']} daily tasks, moved {counts['moved']} "
+              f"daily due dates, rolled {counts['weekly']} weekly tasks "
+              f"({(datetime.now() - started).total_seconds() * 1000:.0f} ms).")
+
+# --- BRIEFINGS (every user with a chat, a few grouped queries, queued sends) ---
+
+
+def briefing_recipients(preference):
+    """{user_id: chat_id} of users who want this briefing (a NotificationSettings flag)."""
+    flag = getattr(NotificationSettings, preference)
+    rows = db.session.query(User.id, NotificationSettings.chat_id, flag).outerjoin(
+        NotificationSettings, NotificationSettings.user_id == User.id).all()
+    recipients = {}
+    for user_id, chat_id, enabled in rows:
+        if enabled is False:
+            continue
+        # Before per-user settings everything went to the global chat: keep that for user 1
+        chat_id = chat_id or (CHAT_ID if user_id == 1 else None)
+        if chat_id:
+            recipients[user_id] = chat_id
+    return recipients
+
+
+# Briefing queries, every user in one go (check_queries.py plans these very calls)
+
+
+def recurring_tasks(user_ids):
+    return Task.query.filter(Task.user_id.in_(user_ids), recurrence.recurring_clause()).order_by(
+        Task.user_id, Task.id).all()
+
+
+def overdue_tasks(user_ids, day_start):
+    """Open one-off tasks due before day_start, by user then due date."""
+    # Plain range predicates on due_date so ix_task_user_complete_due applies
+    return Task.query.filter(
+        Task.user_id.in_(user_ids), Task.complete == False, recurrence.one_off_clause(),
+        Task.due_date < day_start).order_by(Task.user_id, Task.due_date).all()
+
+
+def tasks_due_between(user_ids, start, end):
+    """Open one-off tasks due in [start, end), by user then due date."""
+    return Task.query.filter(
+        Task.user_id.in_(user_ids), Task.complete == False, recurrence.one_off_clause(),
+        Task.due_date >= start, Task.due_date < end).order_by(Task.user_id, Task.due_date).all()
+
+
+def completed_since(user_ids, since):
+    return Task.query.filter(
+        Task.user_id.in_(user_ids), Task.complete == True, Task.last_completed >= since).all()
 
-# --- (Keep Notification Logic exactly as is) ---
+
+def habit_tasks(user_ids):
+    return Task.query.filter(Task.user_id.in_(user_ids), Task.is_habit == True).order_by(
+        Task.id).all()
+
+
+def group_by_user(tasks):
+    grouped = defaultdict(list)
+    for task in tasks:
+        grouped[task.user_id].append(task)
+    return grouped
+
+
+def morning_message(overdue, due_today):
+    if not overdue and not due_today:
+        return "<b>☀️ Morning Briefing</b>\n\nNo tasks scheduled for today. Enjoy your freedom! 🏝️"
+
+    msg = "<b>☀️ Morning Briefing</b>\n\n"
+    if overdue:
+        msg += f"⚠️ <b>{len(overdue)} Overdue:</b>\n"
+        for t in overdue:
+            msg += f"• {t.content}\n"
+    if due_today:
+        msg += f"\n📅 <b>{len(due_today)} For Today:</b>\n"
+        for t in due_today:
+            msg += f"• {t.content}\n"
+    return msg
 
 
 def check_daily_notifications(app):
     with app.app_context():
-        user = User.query.get(1)
-        if not user:
+        recipients = briefing_recipients('morning_briefing')
+        if not recipients:
             return
+        user_ids = list(recipients)
         today = datetime.now(timezone.utc).date()
-        overdue = Task.query.filter(
-            Task.user_id == user.id, Task.complete == False, db.func.date(Task.due_date) < today).all()
-        due_today = Task.query.filter(
-            Task.user_id == user.id, Task.complete == False, db.func.date(Task.due_date) == today).all()
+        today_start = datetime.combine(today, time.min)
+        tomorrow_start = today_start + timedelta(days=1)
+        overdue = group_by_user(overdue_tasks(user_ids, today_start))
+        due_today = group_by_user(tasks_due_between(user_ids, today_start, tomorrow_start))
+
+        # Recurring tasks: the current occurrence, unless done for this period
+        for task in recurrence.annotate(recurring_tasks(user_ids), today):
+            if task.complete:
+                continue
+            if task.due_date < today_start:  # Last occurrence of an ended series
+                overdue[task.user_id].append(task)
+            elif task.due_date < tomorrow_start:
+                due_today[task.user_id].append(task)
+        for tasks in due_today.values():
+            tasks.sort(key=lambda t: t.due_date)
 
-        if not overdue and not due_today:
+        for user_id, chat_id in recipients.items():
             send_telegram_message(
-                "<b>☀️ Morning Briefing</b>\n\nNo tasks scheduled for today. Enjoy your freedom! 🏝️")
-            return
+                morning_message(overdue.get(user_id, []), due_today.get(user_id, [])), chat_id)
 
-        msg = "<b>☀️ Morning Briefing</b>\n\n"
-        if overdue:
-            msg += f"⚠️ <b>{len(overdue)} Overdue:</b>\n"
-            for t in overdue:
-                msg += f"• {t.content}\n"
-        if due_today:
-            msg += f"\n📅 <b>{len(due_today)} For Today:</b>\n"
-            for t in due_today:
-                msg += f"• {t.content}\n"
-        send_telegram_message(msg)
+
+def summary_message(completed, upcoming):
+    msg = "<b>🌙 Daily Closing</b>\n\n"
+    if completed:
+        msg += f"<b>✅ Achieved Today ({len(completed)})</b>\n"
+        for t in completed:
+            msg += f"• {t.content}\n"
+        msg += "\n"
+    else:
+        msg += "<i>No tasks completed today.</i>\n\n"
+
+    if upcoming:
+        msg += f"<b>🚀 Tomorrow's Focus ({len(upcoming)})</b>\n"
+        for t in upcoming:
+            icon = "🔥" if t.priority == 'urgent' else "•"
+            msg += f"{icon} {t.content}\n"
+    else:
+        msg += "<i>Nothing scheduled for tomorrow yet. Sleep well! 💤</i>"
+    return msg
 
 
 def check_daily_summary(app):
     with app.app_context():
+        recipients = briefing_recipients('daily_summary')
+        if not recipients:
+            return
+        user_ids = list(recipients)
         now_utc = datetime.now(timezone.utc)
         today = now_utc.date()
         tomorrow = today + timedelta(days=1)
-        completed = Task.query.filter(Task.complete == True, Task.last_completed >= now_utc.replace(
-            hour=0, minute=0, second=0, microsecond=0)).all()
+        completed = group_by_user(completed_since(
+            user_ids, now_utc.replace(hour=0, minute=0, second=0, microsecond=0)))
         start_tomorrow = datetime.combine(tomorrow, time.min)
         end_tomorrow = datetime.combine(tomorrow, time.max)
-        upcoming = Task.query.filter(Task.due_date >= start_tomorrow, Task.due_date <= end_tomorrow, db.or_(
-            Task.complete == False, db.and_(Task.complete == True, Task.recurrence != 'none'))).all()
+        upcoming = group_by_user(tasks_due_between(
+            user_ids, start_tomorrow, start_tomorrow + timedelta(days=1)))
+        for task in recurring_tasks(user_ids):
+            if recurrence.periods_between(task.recurrence, recurrence.anchor_of(task),
+                                          start_tomorrow, end_tomorrow):
+                upcoming[task.user_id].append(task)
 
-        if not completed and not upcoming:
-            return
-
-        msg = "<b>🌙 Daily Closing</b>\n\n"
-        if completed:
-            msg += f"<b>✅ Achieved Today ({len(completed)})</b>\n"
-            for t in completed:
-                msg += f"• {t.content}\n"
-            msg += "\n"
-        else:
-            msg += "<i>No tasks completed today.</i>\n\n"
-
-        if upcoming:
-            msg += f"<b>🚀 Tomorrow's Focus ({len(upcoming)})</b>\n"
-            for t in upcoming:
-                icon = "🔥" if t.priority == 'urgent' else "•"
-                msg += f"{icon} {t.content}\n"
-        else:
-            msg += "<i>Nothing scheduled for tomorrow yet. Sleep well! 💤</i>"
-        send_telegram_message(msg)
+        for user_id, chat_id in recipients.items():
+            if completed.get(user_id) or upcoming.get(user_id):
+                send_telegram_message(
+                    summary_message(completed[user_id], upcoming[user_id]), chat_id)
 
 
 def check_weekly_briefing(app):
     with app.app_context():
+        recipients = briefing_recipients('weekly_briefing')
+        # Last 14 days, rendered in parallel (and reused if nothing changed)
+        images = habit_image.render_many(list(recipients))
+        habit_rows = habit_tasks(list(recipients))
+        stats = habits.load_stats([h.id for h in habit_rows])
+        lines = defaultdict(list)
+        for h in habit_rows:
+            s = stats[h.id]
+            streak = f"🔥 {s['streak']}d · " if s['streak'] else ""
+            lines[h.user_id].append(
+                f"• {h.content}: {streak}{s['week']}/7 this week (best {s['longest']}d)")
+
+    for user_id, chat_id in recipients.items():
         msg = "<b>📅 Weekly Briefing</b>\nHere is your habit consistency:"
-        img_buffer = generate_habit_image(1, app)
-        if img_buffer:
-            send_telegram_photo(msg, img_buffer)
+        if lines[user_id]:
+            msg += "\n\n" + "\n".join(lines[user_id])
+        if images[user_id]:
+            send_telegram_photo(msg, images[user_id], chat_id)
         else:
-            send_telegram_message(msg + "\n(No habits found to graph)")
+            send_telegram_message(msg + "\n(No habits found to graph)", chat_id)
 
 # --- START SCHEDULER ---
 
 
 def start_scheduler(app):
     scheduler = BackgroundScheduler()
-    scheduler.add_job(lambda: reset_daily_tasks(app), 'cron', hour=0, minute=1)
     scheduler.add_job(lambda: check_daily_notifications(app), 'cron', hour=8)
     scheduler.add_job(lambda: check_daily_summary(app), 'cron', hour=22)
     scheduler.add_job(lambda: check_weekly_briefing(app),
                       'cron', day_of_week='sun', hour=20)
     scheduler.start()
-    print("🚀 Scheduler started: Daily Reset, Morning Brief, Night Summary, Weekly Graph active.")
+    print("🚀 Scheduler started: Morning Brief, Night Summary, Weekly Graph active.")
     atexit.register(lambda: scheduler.shutdown())
@@ -0,0 +1,65 @@
+import os
+
+from sqlalchemy import event
+
+# Connection profile for the SQLite engine. Web threads, the Telegram
+# listener and the scheduler all write to the same file, so every new
+# connection gets WAL (readers never block the writer), a busy timeout (a
+# writer waits for the lock instead of failing with "database is locked")
+# and a few cache settings.
+#
+# Write transactions still start at the first INSERT/UPDATE/DELETE (the
+# sqlite3 driver's default), never as a read that upgrades later, so the
+# busy timeout covers every lock wait.
+
+PROFILES = {
+    'tuned': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 10000,     # ms
+        'synchronous': 'NORMAL',   # Durable at checkpoints; safe with WAL
+        'cache_size': -16384,      # Negative = KiB, so 16 MB per connection
+        'mmap_size': 134217728,    # 128 MB
+        'temp_store': 'MEMORY',
+    },
+    # SQLite's own defaults (rollback journal, no busy timeout), for comparison
+    'off': {},
+}
+
+# Per-pragma overrides, e.g. SQLITE_BUSY_TIMEOUT=30000
+ENV_OVERRIDES = {
+    'journal_mode': 'SQLITE_JOURNAL_MODE',
+    'busy_timeout': 'SQLITE_BUSY_TIMEOUT',
+    'synchronous': 'SQLITE_SYNCHRONOUS',
+    'cache_size': 'SQLITE_CACHE_SIZE',
+    'mmap_size': 'SQLITE_MMAP_SIZE',
+    'temp_store': 'SQLITE_TEMP_STORE',
+}
+
+
+def get_pragmas(profile=None):
+    """Pragmas for a profile (SQLITE_PROFILE, default 'tuned') plus env overrides."""
+    profile = profile or os.getenv('SQLITE_PROFILE', 'tuned')
+    if profile not in PROFILES:
+        raise ValueError(f"❌ Unknown SQLITE_PROFILE '{profile}' (use: {', '.join(PROFILES)})")
+
+    pragmas = dict(PROFILES[profile])
+    for name, env_var in ENV_OVERRIDES.items():
+        if os.getenv(env_var):
+            pragmas[name] = os.getenv(env_var)
+    return pragmas
+
+
+def install(engine, profile=None):
+    """Applies the profile's pragmas to every connection the engine opens."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = get_pragmas(profile)
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return pragmas
@@ -1,11 +1,96 @@
+import os
+import threading
 import time
 
-# Stores the timestamp of the last database change
-# We start with the current time
-last_change_ts = time.time()
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
 
+from app import events
+from app.extensions import db
+from app.models import DataVersion
 
-def touch():
-    """Updates the timestamp to now (signals a change happened)."""
-    global last_change_ts
-    last_change_ts = time.time()
+# Per-user data version, stored in the database so the web workers, the bot
+# thread and the scheduler all agree on it. Writers call touch() BEFORE their
+# commit: the bump rides in the same transaction, and any SSE event attached
+# to it is only published once that transaction actually commits.
+#
+# Commits made by another process (a second gunicorn worker, the bot or
+# scheduler in the leader, a maintenance script) never reach this process's
+# event queues. One watcher thread per process reads the versions of every
+# user with an open /api/events stream in a single query each WATCH_INTERVAL
+# and publishes a 'tasks' event for those that moved, so open tabs cost no
+# database reads of their own.
+
+WATCH_INTERVAL = int(os.getenv('EVENTS_POLL_INTERVAL', '5'))
+
+_watcher_lock = threading.Lock()
+_watcher_started = False
+
+
+def touch(user_id, topic=None, data=None):
+    """Bumps the user's data version in the current transaction and returns it."""
+    stmt = sqlite_insert(DataVersion).values(user_id=user_id, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DataVersion.user_id],
+        set_={'version': DataVersion.version + 1},
+    ).returning(DataVersion.version)
+    version = db.session.execute(stmt).scalar()
+
+    if topic:
+        payload = dict(data or {}, version=version)
+        db.session.info.setdefault('pending_events', []).append(
+            (user_id, topic, payload))
+    return version
+
+
+def get_version(user_id):
+    """Single primary-key lookup; 0 if the user never wrote anything."""
+    version = db.session.execute(
+        select(DataVersion.version).where(DataVersion.user_id == user_id)).scalar()
+    return version or 0
+
+
+def _watch(app):
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        known = events.known_versions()
+        if not known:
+            continue
+        try:
+            # Short-lived context so no read transaction stays open between checks
+            with app.app_context():
+                rows = db.session.execute(select(DataVersion.user_id, DataVersion.version).where(
+                    DataVersion.user_id.in_(known))).all()
+        except Exception as e:
+            print(f"❌ Version Watcher Error: {e}")
+            continue
+        for user_id, version in rows:
+            if version > known[user_id]:
+                events.publish(user_id, 'tasks', {'version': version})
+
+
+def start_watcher(app):
+    """Starts the version watcher once per process (on the first event stream)."""
+    global _watcher_started
+    with _watcher_lock:
+        if _watcher_started:
+            return
+        _watcher_started = True
+    thread = threading.Thread(target=_watch, args=(app,), name='version-watcher', daemon=True)
+    thread.start()
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending(session):
+    # One event per (user, topic) per transaction, carrying the latest version
+    latest = {}
+    for user_id, topic, data in session.info.pop('pending_events', []):
+        latest[(user_id, topic)] = data
+    for (user_id, topic), data in latest.items():
+        events.publish(user_id, topic, data)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending(session):
+    session.info.pop('pending_events', None)
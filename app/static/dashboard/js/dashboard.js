@@ -3,50 +3,70 @@
 // --- GLOBAL VARIABLES ---
 let editingTaskId = null;
 let deletingTaskId = null;
-let statsInterval = null;
-let currentDataVersion = null;
+let eventSource = null;
 let lastActionTime = 0;
 
 // Track Category Order for Slide Direction
 const categoryOrder = ['all', 'work', 'personal', 'dev', 'health'];
 let currentCategoryIndex = 0;
 
-// --- 1. SMART STATS POLLING ---
-function updateStats() {
-    fetch('/api/stats')
-        .then(res => res.json())
-        .then(data => {
-            if (document.getElementById('cpu-text')) {
-                document.getElementById('cpu-text').innerText = data.cpu + '%';
-                document.getElementById('cpu-bar').style.width = data.cpu + '%';
-                document.getElementById('ram-text').innerText = data.ram + '%';
-                document.getElementById('ram-bar').style.width = data.ram + '%';
-                document.getElementById('disk-text').innerText = data.disk + '%';
-                document.getElementById('disk-bar').style.width = data.disk + '%';
-            }
-            if (currentDataVersion === null) {
-                currentDataVersion = data.data_version;
-            } else if (data.data_version > currentDataVersion) {
-                if (Date.now() - lastActionTime < 5000) {
-                    currentDataVersion = data.data_version; // Silent sync if active
-                } else {
-                    location.reload(); // Refresh if idle
-                }
-            }
-        }).catch(console.error);
+// --- 1. LIVE UPDATES (Server-Sent Events) ---
+function renderStats(data) {
+    if (document.getElementById('cpu-text')) {
+        document.getElementById('cpu-text').innerText = data.cpu + '%';
+        document.getElementById('cpu-bar').style.width = data.cpu + '%';
+        document.getElementById('ram-text').innerText = data.ram + '%';
+        document.getElementById('ram-bar').style.width = data.ram + '%';
+        document.getElementById('disk-text').innerText = data.disk + '%';
+        document.getElementById('disk-bar').style.width = data.disk + '%';
+    }
 }
 
-function syncDataVersion() {
-    return fetch('/api/stats').then(res => res.json()).then(data => { currentDataVersion = data.data_version; });
+// Our own writes echo back through the stream; only react to remote ones
+function isOwnEcho() { return Date.now() - lastActionTime < 5000; }
+
+function startEvents() {
+    if (eventSource) return;
+    eventSource = new EventSource('/api/events');
+    eventSource.addEventListener('system', e => renderStats(JSON.parse(e.data)));
+    eventSource.addEventListener('tasks', () => { if (!isOwnEcho()) location.reload(); });
+    eventSource.addEventListener('history', () => { if (!isOwnEcho()) loadCharts(true); });
+    eventSource.onerror = () => {
+        // CLOSED (not reconnecting): the server had no free stream slot (204)
+        if (eventSource && eventSource.readyState === EventSource.CLOSED) {
+            stopEvents();
+            startPolling();
+        }
+    };
 }
+function stopEvents() { if (eventSource) { eventSource.close(); eventSource = null; } }
 
+// Fallback when the stream is refused: /api/stats every 5s (304 while nothing changed)
+let pollTimer = null;
+let lastVersion = null;
+
+function pollStats() {
+    fetch('/api/stats')
+        .then(r => r.json())
+        .then(data => {
+            renderStats(data);
+            if (lastVersion !== null && data.data_version !== lastVersion && !isOwnEcho()) location.reload();
+            lastVersion = data.data_version;
+        })
+        .catch(() => {});
+}
 function startPolling() {
-    if (!statsInterval) { updateStats(); statsInterval = setInterval(updateStats, 5000); }
+    if (pollTimer) return;
+    pollStats();
+    pollTimer = setInterval(pollStats, 5000);
 }
-function stopPolling() { if (statsInterval) { clearInterval(statsInterval); statsInterval = null; } }
+function stopPolling() { clearInterval(pollTimer); pollTimer = null; }
 
-document.addEventListener("visibilitychange", () => { document.hidden ? stopPolling() : startPolling(); });
-startPolling();
+// Hidden tabs hold neither a stream nor a timer; a visible one tries the stream first
+document.addEventListener("visibilitychange", () => {
+    if (document.hidden) { stopEvents(); stopPolling(); } else { startEvents(); }
+});
+startEvents();
 
 // --- 2. SMOOTH ANIMATIONS & FILTERING (THE FIX) ---
 
@@ -86,12 +106,7 @@ function filterTasks(category, btnElement) {
     setTimeout(() => {
         // 5. CHANGE THE DOM (Hide/Show Rows)
         document.querySelectorAll('.task-row').forEach(row => {
-            const rowCat = row.getAttribute('data-category');
-            const isCompleted = row.classList.contains('completed');
-            let shouldShow = (category === 'all') 
-                ? (!isCompleted || rowCat === 'general' || !rowCat) 
-                : (rowCat === category);
-            row.style.display = shouldShow ? 'flex' : 'none';
+            row.style.display = rowVisibleFor(category, row) ? 'flex' : 'none';
         });
 
         // 6. ANIMATE HEIGHT (Smooth Resize)
@@ -120,6 +135,14 @@ function filterTasks(category, btnElement) {
     }, 200); // Wait for Slide Out to finish
 }
 
+function rowVisibleFor(category, row) {
+    const rowCat = row.getAttribute('data-category');
+    const isCompleted = row.classList.contains('completed');
+    return (category === 'all')
+        ? (!isCompleted || rowCat === 'general' || !rowCat)
+        : (rowCat === category);
+}
+
 // Helper to animate height for other actions (like Quick Add)
 function updateWrapperHeight(elementInside) {
     const wrapper = elementInside.closest('.smooth-height-wrapper');
@@ -233,7 +256,7 @@ function performDelete(id) {
     }
     fetch(`/api/tasks/${id}/delete`, { method: 'DELETE' })
         .then(res => res.json())
-        .then(data => { if (data.success) { if (row) row.remove(); syncDataVersion(); loadCharts(); } });
+        .then(data => { if (data.success) { if (row) row.remove(); loadCharts(); } });
 }
 
 // --- 4. TASK ACTIONS ---
@@ -242,7 +265,7 @@ function editTask(element) {
     document.getElementById('m-content').value = element.getAttribute('data-content');
     document.getElementById('m-priority').value = element.getAttribute('data-priority');
     document.getElementById('m-color').value = element.getAttribute('data-color');
-    document.getElementById('m-recurrence').value = element.getAttribute('data-recurrence');
+    setRecurrence(element.getAttribute('data-recurrence'));
     document.getElementById('m-category').value = element.getAttribute('data-category');
     document.getElementById('m-is-habit').checked = element.getAttribute('data-ishabit') === 'true';
     const dateVal = element.getAttribute('data-date');
@@ -250,13 +273,28 @@ function editTask(element) {
     openModal(true);
 }
 
+// Presets map to the select; anything else is an RRULE shown in the text box
+function setRecurrence(value) {
+    const select = document.getElementById('m-recurrence');
+    const isPreset = [...select.options].some(o => o.value === value && o.value !== 'custom');
+    select.value = isPreset ? value : (value && value !== 'None' ? 'custom' : 'none');
+    document.getElementById('m-rrule').value = select.value === 'custom' ? value : '';
+    toggleRruleInput();
+}
+
+function toggleRruleInput() {
+    const custom = document.getElementById('m-recurrence').value === 'custom';
+    document.getElementById('m-rrule').style.display = custom ? '' : 'none';
+}
+
 function submitTaskForm() {
     const content = document.getElementById('m-content').value.trim();
     const priority = document.getElementById('m-priority').value;
     const date = document.getElementById('m-date').value;  // YYYY-MM-DD
     const time = document.getElementById('m-time')?.value || '08:00';  // Default 8 AM if no input
     const color = document.getElementById('m-color').value;
-    const recurrence = document.getElementById('m-recurrence').value;
+    let recurrence = document.getElementById('m-recurrence').value;
+    if (recurrence === 'custom') recurrence = document.getElementById('m-rrule').value.trim() || 'none';
     const category = document.getElementById('m-category').value;
     const is_habit = document.getElementById('m-is-habit').checked;
 
@@ -293,7 +331,7 @@ function submitTaskForm() {
         if (data.success || data.id) {
             location.reload();  // Refresh to see changes
         } else {
-            alert("Error saving task");
+            alert(data.error ? `Error saving task: ${data.error}` : "Error saving task");
         }
     })
     .catch(err => {
@@ -359,7 +397,6 @@ function toggleTask(id) {
                     filterTasks(cat, activePill);
                 }
 
-                syncDataVersion();
                 loadCharts(true);
 
             }, 300);
@@ -369,6 +406,139 @@ function toggleTask(id) {
         });
 }
 
+// --- 4b. OLDER COMPLETED TASKS (keyset-paginated, loaded on scroll) ---
+let archiveCursor = null;
+let archiveDone = false;
+let archiveLoading = false;
+
+// Mirrors the server-rendered row in main/dashboard.html. Task fields only
+// ever reach the DOM through textContent, setAttribute and style properties.
+function renderTaskRow(task) {
+    const row = document.createElement('div');
+    row.className = 'task-row' + (task.complete ? ' completed' : '');
+    row.id = `task-${task.id}`;
+    row.setAttribute('data-category', task.category);
+    row.innerHTML = `
+        <div class="priority-dot"></div>
+        <div class="task-info" onclick="editTask(this)">
+            <span class="task-title"></span>
+            <span class="task-meta"></span>
+        </div>
+        <div class="task-actions">
+            <button class="btn-check-circle" id="btn-check-${task.id}" onclick="toggleTask(${task.id})">${task.complete ? '<i class="fas fa-check"></i>' : ''}</button>
+            <button class="btn-delete" id="btn-del-${task.id}" onclick="handleDeleteClick(event, ${task.id})"><i class="fas fa-trash"></i></button>
+        </div>`;
+
+    // An invalid colour is dropped by the browser and the dot keeps its CSS default
+    const dot = row.querySelector('.priority-dot');
+    dot.style.backgroundColor = task.color || '#3b5bdb';
+    if (dot.style.backgroundColor) dot.style.boxShadow = `0 0 8px ${dot.style.backgroundColor}`;
+
+    const info = row.querySelector('.task-info');
+    Object.entries({
+        'data-id': task.id, 'data-content': task.content, 'data-priority': task.priority,
+        'data-date': task.due_date ? task.due_date.replace('T', ' ') : 'None', 'data-color': task.color,
+        'data-recurrence': task.recurrence, 'data-category': task.category,
+        'data-ishabit': task.is_habit ? 'true' : 'false'
+    }).forEach(([k, v]) => info.setAttribute(k, v));
+
+    const title = info.querySelector('.task-title');
+    title.textContent = `${task.content} `;
+    if (task.category !== 'general') {
+        const badge = document.createElement('span');
+        badge.className = `badge-mini badge-${task.category}`;
+        badge.textContent = task.category;
+        title.appendChild(badge);
+    }
+
+    const meta = info.querySelector('.task-meta');
+    const priority = task.priority ? task.priority.charAt(0).toUpperCase() + task.priority.slice(1) : '';
+    meta.textContent = priority + (task.due_label ? ` • ${task.due_label}` : '');
+    if (task.recurrence && task.recurrence !== 'none') {
+        const icon = document.createElement('i');
+        icon.className = 'fas fa-sync-alt';
+        icon.setAttribute('title', `Repeats: ${task.recurrence}`);
+        meta.append(' • ', icon);
+    }
+    return row;
+}
+
+// Server-side search (/api/tasks/search) over every task, archive included
+let searchTimer = null;
+let searchSeq = 0;
+
+function onTaskSearch() {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(runTaskSearch, 250);
+}
+
+function runTaskSearch() {
+    const q = document.getElementById('task-search').value.trim();
+    const results = document.getElementById('task-search-results');
+    const taskList = document.getElementById('task-list');
+    if (!q) {
+        results.style.display = 'none';
+        results.innerHTML = '';
+        taskList.style.display = '';
+        return;
+    }
+    const params = new URLSearchParams({ q, limit: 30 });
+    const activeCategory = categoryOrder[currentCategoryIndex];
+    if (activeCategory && activeCategory !== 'all') params.set('category', activeCategory);
+
+    const seq = ++searchSeq;
+    fetch(`/api/tasks/search?${params}`)
+        .then(res => res.json())
+        .then(data => {
+            if (seq !== searchSeq) return;  // A newer search is on its way
+            results.innerHTML = '';
+            (data.tasks || []).forEach(task => {
+                const row = renderTaskRow(task);
+                row.id = `search-${task.id}`;  // Keep task-<id> unique to the list
+                row.style.display = 'flex';
+                results.appendChild(row);
+            });
+            if (!results.children.length) {
+                results.innerHTML = '<p style="color: var(--text-gray); padding: 10px">No matching tasks.</p>';
+            }
+            results.style.display = '';
+            taskList.style.display = 'none';
+        })
+        .catch(console.error);
+}
+
+function loadArchivedTasks() {
+    if (archiveLoading || archiveDone) return;
+    archiveLoading = true;
+    const params = new URLSearchParams({ scope: 'archive', limit: 30 });
+    if (archiveCursor) params.set('cursor', archiveCursor);
+
+    fetch(`/api/tasks/list?${params}`)
+        .then(res => res.json())
+        .then(data => {
+            const taskList = document.getElementById('task-list');
+            const activeCategory = categoryOrder[currentCategoryIndex];
+            data.tasks.forEach(task => {
+                if (document.getElementById(`task-${task.id}`)) return;
+                const row = renderTaskRow(task);
+                row.style.display = rowVisibleFor(activeCategory, row) ? 'flex' : 'none';
+                taskList.appendChild(row);
+            });
+            archiveCursor = data.next_cursor;
+            archiveDone = !data.next_cursor;
+        })
+        .catch(console.error)
+        .finally(() => { archiveLoading = false; });
+}
+
+function watchArchiveSentinel() {
+    const sentinel = document.getElementById('task-archive-sentinel');
+    if (!sentinel || !window.IntersectionObserver) return;
+    new IntersectionObserver(entries => {
+        if (entries.some(e => e.isIntersecting)) loadArchivedTasks();
+    }, { rootMargin: '200px' }).observe(sentinel);
+}
+
 // --- 5. CHART ENGINE ---
 function loadCharts(softUpdate = false) {
     if (!softUpdate) console.log("📊 Loading Charts...");
@@ -391,8 +561,10 @@ function loadCharts(softUpdate = false) {
                 let offset = percent !== null ? circumference - (percent / 100) * circumference : circumference;
                 let textValue = percent !== null ? percent + '%' : '-';
                 
-                // Note the class 'desktop-ring' added here
-                const html = `
+                // Note the class 'desktop-ring' added here. Labels are category names
+                // the user typed: they only go in through textContent
+                const item = document.createElement('div');
+                item.innerHTML = `
                     <div class="radial-item desktop-ring" style="position: relative; width: 80px; display: flex; flex-direction: column; align-items: center; margin-bottom: 10px;">
                         <div style="position: relative; width: 80px; height: 80px;">
                             <svg class="progress-ring" width="80" height="80">
@@ -400,11 +572,14 @@ function loadCharts(softUpdate = false) {
                                 <circle class="progress-ring__circle" stroke="${strokeColor}" stroke-width="8" fill="transparent" r="35" cx="40" cy="40"
                                     style="stroke-dasharray: ${circumference}; stroke-dashoffset: ${circumference}; transform: rotate(-90deg); transform-origin: 50% 50%; transition: stroke-dashoffset 1s ease-out;"/>
                             </svg>
-                            <div class="radial-text" style="position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); font-weight: bold; color: white;">${textValue}</div>
+                            <div class="radial-text" style="position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); font-weight: bold; color: white;"></div>
                         </div>
-                        <div class="radial-label" style="font-size: 12px; color: #888; margin-top: 5px; text-align: center;">${label}</div>
+                        <div class="radial-label" style="font-size: 12px; color: #888; margin-top: 5px; text-align: center;"></div>
                     </div>`;
-                radialContainer.innerHTML += html;
+                const ring = item.firstElementChild;
+                ring.querySelector('.radial-text').textContent = textValue;
+                ring.querySelector('.radial-label').textContent = label;
+                radialContainer.appendChild(ring);
                 setTimeout(() => { 
                     if(radialContainer.children[index])
                         radialContainer.children[index].querySelector('.progress-ring__circle').style.strokeDashoffset = offset; 
@@ -430,7 +605,7 @@ function loadCharts(softUpdate = false) {
                     <div class="radial-label" style="font-size: 1rem; color: #aaa; margin-top: 10px; text-align: center;">Overall Focus</div>
                 </div>`;
                 
-            radialContainer.innerHTML += mobileHtml;
+            radialContainer.insertAdjacentHTML('beforeend', mobileHtml);
             setTimeout(() => { 
                 const mobRing = radialContainer.querySelector('.mobile-ring .progress-ring__circle');
                 if(mobRing) mobRing.style.strokeDashoffset = mobileOffset; 
@@ -445,30 +620,33 @@ function loadCharts(softUpdate = false) {
                 heatmapContainer.innerHTML = '';
 
                 if (data.heatmap && data.heatmap.length > 0) {
+                    const days = monthDays(data.month);
                     data.heatmap.forEach(habit => {
+                        const done = new Set(habit.done);
                         const habitWrapper = document.createElement('div');
                         habitWrapper.className = 'habit-row';
                         habitWrapper.setAttribute('id', `habit-row-${habit.id}`);
                         habitWrapper.style.marginBottom = '20px';
 
                         const titleDiv = document.createElement('div');
-                        titleDiv.style.cssText = `color:${habit.color}; font-weight:bold; font-size:0.9rem; margin-bottom:8px;`;
+                        titleDiv.style.cssText = 'font-weight:bold; font-size:0.9rem; margin-bottom:8px;';
+                        titleDiv.style.color = habit.color;
                         titleDiv.innerText = habit.name;
+                        const statsSpan = document.createElement('span');
+                        statsSpan.className = 'habit-stats';
+                        statsSpan.style.cssText = 'color:var(--text-gray); font-weight:normal; font-size:0.8rem; margin-left:8px;';
+                        statsSpan.innerText = habitStatsText(habit.stats);
+                        titleDiv.appendChild(statsSpan);
                         habitWrapper.appendChild(titleDiv);
 
                         const rowDiv = document.createElement('div');
                         rowDiv.style.cssText = 'display:flex; gap:5px; flex-wrap:wrap;';
 
-                        habit.data.forEach((day, i) => {
+                        days.forEach((day, i) => {
                             const dot = document.createElement('div');
                             dot.className = 'habit-dot animate-pop';
                             dot.style.animationDelay = `${i * 0.03}s`;
-
-                            // Date + Day Letter Calculation (e.g. "28 T")
-                            const dayNum = day.real_date.split('-')[2];
-                            const dateObj = new Date(day.real_date + 'T00:00:00');
-                            const dayLetter = dateObj.toLocaleDateString('en-US', { weekday: 'narrow' });
-                            dot.setAttribute('data-date', `${dayNum} ${dayLetter}`);
+                            dot.setAttribute('data-date', day.label);
 
                             dot.style.cssText = `
                                 width:16px; height:16px; min-width:16px; min-height:16px; flex-shrink:0; 
@@ -482,9 +660,9 @@ function loadCharts(softUpdate = false) {
                                 dot.style.cursor = 'default';
                                 dot.title = "Future date";
                             } else {
-                                dot.style.backgroundColor = day.y > 0 ? day.fillColor : 'rgba(255,255,255,0.1)';
+                                dot.style.backgroundColor = done.has(i) ? habit.color : 'rgba(255,255,255,0.1)';
                                 dot.style.cursor = 'pointer';
-                                dot.onclick = function () { handleDotClick(this, habit.id, day.real_date, habit.color); };
+                                dot.onclick = function () { handleDotClick(this, habit.id, day.date, habit.color); };
                             }
                             rowDiv.appendChild(dot);
                         });
@@ -498,12 +676,12 @@ function loadCharts(softUpdate = false) {
                 data.heatmap.forEach((habit) => {
                     const row = document.getElementById(`habit-row-${habit.id}`);
                     if (row) {
-                        const dots = row.querySelectorAll('.habit-dot');
-                        habit.data.forEach((day, dIndex) => {
-                            const dot = dots[dIndex];
-                            if (dot && !dot.classList.contains('confirming') && !dot.classList.contains('processing') && !day.is_future) {
-                                const newColor = day.y > 0 ? day.fillColor : 'rgba(255,255,255,0.1)';
-                                dot.style.backgroundColor = newColor;
+                        const done = new Set(habit.done);
+                        const statsSpan = row.querySelector('.habit-stats');
+                        if (statsSpan) statsSpan.innerText = habitStatsText(habit.stats);
+                        row.querySelectorAll('.habit-dot').forEach((dot, dIndex) => {
+                            if (!dot.classList.contains('confirming') && !dot.classList.contains('processing') && dIndex <= data.month.today) {
+                                dot.style.backgroundColor = done.has(dIndex) ? habit.color : 'rgba(255,255,255,0.1)';
                             }
                         });
                     }
@@ -513,6 +691,30 @@ function loadCharts(softUpdate = false) {
     }).catch(err => console.error("🔥 Chart Error:", err));
 }
 
+// "🔥 5d · best 12 · 4/7 this week · 60% this month"
+function habitStatsText(stats) {
+    if (!stats) return '';
+    const parts = [];
+    if (stats.streak) parts.push(`🔥 ${stats.streak}d`);
+    if (stats.longest) parts.push(`best ${stats.longest}`);
+    parts.push(`${stats.week}/7 this week`, `${stats.month_rate}% this month`);
+    return parts.join(' · ');
+}
+
+// Expands the compact {start, days, today} month header into per-day info
+function monthDays(month) {
+    const start = new Date(month.start + 'T00:00:00');
+    const days = [];
+    for (let i = 0; i < month.days; i++) {
+        const d = new Date(start.getFullYear(), start.getMonth(), start.getDate() + i);
+        const iso = `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`;
+        // Date + Day Letter (e.g. "28 T")
+        const label = `${String(d.getDate()).padStart(2, '0')} ${d.toLocaleDateString('en-US', { weekday: 'narrow' })}`;
+        days.push({ date: iso, label, is_future: i > month.today });
+    }
+    return days;
+}
+
 function getColor(index) { return ['#3b5bdb', '#2ecc71', '#f1c40f', '#e74c3c', '#9b59b6'][index % 5]; }
 
 // --- 6. HABIT ANIMATION (Double-Tap) ---
@@ -557,7 +759,6 @@ function handleDotClick(dotElement, taskId, dateStr, taskColor) {
             dotElement.style.transform = 'scale(1)';
             dotElement.style.boxShadow = 'none';
             dotElement.classList.remove('processing');
-            syncDataVersion();
             loadCharts(true);
         }, 400);
     });
@@ -566,6 +767,7 @@ function handleDotClick(dotElement, taskId, dateStr, taskColor) {
 // --- INIT ---
 document.addEventListener('DOMContentLoaded', () => {
     loadCharts();
+    watchArchiveSentinel();
     const modal = document.getElementById('task-modal');
     if (modal) modal.addEventListener('click', (e) => { if (e.target === modal) closeModal(); });
     const delModal = document.getElementById('delete-modal');
@@ -30,7 +30,7 @@ document.addEventListener("DOMContentLoaded", function () {
         
         clearTimeout(timeout);
         timeout = setTimeout(() => {
-            fetch(`/gym/api/search_exercises?q=${query}`)
+            fetch(`/gym/api/search_exercises?q=${encodeURIComponent(query.trim().toLowerCase())}`)
                 .then(response => response.json())
                 .then(data => {
                     suggestionsBox.innerHTML = '';
@@ -55,7 +55,7 @@ document.addEventListener("DOMContentLoaded", function () {
                             `;
                             
                             div.onclick = () => {
-                                selectTemplate(item, item.id); // Passing ID (assuming API sends it, we might need to add it to routes.py api)
+                                selectTemplate(item);
                             };
                             
                             div.onmouseover = () => { div.style.background = '#252525'; };
@@ -67,18 +67,13 @@ document.addEventListener("DOMContentLoaded", function () {
                         suggestionsBox.style.display = 'none'; 
                     }
                 });
-        }, 300);
+        }, 150);
     }
 
-    // We need to fetch the ID in the API. If API doesn't return ID, we rely on name matching in backend.
-    // For now, let's update the API call in routes.py to include 'id'.
-    // Assuming you updated routes.py as well. If not, backend will handle name match.
-    // But hidden ID is safer.
-    
     function selectTemplate(item) {
         // 1. Fill Data
         inputField.value = item.name_en;
-        hiddenIdField.value = item.name_en; // Use name as ID for backend lookup if ID missing
+        hiddenIdField.value = item.id; // Library ID from the search API
         document.getElementById('ex-es').value = item.name_es;
         document.getElementById('ex-sets').value = item.default_sets;
         document.getElementById('ex-reps').value = item.default_reps;
@@ -1,29 +1,69 @@
+import hashlib
 import os
+import secrets
 import telebot
-from . import state
+from . import outbox, state
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 from flask import current_app
 import threading
 import time
+from datetime import datetime, timedelta
 from app.extensions import db
-from .models import Task, TaskHistory
-from datetime import datetime, timezone
+from .models import Task, NotificationSettings
+from .modules.tasks import ops
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # --- CONFIGURATION ---
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 
+# 'polling' (default): one long-poll thread in the leader process.
+# 'webhook': Telegram POSTs updates to /telegram/webhook on any web worker.
+TELEGRAM_MODE = os.getenv('TELEGRAM_MODE', 'polling')
+WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')        # Public https URL of /telegram/webhook
+WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')  # Echoed back by Telegram in a header
+
+# Point the bot at another Bot API server (local bot-api server, fake one for tests)
+if os.getenv('TELEGRAM_API_URL'):
+    telebot.apihelper.API_URL = os.getenv('TELEGRAM_API_URL').rstrip('/') + '/bot{0}/{1}'
+
 # Initialize the Bot
 bot = telebot.TeleBot(BOT_TOKEN, threaded=False)
 
 
+def webhook_enabled():
+    return TELEGRAM_MODE == 'webhook' and bool(WEBHOOK_SECRET)
+
+
+def register_webhook():
+    """Tells Telegram where to deliver updates (once, from the leader)."""
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        print("❌ Webhook mode needs TELEGRAM_WEBHOOK_URL and TELEGRAM_WEBHOOK_SECRET.")
+        return False
+    try:
+        bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET,
+                        allowed_updates=['message', 'callback_query'])
+        print(f"🪝 Telegram webhook set: {WEBHOOK_URL}")
+        return True
+    except Exception as e:
+        print(f"❌ Webhook Setup Error: {e}")
+        return False
+
+
 def start_bot_listener(app):
-    """Starts the bot polling loop in a separate background thread."""
+    """Starts the bot polling loop in a separate background thread (or sets the webhook)."""
+    if TELEGRAM_MODE == 'webhook':
+        register_webhook()
+        return
+
     def listener_loop():
         # We need to manually push the app context since this is a new thread
         with app.app_context():
             print("🤖 Bot Listener Started...")
             try:
+                # getUpdates is refused while a webhook is set (e.g. after switching modes)
+                bot.remove_webhook()
                 # This infinite loop listens for clicks
                 bot.infinity_polling(timeout=10, long_polling_timeout=5)
             except Exception as e:
@@ -36,26 +76,50 @@ def start_bot_listener(app):
 # --- SENDING MESSAGES ---
 
 
-def send_telegram_message(message):
-    """Standard text message (no buttons)."""
-    try:
-        bot.send_message(CHAT_ID, message, parse_mode='HTML')
-    except Exception as e:
-        print(f"❌ Telegram Send Error: {e}")
+# All sends go through the outbox queue (app/outbox.py): these return at once.
 
 
-def send_telegram_photo(caption, image_buffer):
-    """Sends an image."""
-    try:
-        bot.send_photo(CHAT_ID, photo=image_buffer,
-                       caption=caption, parse_mode='HTML')
-    except Exception as e:
-        print(f"❌ Telegram Photo Error: {e}")
+def send_telegram_message(message, chat_id=None):
+    """Standard text message (no buttons). Goes to the global CHAT_ID by default."""
+    return outbox.enqueue(bot.send_message, chat_id or CHAT_ID, text=message, parse_mode='HTML')
 
 
-def send_task_alert(task):
-    """Sends a Task Alert with Action Buttons."""
-    msg = f"⚠️ <b>Urgent Task Overdue!</b>\n\n{task.content}"
+def send_telegram_photo(caption, image, chat_id=None):
+    """Sends an image (PNG bytes or a buffer)."""
+    # Raw bytes rather than the buffer, so a retry can upload them again
+    photo = image.getvalue() if hasattr(image, 'getvalue') else image
+    return outbox.enqueue(_send_photo, chat_id or CHAT_ID, photo=photo,
+                          digest=hashlib.sha256(photo).hexdigest(),
+                          caption=caption, parse_mode='HTML')
+
+
+# Telegram file_id of every image uploaded so far, by content hash: sending
+# the same PNG again (other chat, repeated briefing) reuses it instead of
+# uploading. Only the outbox worker thread touches this.
+PHOTO_ID_CACHE_SIZE = 256
+_photo_ids = OrderedDict()
+
+
+def _send_photo(chat_id, photo, digest, **kwargs):
+    file_id = _photo_ids.get(digest)
+    if file_id:
+        _photo_ids.move_to_end(digest)
+        return bot.send_photo(chat_id, photo=file_id, **kwargs)
+
+    message = bot.send_photo(chat_id, photo=photo, **kwargs)
+    if message and message.photo:
+        _photo_ids[digest] = message.photo[-1].file_id  # Largest size
+        while len(_photo_ids) > PHOTO_ID_CACHE_SIZE:
+            _photo_ids.popitem(last=False)
+    return message
+
+
+def send_task_alert(task, chat_id=None):
+    """Sends a Task Alert with Action Buttons (app/reminders.py, at the due time)."""
+    title = "🔥 <b>Urgent Task Due!</b>" if task.priority == 'urgent' else "⏰ <b>Reminder</b>"
+    msg = f"{title}\n\n{task.content}"
+    if task.due_date:
+        msg += f"\n🕗 {task.due_date:%a %d %b, %H:%M}"
 
     # Create the Keyboard (Buttons)
     markup = InlineKeyboardMarkup()
@@ -64,73 +128,189 @@ def send_task_alert(task):
     # Button 1: Mark Done
     btn_done = InlineKeyboardButton(
         "✅ Mark Done", callback_data=f"done_{task.id}")
-    # Button 2: Snooze (Optional Future Feature)
+    # Button 2: Snooze (sets snooze_until, the reminder comes back in an hour)
     btn_snooze = InlineKeyboardButton(
         "💤 Snooze 1h", callback_data=f"snooze_{task.id}")
 
     markup.add(btn_done, btn_snooze)
 
-    try:
-        bot.send_message(CHAT_ID, msg, parse_mode='HTML', reply_markup=markup)
-    except Exception as e:
-        print(f"❌ Telegram Alert Error: {e}")
+    return outbox.enqueue(bot.send_message, chat_id or CHAT_ID, text=msg, parse_mode='HTML',
+                          reply_markup=markup)
+
+# --- CHAT <-> USER ---
+# A chat is only linked by someone who can write in it: the settings page
+# issues a one-time code and the chat sends the bot "/start <code>". Only the
+# code's hash is stored, and it expires after LINK_CODE_MINUTES.
+
+LINK_CODE_MINUTES = 15
+
+
+def _code_hash(code):
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+def issue_link_code(prefs):
+    """New one-time code for prefs (replacing any pending one); the caller commits."""
+    code = secrets.token_urlsafe(12)
+    prefs.link_code_hash = _code_hash(code)
+    prefs.link_code_expires = datetime.now() + timedelta(minutes=LINK_CODE_MINUTES)
+    return code
+
+
+def redeem_link_code(code, chat_id):
+    """Links chat_id to the code's owner and commits; their user id, or None."""
+    prefs = NotificationSettings.query.filter_by(link_code_hash=_code_hash(code)).first()
+    if not prefs or prefs.link_code_expires < datetime.now():
+        return None
+    prefs.chat_id = str(chat_id)
+    prefs.link_code_hash = prefs.link_code_expires = None
+    state.touch(prefs.user_id)  # Lets the reminder thread pick up the new chat
+    db.session.commit()
+    return prefs.user_id
+
+
+@bot.message_handler(commands=['start'])
+def handle_start(message):
+    """'/start <code>' from the settings page links this chat to that account."""
+    code = (message.text or '').partition(' ')[2].strip()
+    if not code:
+        send_telegram_message("👋 Open Settings on the dashboard and send me the /start code shown there.",
+                              message.chat.id)
+        return
+    # Fresh app context = fresh session (the polling thread keeps one for its whole life)
+    with current_app.app_context():
+        user_id = redeem_link_code(code, message.chat.id)
+    if user_id is None:
+        send_telegram_message("⚠️ That code is invalid or expired. Get a new one in Settings.",
+                              message.chat.id)
+    else:
+        send_telegram_message("✅ This chat will now receive your briefings and reminders.",
+                              message.chat.id)
+
+
+
+def chat_user_ids(chat_id):
+    """Users whose briefings go to this chat (the global CHAT_ID belongs to user 1)."""
+    chat_id = str(chat_id)
+    user_ids = {user_id for (user_id,) in db.session.query(
+        NotificationSettings.user_id).filter(NotificationSettings.chat_id == chat_id)}
+    if CHAT_ID and chat_id == str(CHAT_ID) and not db.session.query(
+            NotificationSettings.chat_id).filter(NotificationSettings.user_id == 1).scalar():
+        user_ids.add(1)
+    return user_ids
 
 # --- HANDLING CLICKS (CALLBACKS) ---
+# The bot itself is single-threaded (threaded=False), so the handler only
+# acknowledges the click and hands the work to a small pool: presses on
+# different tasks run in parallel, presses on the same task are chained (the
+# next one is submitted only when the previous finishes, so no worker ever
+# sits waiting), and a slow Telegram edit holds up nobody else. The chain only
+# orders presses within this process; across processes the unique index on
+# task_history keeps a double "done" from recording the day twice.
+
+CALLBACK_WORKERS = int(os.getenv('BOT_CALLBACK_WORKERS', '4'))
+MAX_PENDING_CALLBACKS = CALLBACK_WORKERS * 16  # Running + waiting; more get "busy"
+
+_callback_pool = ThreadPoolExecutor(max_workers=CALLBACK_WORKERS, thread_name_prefix='bot-callback')
+_callbacks = threading.Condition()  # Guards the counter and the chains
+_chains = {}  # task_id -> deque of presses waiting behind the running one
+_pending_callbacks = 0
 
 
 @bot.callback_query_handler(func=lambda call: True)
 def handle_query(call):
     """This function runs when you click a button."""
+    global _pending_callbacks
+    action, _, task_id = (call.data or '').partition('_')
+    if action not in ('done', 'snooze') or not task_id.isdigit():
+        _answer(call.id, "Unknown button.")
+        return
+
+    with _callbacks:
+        busy = _pending_callbacks >= MAX_PENDING_CALLBACKS
+        if not busy:
+            _pending_callbacks += 1
+    if busy:
+        _answer(call.id, "⏳ Busy, try again in a moment.")
+        return
 
-    # --- FIX: Force Fresh Database Connection ---
-    # This clears the "stale" session so we see new tasks created by the website
-    db.session.remove()
-    # ------------------------------------------
+    # Acknowledge the click at once (stops the button from loading/spinning)
+    _answer(call.id, "Processing...")
+    app = current_app._get_current_object()  # Polling thread and webhook request both have one
+    job = (app, action, int(task_id), call.message.chat.id, call.message.message_id)
+    with _callbacks:
+        queued = _chains.get(job[2])
+        if queued is None:
+            _chains[job[2]] = deque()
+        else:
+            queued.append(job)
+    if queued is None:
+        _callback_pool.submit(_run_callback, *job)
 
-    action, task_id = call.data.split('_')
 
+def flush_callbacks(timeout=5):
+    """Waits (up to timeout) until every accepted callback has been handled."""
+    with _callbacks:
+        return _callbacks.wait_for(lambda: _pending_callbacks == 0, timeout)
+
+
+def _answer(callback_id, text):
+    try:
+        bot.answer_callback_query(callback_id, text)
+    except Exception as e:
+        print(f"❌ Callback Answer Error: {e}")
+
+
+def _run_callback(app, action, task_id, chat_id, message_id):
+    global _pending_callbacks
     try:
-        # Acknowledge the click (stops the button from loading/spinning)
-        bot.answer_callback_query(call.id, "Processing...")
+        # Fresh app context = fresh session, so tasks created by the website are seen
+        with app.app_context():
+            _apply_callback(action, task_id, chat_id, message_id)
+    finally:
+        with _callbacks:
+            _pending_callbacks -= 1
+            queued = _chains[task_id]
+            following = queued.popleft() if queued else None
+            if following is None:
+                del _chains[task_id]
+            _callbacks.notify_all()
+        if following is not None:
+            _callback_pool.submit(_run_callback, *following)
+
+
+def _apply_callback(action, task_id, chat_id, message_id):
+    try:
+        task = db.session.get(Task, task_id)
 
-        task = Task.query.get(int(task_id))
+        # Buttons only act on tasks owned by a user of this chat
+        if task and task.user_id not in chat_user_ids(chat_id):
+            task = None
 
         if not task:
             # If we STILL can't find it, it's genuinely gone
-            bot.send_message(call.message.chat.id,
-                             "⚠️ Task not found (maybe deleted?).")
+            bot.send_message(chat_id, "⚠️ Task not found (maybe deleted?).")
             return
 
         if action == "done":
-            # 1. Update DB
-            task.complete = True
-            task.last_completed = datetime.now(timezone.utc)
-
-            # Habit History Logic
-            if task.is_habit:
-                today = datetime.now(timezone.utc).date()
-                exists = TaskHistory.query.filter_by(
-                    task_id=task.id, completed_date=today).first()
-                if not exists:
-                    h = TaskHistory(task_id=task.id,
-                                    completed_date=today, status='completed')
-                    db.session.add(h)
-
+            # 1. Update DB: same path as the dashboard (history for habits and
+            # recurring tasks, change signal in the same transaction)
+            ops.complete_task(task)
             db.session.commit()
 
-            # 2. SIGNAL THE CHANGE (Auto-Refresh Dashboard)
-            from . import state
-            state.touch()
-
-            # 3. Update the Message
+            # 2. Update the Message
             new_text = f"✅ <b>COMPLETED:</b>\n{task.content}"
-            bot.edit_message_text(chat_id=call.message.chat.id,
-                                  message_id=call.message.message_id, text=new_text, parse_mode='HTML')
+            bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=new_text,
+                                  parse_mode='HTML')
 
         elif action == "snooze":
-            bot.send_message(call.message.chat.id,
-                             "💤 Snooze not implemented yet.")
+            until = ops.snooze_task(task)
+            db.session.commit()  # The reminder thread picks up the new time
+            bot.edit_message_text(chat_id=chat_id, message_id=message_id,
+                                  text=f"💤 <b>SNOOZED until {until:%H:%M}:</b>\n{task.content}",
+                                  parse_mode='HTML')
 
     except Exception as e:
+        db.session.rollback()
         print(f"❌ Button Error: {e}")
-        bot.send_message(call.message.chat.id, f"Error: {str(e)}")
+        bot.send_message(chat_id, f"Error: {str(e)}")
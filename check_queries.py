@@ -0,0 +1,219 @@
+# check_queries.py - Query plan regression check for the hot queries.
+#
+# Builds a database from the models with one seeded gym program (so eager
+# loads actually run), calls every hot query through the helper the app
+# itself calls, captures the SQL, and asks SQLite for its EXPLAIN QUERY PLAN.
+# Then renders the busiest pages and counts their queries, so a lazy load in
+# a template loop (N+1) shows up as a budget overrun. Exits with status 1 on
+# a full table scan or an overrun.
+#
+#   python check_queries.py
+import os
+import re
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+
+# Importing the app package pulls in the Telegram bot module, which refuses
+# to load without a token. Nothing is sent from here.
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:query-check')
+
+from flask import Flask
+from sqlalchemy import event, or_
+
+from app import habits, recurrence, reminders, scheduler
+from app.extensions import db, login_manager
+from app.models import User, Task, TaskHistory, DataVersion
+from app.modules.gym import search as gym_search
+from app.modules.gym import routes as gym_routes
+from app.modules.gym.models import GymProgram, GymRoutine, GymExercise, GymExerciseLibrary
+from app.modules.auth.routes import auth_bp
+from app.modules.dashboard.routes import dashboard_bp
+from app.modules.tasks import queries, search
+from app.modules.tasks.routes import tasks_bp
+from app.modules.telegram.routes import telegram_bp
+from app.telegram_bot import chat_user_ids, redeem_link_code
+
+# FTS5 reports a MATCH lookup as a virtual table scan with a constraint ("INDEX 0:M1")
+SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)\b(?! VIRTUAL TABLE INDEX \d+:\S)')
+
+USER_ID = 1
+USER_IDS = [1, 2, 3]
+TODAY = date.today()
+TODAY_START = datetime.combine(TODAY, time.min)
+TOMORROW_START = TODAY_START + timedelta(days=1)
+MONTH_START = TODAY.replace(day=1)
+
+# name -> callable running the query exactly like the app does
+HOT_QUERIES = {
+    'login lookup': lambda: User.query.filter(
+        or_(User.email == 'x', User.username == 'x')).first(),
+    'load user': lambda: db.session.get(User, USER_ID),
+    'data version': lambda: db.session.query(DataVersion.version).filter(
+        DataVersion.user_id == USER_ID).scalar(),
+    'dashboard tasks': lambda: queries.visible_tasks(USER_ID, TODAY),
+    'task list page': lambda: queries.list_page(
+        USER_ID, queries.archived_clause(TODAY_START),
+        queries.encode_cursor(Task(id=7, complete=True, due_date=TODAY_START)), 30),
+    'search text': lambda: search.search(USER_ID, {'q': 'buy mil', 'status': 'open'}),
+    'search filters': lambda: search.search(USER_ID, {'category': 'work', 'priority': 'urgent'}),
+    'search no filters': lambda: search.search(USER_ID, {}),
+    'charts radial': lambda: queries.category_progress(USER_ID, TODAY),
+    'user habits': lambda: Task.query.filter_by(user_id=USER_ID, is_habit=True).all(),
+    'month heatmap': lambda: habits.load_range(USER_ID, [1, 2, 3], MONTH_START, TODAY),
+    'history exists': lambda: TaskHistory.query.filter_by(
+        task_id=1, completed_date=TODAY).first(),
+    'range heatmap': lambda: habits.load_range(
+        USER_ID, [1, 2, 3], TODAY - timedelta(days=365), TODAY),
+    'habit stats': lambda: habits.load_stats([1, 2, 3], TODAY),
+    'briefing overdue': lambda: scheduler.overdue_tasks(USER_IDS, TODAY_START),
+    'briefing today': lambda: scheduler.tasks_due_between(USER_IDS, TODAY_START, TOMORROW_START),
+    'recurring tasks': lambda: scheduler.recurring_tasks(USER_IDS),
+    'recurrence periods': lambda: recurrence.annotate(
+        Task.query.filter(Task.user_id == USER_ID).all(), TODAY),
+    'summary completed': lambda: scheduler.completed_since(USER_IDS, TODAY_START),
+    'summary tomorrow': lambda: scheduler.tasks_due_between(
+        USER_IDS, TOMORROW_START, TOMORROW_START + timedelta(days=1)),
+    'weekly habits': lambda: scheduler.habit_tasks(USER_IDS),
+    'chat users': lambda: chat_user_ids('123456789'),
+    'chat link code': lambda: redeem_link_code('not-a-code', '123456789'),
+    'reminders': lambda: reminders.upcoming_tasks(USER_IDS, TODAY_START),
+    'recurring reset': lambda: (scheduler.reset_recurring_tasks(TODAY), db.session.rollback()),
+    'gym active program': lambda: gym_routes.active_program(USER_ID),
+    'gym routine': lambda: gym_routes.load_routine(1),
+    'gym day by index': lambda: gym_routes.routine_at(1, 1),
+    'gym library by name': lambda: gym_routes.library_item_named(USER_ID, 'Squat'),
+    'gym exercise index': lambda: gym_search._build(USER_ID),
+}
+
+
+# page -> (URL, most queries a visit may run, login included). The seeded
+# program has 7 days of EXERCISES_PER_DAY exercises each, so a per-row load
+# overshoots by dozens.
+PAGE_BUDGETS = {
+    'gym index': ('/gym/', 4),
+    'gym routine': ('/gym/routine/1', 3),
+}
+EXERCISES_PER_DAY = 6
+
+
+def make_app(db_path):
+    app = Flask('app')  # The app package's templates, for the page budgets
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SECRET_KEY'] = 'query-check'
+    db.init_app(app)
+    login_manager.init_app(app)
+    login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+    for blueprint in (auth_bp, dashboard_bp, gym_routes.gym_bp, tasks_bp, telegram_bp):
+        app.register_blueprint(blueprint)
+    return app
+
+
+@contextmanager
+def capture_sql():
+    """Collects (statement, parameters) for everything executed in the block."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain(statement, parameters):
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def check(hot_queries):
+    """Returns {name: [(plan lines, scanned tables)]} for every query."""
+    report = {}
+    for name, run in hot_queries.items():
+        with capture_sql() as statements:
+            run()
+        report[name] = []
+        for statement, parameters in statements:
+            plan = explain(statement, parameters)
+            scans = [m.group(1) for m in map(SCAN_RE.match, plan) if m]
+            report[name].append((plan, scans))
+    return report
+
+
+def seed_gym():
+    """User 1 with an active 7-day program, every day full of library exercises."""
+    db.session.add(User(id=USER_ID, username='check', password='x'))
+    program = GymProgram(id=1, user_id=USER_ID, name='Check Program', is_active=True)
+    db.session.add(program)
+    for day in range(1, 8):
+        routine = GymRoutine(id=day, user_id=USER_ID, program=program,
+                             name=f'Day {day}', order_index=day)
+        for n in range(EXERCISES_PER_DAY):
+            item = GymExerciseLibrary(user_id=USER_ID, name_en=f'Exercise {day}.{n}',
+                                      video_url='https://example.com/v')
+            routine.exercises.append(GymExercise(name=item.name_en, library_item=item))
+        db.session.add(routine)
+    db.session.commit()
+
+
+def count_page_queries(app):
+    """Returns {name: (status code, queries run)} for every page in PAGE_BUDGETS."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(USER_ID)
+    counts = {}
+    for name, (url, _) in PAGE_BUDGETS.items():
+        # A fresh app context is a fresh session: nothing cached from the seeding
+        with app.app_context(), capture_sql() as statements:
+            status = client.get(url).status_code
+        counts[name] = (status, len(statements))
+    return counts
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'plan_check.sqlite'))
+        with app.app_context():
+            db.create_all()
+            search.ensure_fts()
+            seed_gym()
+            report = check(HOT_QUERIES)
+            counts = count_page_queries(app)
+            db.session.remove()
+            db.engine.dispose()
+
+    failures = 0
+    for name, results in report.items():
+        for plan, scans in results:
+            status = "❌ FULL SCAN" if scans else "✅"
+            failures += bool(scans)
+            print(f"{status:<12} {name:<24} {' | '.join(plan)}")
+
+    print("-" * 75)
+    over_budget = 0
+    for name, (status_code, count) in counts.items():
+        url, budget = PAGE_BUDGETS[name]
+        ok = status_code == 200 and count <= budget
+        over_budget += not ok
+        print(f"{'✅' if ok else '❌ OVER':<12} {name:<24} {url} -> {status_code}, "
+              f"{count} queries (budget {budget})")
+
+    print("-" * 75)
+    if failures or over_budget:
+        if failures:
+            print(f"💥 {failures} hot query plan(s) scan a whole table.")
+        if over_budget:
+            print(f"💥 {over_budget} page(s) over their query budget.")
+        return 1
+    print(f"🏁 All {len(report)} hot queries use an index; "
+          f"all {len(counts)} pages within their query budget.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# check_webhook.py - End-to-end check of the Telegram webhook mode.
+#
+# Starts a fake Bot API server on localhost, points the bot at it through
+# TELEGRAM_API_URL, registers the webhook and delivers callback updates to
+# /telegram/webhook the way Telegram would. Verifies the secret check, the
+# dispatch to handle_query (and its callback pool), the bot's replies and
+# chat linking through /start <code>. Exits with status 1 on any
+# failed check. Uses a throwaway database; nothing reaches Telegram.
+#
+#   python check_webhook.py
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+SECRET = 'check-webhook-secret'
+CHAT_ID = '4242'
+
+
+class FakeBotAPI(BaseHTTPRequestHandler):
+    """Answers /bot<token>/<method> like the Bot API and records every call."""
+    calls = []
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        method = url.path.rsplit('/', 1)[-1]
+        params = dict(parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            params.update(parse_qsl(body.decode()))
+        FakeBotAPI.calls.append((method, params))
+
+        result = True
+        if method in ('sendMessage', 'editMessageText'):
+            result = {'message_id': 1, 'date': 0, 'text': params.get('text', ''),
+                      'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'}}
+        payload = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_api():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# The bot module reads its configuration at import time
+fake_api = start_fake_api()
+os.environ.update({
+    'TELEGRAM_BOT_TOKEN': '123456:check-webhook',
+    'TELEGRAM_CHAT_ID': CHAT_ID,
+    'TELEGRAM_API_URL': f'http://127.0.0.1:{fake_api.server_port}',
+    'TELEGRAM_MODE': 'webhook',
+    'TELEGRAM_WEBHOOK_URL': 'https://mybrain.example/telegram/webhook',
+    'TELEGRAM_WEBHOOK_SECRET': SECRET,
+})
+
+from flask import Flask
+
+from app import telegram_bot
+from app.extensions import db
+from app.models import User, Task, NotificationSettings
+from app.modules.telegram.routes import telegram_bp
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    db.init_app(app)
+    app.register_blueprint(telegram_bp)
+    return app
+
+
+def callback_update(update_id, chat_id, data):
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': f'cb{update_id}', 'chat_instance': 'x', 'data': data,
+            'from': {'id': int(chat_id), 'is_bot': False, 'first_name': 'Check'},
+            'message': {'message_id': 7, 'date': 0, 'text': 'Task alert',
+                        'chat': {'id': int(chat_id), 'type': 'private'}},
+        },
+    }
+
+
+def message_update(update_id, chat_id, text):
+    return {
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'date': 0, 'text': text,
+                    'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}],
+                    'from': {'id': int(chat_id), 'is_bot': False, 'first_name': 'Check'},
+                    'chat': {'id': int(chat_id), 'type': 'private'}},
+    }
+
+
+def called(method, **params):
+    return any(name == method and all(p.get(k) == str(v) for k, v in params.items())
+               for name, p in FakeBotAPI.calls)
+
+
+def main():
+    results = []
+
+    def check(name, ok):
+        results.append(ok)
+        print(f"{'✅' if ok else '❌'} {name}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'webhook_check.sqlite'))
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id=1, username='check', password='x'))
+            db.session.add(User(id=2, username='other', password='x'))
+            db.session.add(Task(id=1, content='Water plants', user_id=1))
+            db.session.add(Task(id=2, content='Not yours', user_id=2))
+            db.session.commit()
+
+        check("setWebhook registers url + secret", telegram_bot.register_webhook() and called(
+            'setWebhook', url=os.environ['TELEGRAM_WEBHOOK_URL'], secret_token=SECRET))
+
+        client = app.test_client()
+        post = lambda body, secret=SECRET: client.post(
+            '/telegram/webhook', data=body if isinstance(body, str) else json.dumps(body),
+            content_type='application/json',
+            headers={'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {})
+
+        check("missing secret -> 403", post(callback_update(1, CHAT_ID, 'done_1'), None).status_code == 403)
+        check("wrong secret -> 403", post(callback_update(2, CHAT_ID, 'done_1'), 'nope').status_code == 403)
+        check("malformed update -> 400", post('{not json').status_code == 400)
+
+        check("callback delivered -> 200", post(callback_update(3, CHAT_ID, 'done_1')).status_code == 200)
+        check("callback answered before the work", called('answerCallbackQuery', callback_query_id='cb3'))
+        telegram_bot.flush_callbacks()  # Handled on the bot's callback pool
+        with app.app_context():
+            check("handle_query completed the task", db.session.get(Task, 1).complete)
+        check("alert message edited", called('editMessageText', chat_id=CHAT_ID, message_id=7))
+
+        check("foreign task callback -> 200", post(callback_update(4, CHAT_ID, 'done_2')).status_code == 200)
+        telegram_bot.flush_callbacks()
+        with app.app_context():
+            check("foreign task left alone", not db.session.get(Task, 2).complete)
+
+        # Linking a chat: the code from the settings page, sent from that chat
+        with app.app_context():
+            prefs = NotificationSettings(user_id=2)
+            code = telegram_bot.issue_link_code(prefs)
+            db.session.add(prefs)
+            db.session.commit()
+        check("/start with a wrong code -> 200", post(message_update(5, '777', '/start nope')).status_code == 200)
+        check("/start <code> -> 200", post(message_update(6, '777', f'/start {code}')).status_code == 200)
+        check("replayed code -> 200", post(message_update(7, '888', f'/start {code}')).status_code == 200)
+        with app.app_context():
+            check("chat linked once, by the code", db.session.get(NotificationSettings, 2).chat_id == '777')
+
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+    fake_api.shutdown()
+
+    print("-" * 60)
+    if not all(results):
+        print(f"💥 {results.count(False)} webhook check(s) failed.")
+        return 1
+    print(f"🏁 All {len(results)} webhook checks passed.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
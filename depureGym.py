@@ -5,7 +5,7 @@ from sqlalchemy import text
 
 
 def reset_gym_data():
-    app = create_app()
+    app = create_app(background=False)
     with app.app_context():
         print("🧹 Cleaning Gym Data...")
 
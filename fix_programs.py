@@ -1,9 +1,10 @@
 from app import create_app, db
+from app.modules.gym import cycle
 from app.modules.gym.models import GymRoutine, GymProgram
 from app.models import User
 
 def fix_orphaned_routines():
-    app = create_app()
+    app = create_app(background=False)
     with app.app_context():
         # Get your user
         user = User.query.first() 
@@ -28,5 +29,12 @@ def fix_orphaned_routines():
         else:
             print("✅ No hidden routines found.")
 
+        # Programs from before every program got its 7 days on creation
+        added = cycle.fill_missing_days()
+        if added:
+            print(f"🛠️ Added {added} missing Rest Day(s).")
+        else:
+            print("✅ Every program has its 7 days.")
+
 if __name__ == "__main__":
-    fix_orphaned_routines()
\ No newline at end of file
+    fix_orphaned_routines()
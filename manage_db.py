@@ -1,15 +1,33 @@
+import argparse
+import base64
+import gzip
+import hashlib
 import sqlite3
 import json
 import os
 import sys
+import tempfile
+import time
+from datetime import datetime
 from app import create_app, db
 # Import ALL models to ensure SQLAlchemy creates them
 from app.models import User, Task
 from app.modules.gym.models import GymRoutine, GymExercise, GymLog, GymProgram, GymExerciseLibrary
+from app.modules.tasks import search
 
 # Configuration
 DB_FILE = os.path.join('instance', 'db.sqlite')
 BACKUP_FILE = 'full_backup.json'
+BACKUP_DIR = 'backups'
+
+# Online backup: copy this many pages per step, then yield to writers
+SNAPSHOT_PAGES_PER_STEP = 1024
+SNAPSHOT_STEP_SLEEP = 0.005
+EXPORT_FETCH_SIZE = 1000
+
+# Bulk restore: rows per executemany() batch, and how many rejects to print
+RESTORE_BATCH_SIZE = 5000
+RESTORE_SHOW_REJECTED = 10
 
 # Statistics for the final report
 STATS = {
@@ -17,15 +35,22 @@ STATS = {
     "backup_counts": {},
     "tables_created": [],
     "restored_counts": {},
-    "skipped_tables": []
+    "skipped_tables": [],
+    "rejected": []
 }
 
 
 def get_db_tables(cursor):
-    """Returns a list of all table names in the database."""
-    cursor.execute(
-        "SELECT name FROM sqlite_master WHERE type='table' AND name != 'sqlite_sequence';")
-    return [row['name'] for row in cursor.fetchall()]
+    """Returns a list of all table names in the database.
+
+    Virtual tables (the task_fts search index) and their shadow tables are
+    left out: they are derived data, rebuilt from the task table.
+    """
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='table' AND name != 'sqlite_sequence';")
+    rows = [(row[0], row[1] or '') for row in cursor.fetchall()]
+    virtual = [name for name, sql in rows if sql.upper().startswith('CREATE VIRTUAL TABLE')]
+    return [name for name, _ in rows
+            if not any(name == v or name.startswith(v + '_') for v in virtual)]
 
 
 def backup_database():
@@ -61,20 +86,138 @@ def backup_database():
     return backup_data
 
 
+def _timestamp():
+    return datetime.now().strftime('%Y%m%d-%H%M%S')
+
+
+def snapshot_database(dest=None):
+    """Consistent copy of the live DB via SQLite's online backup API.
+
+    Pages are copied in small steps, so writers are only held off for one
+    step at a time; if they change the DB mid-copy SQLite restarts the copy,
+    and the result is always a single point-in-time snapshot.
+    """
+    if not os.path.exists(DB_FILE):
+        print(f"⚠️  No database found at {DB_FILE}.")
+        return None
+
+    dest = dest or os.path.join(BACKUP_DIR, f"db-{_timestamp()}.sqlite")
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+
+    started = time.time()
+    src = sqlite3.connect(DB_FILE)
+    dst = sqlite3.connect(dest)
+    try:
+        src.backup(dst, pages=SNAPSHOT_PAGES_PER_STEP, sleep=SNAPSHOT_STEP_SLEEP)
+    finally:
+        dst.close()
+        src.close()
+
+    size_mb = os.path.getsize(dest) / (1024 * 1024)
+    print(f"📸 Snapshot written: {dest} ({size_mb:.1f} MB in {time.time() - started:.1f}s)")
+    return dest
+
+
+def _json_default(value):
+    if isinstance(value, bytes):
+        return {"$b64": base64.b64encode(value).decode()}
+    return str(value)
+
+
+def _zstandard():
+    """zstd support is optional: the 'zstandard' package isn't in requirements.txt."""
+    try:
+        import zstandard
+    except ImportError:
+        raise SystemExit("❌ zstd needs the 'zstandard' package (pip install zstandard).")
+    return zstandard
+
+
+def _open_compressed(path, compression):
+    if compression == 'zstd':
+        return _zstandard().ZstdCompressor(level=10).stream_writer(open(path, 'wb'))
+    return gzip.open(path, 'wb', compresslevel=6)
+
+
+def export_ndjson(dest_dir=None, compression='gzip'):
+    """Streaming logical export: one compressed NDJSON file per table + manifest.json.
+
+    Reads from a fresh online snapshot (so the export is consistent and the
+    live DB is never held in a long read), one row at a time in constant memory.
+    """
+    if not os.path.exists(DB_FILE):
+        print(f"⚠️  No database found at {DB_FILE}.")
+        return None
+    if compression == 'zstd':
+        _zstandard()  # Fail before writing anything
+
+    dest_dir = dest_dir or os.path.join(BACKUP_DIR, f"export-{_timestamp()}")
+    os.makedirs(dest_dir, exist_ok=True)
+    ext = 'ndjson.zst' if compression == 'zstd' else 'ndjson.gz'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = snapshot_database(os.path.join(tmp, 'snapshot.sqlite'))
+        conn = sqlite3.connect(snapshot)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        manifest = {
+            "format": "mybrain-ndjson-1",
+            "created": datetime.now().isoformat(timespec='seconds'),
+            "compression": compression,
+            "tables": {},
+        }
+        STATS["tables_found"] = get_db_tables(cursor)
+        for table in STATS["tables_found"]:
+            cursor.execute(f'SELECT * FROM "{table}"')
+            columns = [d[0] for d in cursor.description]
+            filename = f"{table}.{ext}"
+            digest = hashlib.sha256()
+            rows = 0
+            with _open_compressed(os.path.join(dest_dir, filename), compression) as out:
+                while True:
+                    batch = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                    if not batch:
+                        break
+                    for row in batch:
+                        line = json.dumps(dict(zip(columns, row)), default=_json_default,
+                                          separators=(',', ':')).encode() + b'\n'
+                        digest.update(line)
+                        out.write(line)
+                        rows += 1
+            manifest["tables"][table] = {
+                "file": filename, "rows": rows, "columns": columns,
+                "sha256": digest.hexdigest(),  # Of the uncompressed NDJSON
+            }
+            STATS["backup_counts"][table] = rows
+            print(f"   - {table}: {rows} rows exported.")
+        conn.close()
+
+    with open(os.path.join(dest_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"✅ NDJSON export completed: {dest_dir}")
+    return dest_dir
+
+
 def recreate_database():
     """Deletes DB file and creates fresh tables from SQLAlchemy models."""
     if os.path.exists(DB_FILE):
         try:
             os.remove(DB_FILE)
+            for suffix in ('-wal', '-shm'):  # A stale WAL must not meet the new file
+                if os.path.exists(DB_FILE + suffix):
+                    os.remove(DB_FILE + suffix)
             print(f"💥 Old database deleted.")
         except PermissionError:
             print("❌ Error: Database is locked! Stop the server first.")
             return False
 
     print("🏗️  Building new database schema...")
-    app = create_app()
+    app = create_app(background=False)
     with app.app_context():
         db.create_all()
+        search.ensure_fts()
+        db.engine.dispose()  # No pooled connections left holding the file during the load
 
         # Verify creation
         with sqlite3.connect(DB_FILE) as conn:
@@ -85,54 +228,195 @@ def recreate_database():
     return True
 
 
-def restore_data():
-    """Restores data and handles schema mismatches."""
-    if not os.path.exists(BACKUP_FILE):
+def _json_object_hook(value):
+    if set(value) == {"$b64"}:
+        return base64.b64decode(value["$b64"])
+    return value
+
+
+def _open_decompressed(path):
+    if path.endswith('.zst'):
+        return _zstandard().ZstdDecompressor().stream_reader(open(path, 'rb'))
+    return gzip.open(path, 'rb')
+
+
+def iter_ndjson(path, expected_sha256=None):
+    """Yields the rows of one export file, checking the manifest checksum at the end."""
+    digest = hashlib.sha256()
+    with _open_decompressed(path) as f:
+        buffer = b''
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            lines = (buffer + chunk).split(b'\n')
+            buffer = lines.pop()
+            for line in lines:
+                digest.update(line + b'\n')
+                yield json.loads(line, object_hook=_json_object_hook)
+    if expected_sha256 and digest.hexdigest() != expected_sha256:
+        print(f"   ⚠️  Checksum mismatch for {os.path.basename(path)} (file changed since export).")
+
+
+def iter_backup(path):
+    """(table, columns, rows iterator) for an NDJSON export dir or a legacy JSON backup."""
+    if os.path.isdir(path):
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        for table, info in manifest["tables"].items():
+            if table not in STATS["tables_found"]:
+                STATS["tables_found"].append(table)
+            STATS["backup_counts"][table] = info["rows"]
+            yield table, info["columns"], iter_ndjson(os.path.join(path, info["file"]),
+                                                      info.get("sha256"))
         return
 
-    print("♻️  Restoring data...")
-    with open(BACKUP_FILE, 'r') as f:
-        data = json.load(f)
+    # Legacy full_backup.json is one JSON document, so it has to be read whole
+    with open(path, 'r') as f:
+        data = json.load(f, object_hook=_json_object_hook)
+    for table, rows in data.items():
+        if table not in STATS["tables_found"]:
+            STATS["tables_found"].append(table)
+        STATS["backup_counts"][table] = len(rows)
+        yield table, list(rows[0].keys()) if rows else [], iter(rows)
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert_batch(cursor, sql, table, columns, batch):
+    """executemany() in a savepoint; on failure retry row by row and record rejects."""
+    values = [[row.get(c) for c in columns] for row in batch]
+    cursor.execute("SAVEPOINT batch")
+    try:
+        cursor.executemany(sql, values)
+        cursor.execute("RELEASE batch")
+        return len(values)
+    except sqlite3.DatabaseError:
+        cursor.execute("ROLLBACK TO batch")
+
+    inserted = 0
+    for row, row_values in zip(batch, values):
+        try:
+            cursor.execute(sql, row_values)
+            inserted += 1
+        except sqlite3.DatabaseError as e:
+            STATS["rejected"].append({"table": table, "error": str(e), "row": row})
+    cursor.execute("RELEASE batch")
+    return inserted
+
+
+def _drop_secondary_indexes(cursor):
+    """Drops the explicit indexes and returns their CREATE statements.
+
+    Building an index once over the loaded table is much cheaper than
+    updating it on every insert. Indexes backing PRIMARY KEY/UNIQUE
+    constraints (sql IS NULL) can't be dropped and stay in place, and
+    unique indexes stay too so duplicate rows are rejected one by one.
+    """
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL "
+                   "AND sql NOT LIKE 'CREATE UNIQUE%'")
+    indexes = cursor.fetchall()
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX "{name}"')
+    return indexes
+
+
+def restore_data(source=None):
+    """Bulk-loads a backup (NDJSON export dir or legacy JSON) into the fresh database."""
+    source = source or BACKUP_FILE
+    if not os.path.exists(source):
+        return
 
-    conn = sqlite3.connect(DB_FILE)
+    print(f"♻️  Restoring data from {source}...")
+    conn = sqlite3.connect(DB_FILE, isolation_level=None)
     cursor = conn.cursor()
 
     # Get schema of the NEW database
     new_db_schema = {}
     for table in STATS["tables_created"]:
-        cursor.execute(f"PRAGMA table_info({table})")
-        columns = [row[1] for row in cursor.fetchall()]
-        new_db_schema[table] = columns
-
-    for table, rows in data.items():
+        cursor.execute(f'PRAGMA table_info("{table}")')
+        new_db_schema[table] = [row[1] for row in cursor.fetchall()]
+
+    # Fast, non-durable settings for the load only: a crash mid-restore just
+    # means running it again against the backup. The database stays in WAL
+    # (leaving it needs exclusive access, which any other open connection
+    # would block); one big transaction in WAL is just as fast to load.
+    synchronous = cursor.execute("PRAGMA synchronous").fetchone()[0]
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA cache_size=-65536")  # 64 MB
+    cursor.execute("PRAGMA temp_store=MEMORY")
+
+    started = time.time()
+    cursor.execute("BEGIN")
+    indexes = _drop_secondary_indexes(cursor)
+    # The search index is rebuilt once at the end instead of row by row
+    for trigger in search.TRIGGERS:
+        cursor.execute(f'DROP TRIGGER IF EXISTS "{trigger}"')
+
+    for table, backup_columns, rows in iter_backup(source):
         if table not in new_db_schema:
             STATS["skipped_tables"].append(table)
             continue
 
-        valid_columns = new_db_schema[table]
-        success_count = 0
-
-        for row in rows:
-            # Only keep columns that exist in the new schema (Handle dropped columns)
-            filtered_row = {k: v for k, v in row.items() if k in valid_columns}
+        # Only keep columns that exist in the new schema (Handle dropped columns);
+        # new columns rely on their SQL default values
+        columns = [c for c in backup_columns if c in new_db_schema[table]]
+        column_sql = ', '.join(f'"{c}"' for c in columns)
+        sql = f'INSERT INTO "{table}" ({column_sql}) VALUES ({", ".join(["?"] * len(columns))})'
+
+        table_started = time.time()
+        count = 0
+        for batch in _batches(rows, RESTORE_BATCH_SIZE):
+            count += _insert_batch(cursor, sql, table, columns, batch)
+        elapsed = max(time.time() - table_started, 1e-6)
+        STATS["restored_counts"][table] = count
+        print(f"   - {table}: {count} rows ({count / elapsed:,.0f} rows/s)")
+
+    index_started = time.time()
+    for name, sql in indexes:
+        try:
+            cursor.execute(sql)
+        except sqlite3.DatabaseError as e:
+            print(f"   ❌ Could not rebuild index {name}: {e}")
+    for statement in search.SCHEMA:
+        cursor.execute(statement)
+    cursor.execute(search.REBUILD)
+    cursor.execute("COMMIT")
+    print(f"   - {len(indexes)} indexes + search index rebuilt in {time.time() - index_started:.1f}s")
+
+    cursor.execute(f"PRAGMA synchronous={synchronous}")
+    conn.close()
 
-            # If new columns were added in code, they will rely on SQL default values here
+    total = sum(STATS["restored_counts"].values())
+    elapsed = max(time.time() - started, 1e-6)
+    print(f"⏱️  Restored {total} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+    report_rejected()
 
-            keys = ', '.join(filtered_row.keys())
-            placeholders = ', '.join(['?'] * len(filtered_row))
-            values = list(filtered_row.values())
 
-            sql = f"INSERT INTO {table} ({keys}) VALUES ({placeholders})"
-            try:
-                cursor.execute(sql, values)
-                success_count += 1
-            except Exception as e:
-                pass  # Fail silently on individual row errors, or print if needed
+def report_rejected():
+    """Prints the first rejected rows and writes all of them to a file."""
+    rejected = STATS["rejected"]
+    if not rejected:
+        return
 
-        STATS["restored_counts"][table] = success_count
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    path = os.path.join(BACKUP_DIR, f"rejected-{_timestamp()}.ndjson")
+    with open(path, 'w') as f:
+        for item in rejected:
+            f.write(json.dumps(item, default=_json_default) + '\n')
 
-    conn.commit()
-    conn.close()
+    print(f"🚫 {len(rejected)} rows rejected (all written to {path}):")
+    for item in rejected[:RESTORE_SHOW_REJECTED]:
+        print(f"   - {item['table']}: {item['error']} -> {json.dumps(item['row'], default=_json_default)[:120]}")
 
 
 def print_summary():
@@ -163,33 +447,91 @@ def print_summary():
 
     print("-" * 75)
     print("NOTE: 'DROPPED' means the table no longer exists in your code.")
-    print("NOTE: 'LOSS' might happen if new constraints (like Unique) rejected old duplicates.")
+    print("NOTE: 'LOSS' might happen if new constraints (like Unique) rejected old duplicates;")
+    print("      the rejected rows are listed above and saved under backups/.")
     print("="*60 + "\n")
 
 
 def main():
-    if backup_database() is None:
+    """Full migration: export, rebuild the schema from the models, bulk-load the export."""
+    export_dir = export_ndjson(os.path.join(BACKUP_DIR, f"migrate-{_timestamp()}"))
+    if export_dir is None:
         if input("Create new DB anyway? (y/n): ").lower() != 'y':
             return
 
     if recreate_database():
-        restore_data()
+        restore_data(export_dir)
         print_summary()
 
 
+def restore(source):
+    """Replaces the database with the contents of a backup."""
+    if not os.path.exists(source):
+        print(f"❌ Backup not found: {source}")
+        return False
+    if os.path.exists(DB_FILE) and input(
+            f"This replaces {DB_FILE} with {source}. Continue? (y/n): ").lower() != 'y':
+        return False
+
+    if recreate_database():
+        restore_data(source)
+        print_summary()
+        return True
+    return False
+
+
+def rebuild_habit_bitmaps():
+    """Recomputes the per-year habit bitmaps from TaskHistory, then the habit rollups."""
+    from app.habits import rebuild_bitmaps, rebuild_stats
+    app = create_app(background=False)
+    with app.app_context():
+        db.create_all()
+        count = rebuild_bitmaps()
+        print(f"🧮 Rebuilt {count} habit bitmap rows (task × year).")
+        count = rebuild_stats()
+        print(f"🔥 Rebuilt streak/rollup stats for {count} habits.")
+
+
+def reset_recurring():
+    """Rewrites stored due dates/flags of daily and weekly tasks to the current period."""
+    from app.scheduler import reset_daily_tasks
+    reset_daily_tasks(create_app(background=False))
+
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1 and sys.argv[1] == "backup":
+    parser = argparse.ArgumentParser(description="myBrain database maintenance")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("backup", help="legacy JSON dump to full_backup.json")
+    snap = commands.add_parser("snapshot", help="online, consistent .sqlite copy")
+    snap.add_argument("dest", nargs="?")
+    export = commands.add_parser("export", help="streaming NDJSON export + manifest")
+    export.add_argument("dest_dir", nargs="?")
+    export.add_argument("--zstd", action="store_true", help="zstd instead of gzip")
+    load = commands.add_parser("restore", help="recreate the DB and bulk-load a backup")
+    load.add_argument("source", nargs="?", default=BACKUP_FILE,
+                      help="NDJSON export dir or legacy JSON file")
+    commands.add_parser("rebuild-habits", help="recompute habit bitmaps and streak stats")
+    commands.add_parser("reset-recurring",
+                        help="store daily/weekly tasks' current occurrence (reads don't need it)")
+    args = parser.parse_args()
+
+    if args.command == "backup":
         print("📦 Backup mode activated — dumping data only...")
         backup_database()
         print("✅ JSON backup completed: full_backup.json")
         sys.exit(0)  # Exit cleanly — no recreate/restore
+    elif args.command == "snapshot":
+        sys.exit(0 if snapshot_database(args.dest) else 1)
+    elif args.command == "export":
+        sys.exit(0 if export_ndjson(args.dest_dir, 'zstd' if args.zstd else 'gzip') else 1)
+    elif args.command == "restore":
+        sys.exit(0 if restore(args.source) else 1)
+    elif args.command == "rebuild-habits":
+        rebuild_habit_bitmaps()
+        sys.exit(0)
+    elif args.command == "reset-recurring":
+        reset_recurring()
+        sys.exit(0)
     else:
         print("🔄 Full migration mode...")
-        backup_data = backup_database()
-        if backup_data is None:
-            if input("Create new DB anyway? (y/n): ").lower() != 'y':
-                sys.exit(0)
-
-        if recreate_database():
-            restore_data()
-            print_summary()
+        main()
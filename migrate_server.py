@@ -2,8 +2,10 @@
 import os
 from app import create_app, db
 from sqlalchemy import text
+from app.modules.gym.cycle import fill_missing_days
+from app.modules.tasks.search import ensure_fts
 
-app = create_app()
+app = create_app(background=False)
 
 
 def run_migration():
@@ -20,7 +22,11 @@ def run_migration():
             ("task", "is_habit", "BOOLEAN"),
             ("task", "recurrence", "VARCHAR(20)"),
             ("task", "color", "VARCHAR(20)"),
-            ("task", "category", "VARCHAR(50)")
+            ("task", "category", "VARCHAR(50)"),
+            ("task", "snooze_until", "DATETIME"),
+            ("notification_settings", "task_reminders", "BOOLEAN"),
+            ("notification_settings", "link_code_hash", "VARCHAR(64)"),
+            ("notification_settings", "link_code_expires", "DATETIME")
         ]
 
         with db.engine.connect() as conn:
@@ -40,6 +46,30 @@ def run_migration():
                     else:
                         print(f"   ⚠️ Ignored error for {table}.{col}: {e}")
 
+        # task_history became unique per (task, day): drop legacy duplicates first
+        with db.engine.connect() as conn:
+            removed = conn.execute(text(
+                "DELETE FROM task_history WHERE id NOT IN ("
+                "SELECT MIN(id) FROM task_history GROUP BY task_id, completed_date)")).rowcount
+            conn.execute(text("DROP INDEX IF EXISTS ix_task_history_task_date"))
+            conn.commit()
+            if removed:
+                print(f"   🧹 Removed {removed} duplicate task_history row(s)")
+
+        # New tables come from create_all; indexes on EXISTING tables don't
+        db.create_all()
+        print("🗂️  Ensuring indexes...")
+        with db.engine.connect() as conn:
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(bind=conn, checkfirst=True)
+                    print(f"   ✅ {index.name}")
+            conn.commit()
+        ensure_fts()
+        added = fill_missing_days()  # The gym pages no longer repair programs on view
+        if added:
+            print(f"   🛠️ Added {added} missing gym Rest Day(s)")
+
         print("🏁 Migration Finished.")
 
 
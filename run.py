@@ -18,14 +18,16 @@ print(f"📩 TELEGRAM_CHAT_ID: {chat_id or 'MISSING!'}")
 
 # NOW import from app (after env vars are loaded)
 from app import create_app, db
-from app.scheduler import start_scheduler
+from app.habits import backfill_bitmaps
+from app.modules.tasks.search import ensure_fts
 
 app = create_app()
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()  # Create tables if needed
-        start_scheduler(app)  # Start scheduler + bot listener
+        backfill_bitmaps()  # One-off: build habit bitmaps for older databases
+        ensure_fts()  # Task search index + triggers
 
     # Debug mode settings
     app.run(
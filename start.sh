@@ -1,3 +1,4 @@
 #!/bin/sh
-python update_db.py
-exec gunicorn --bind 0.0.0.0:5000 --workers 1 --threads 4 wsgi:app
\ No newline at end of file
+python migrate_server.py
+# Workers share the scheduler and bot through leader election (app/leader.py)
+exec gunicorn --bind 0.0.0.0:5000 --workers "${WEB_CONCURRENCY:-2}" --threads "${GUNICORN_THREADS:-8}" wsgi:app
@@ -0,0 +1,216 @@
+# stress_db.py - Concurrent write stress test for the SQLite engine profile.
+#
+# Seeds a throwaway database, then runs the app's three kinds of writers at
+# once for a while: web request threads (task add/toggle/edit + dashboard
+# reads), the Telegram callback handler, and the scheduler's daily reset.
+# Reports "database is locked" errors and write latency percentiles per role.
+# Exits with status 1 if any lock error happened.
+#
+#   python stress_db.py                       # tuned profile, 20 s, 8 web threads
+#   python stress_db.py --profile off         # SQLite defaults, for comparison
+#   python stress_db.py --seconds 60 --web 16
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+
+# Importing the app package pulls in the Telegram bot module, which refuses
+# to load without a token. Nothing is sent from here.
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:stress-test')
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+from app import sqlite_profile, state
+from app.extensions import db
+from app.models import User, Task
+from app.modules.tasks import ops, queries
+from app.scheduler import reset_daily_tasks
+
+USERS = 5
+TASKS_PER_USER = 200
+
+
+def make_app(db_path, profile):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    db.init_app(app)
+    with app.app_context():
+        sqlite_profile.install(db.engine, profile)
+    return app
+
+
+def seed():
+    for n in range(USERS):
+        user = User(username=f'stress{n}', email=f'stress{n}@example.com', password='x')
+        db.session.add(user)
+        db.session.flush()
+        for i in range(TASKS_PER_USER):
+            db.session.add(Task(
+                content=f'Task {i}', user_id=user.id, is_habit=i % 10 == 0,
+                recurrence='daily' if i % 5 == 0 else 'none',
+                due_date=datetime.combine(date.today(), datetime.min.time())))
+    db.session.commit()
+
+
+class Recorder:
+    """Thread-safe latency samples and error counts per role."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.lock_errors = defaultdict(int)
+        self.other_errors = defaultdict(list)
+
+    def run(self, role, operation):
+        started = time.perf_counter()
+        try:
+            operation()
+        except OperationalError as e:
+            db.session.rollback()
+            with self.lock:
+                if 'locked' in str(e.orig):
+                    self.lock_errors[role] += 1
+                else:
+                    self.other_errors[role].append(str(e.orig))
+            return
+        except Exception as e:
+            db.session.rollback()
+            with self.lock:
+                self.other_errors[role].append(repr(e))
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.latencies[role].append(elapsed)
+
+
+# --- WRITERS (each mirrors what the real code path does per request/event) ---
+
+
+def web_write(user_id):
+    task_ids = [t for (t,) in db.session.query(Task.id).filter_by(user_id=user_id).limit(50)]
+    action = random.random()
+    if action < 0.3:
+        ops.create_task(user_id, {'content': 'stress', 'recurrence': 'none'})
+    elif action < 0.8:
+        ops.toggle_task(ops.get_owned_task(random.choice(task_ids), user_id))
+    else:
+        ops.edit_task(ops.get_owned_task(random.choice(task_ids), user_id),
+                      {'priority': random.choice(['low', 'normal', 'high'])})
+    db.session.commit()
+
+
+def web_read(user_id):
+    queries.visible_tasks(user_id)
+    state.get_version(user_id)
+
+
+def bot_callback(user_id):
+    """Same steps as telegram_bot.handle_query for a 'done' button."""
+    db.session.remove()
+    task_id = db.session.query(Task.id).filter_by(user_id=user_id, is_habit=True).order_by(
+        db.func.random()).limit(1).scalar()
+    task = db.session.get(Task, task_id)
+    task.complete = True
+    task.last_completed = datetime.now()
+    if task.is_habit:
+        ops.add_history(task, date.today())
+    state.touch(task.user_id, 'tasks', {'id': task.id})
+    db.session.commit()
+
+
+def worker(app, recorder, role, stop, pause):
+    while not stop.is_set():
+        user_id = random.randint(1, USERS)
+        with app.app_context():
+            if role == 'web write':
+                recorder.run(role, lambda: web_write(user_id))
+            elif role == 'web read':
+                recorder.run(role, lambda: web_read(user_id))
+            elif role == 'bot':
+                recorder.run(role, lambda: bot_callback(user_id))
+            elif role == 'scheduler':
+                recorder.run(role, lambda: reset_daily_tasks(app))
+        time.sleep(pause)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite concurrency stress test")
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--web', type=int, default=8, help="web threads (gunicorn --threads)")
+    parser.add_argument('--profile', default=None, choices=sorted(sqlite_profile.PROFILES),
+                        help="engine profile (default: SQLITE_PROFILE or 'tuned')")
+    args = parser.parse_args()
+
+    # role -> (threads, pause between operations in seconds)
+    roles = {
+        'web write': (args.web, 0.005),
+        'web read': (max(1, args.web // 2), 0.005),
+        'bot': (1, 0.05),
+        'scheduler': (1, 0.5),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'stress.sqlite'), args.profile)
+        with app.app_context():
+            db.create_all()
+            seed()
+            pragmas = {name: db.session.execute(db.text(f"PRAGMA {name}")).scalar()
+                       for name in sqlite_profile.ENV_OVERRIDES}
+        print(f"🔧 Pragmas: {pragmas}")
+        print(f"🏋️  Running {sum(n for n, _ in roles.values())} threads for {args.seconds:.0f}s...")
+
+        recorder = Recorder()
+        stop = threading.Event()
+        threads = [threading.Thread(target=worker, args=(app, recorder, role, stop, pause))
+                   for role, (count, pause) in roles.items() for _ in range(count)]
+
+        # The scheduler job prints on every run; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            for t in threads:
+                t.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for t in threads:
+                t.join()
+
+        with app.app_context():
+            db.engine.dispose()
+
+    print(f"{'ROLE':<12} | {'OPS':>7} | {'LOCKED':>6} | {'OTHER':>5} | "
+          f"{'p50 ms':>8} | {'p99 ms':>8} | {'max ms':>8}")
+    print("-" * 75)
+    for role in roles:
+        samples = recorder.latencies[role]
+        p50, p99, worst = ((percentile(samples, 50), percentile(samples, 99), max(samples))
+                           if samples else (0, 0, 0))
+        print(f"{role:<12} | {len(samples):>7} | {recorder.lock_errors[role]:>6} | "
+              f"{len(recorder.other_errors[role]):>5} | {p50:>8.1f} | {p99:>8.1f} | {worst:>8.1f}")
+    print("-" * 75)
+
+    for role, errors in recorder.other_errors.items():
+        for error in sorted(set(errors))[:3]:
+            print(f"⚠️  {role}: {error}")
+
+    lock_errors = sum(recorder.lock_errors.values())
+    if lock_errors:
+        print(f"💥 {lock_errors} 'database is locked' errors.")
+        return 1
+    print("🏁 No lock errors.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,13 @@
 from app import create_app, db
-from app.scheduler import start_scheduler
+from app.habits import backfill_bitmaps
+from app.modules.tasks.search import ensure_fts
 
 app = create_app()
 
 with app.app_context():
     db.create_all()
-    start_scheduler(app)
+    backfill_bitmaps()
+    ensure_fts()
 
 if __name__ == "__main__":
     app.run()